@@ -1,27 +1,56 @@
 # ==============================================================================
 # 1. IMPORTAÇÃO DAS BIBLIOTECAS (COM ADIÇÕES)
 # ==============================================================================
+import time
+_INICIO_STARTUP = time.perf_counter()  # Para o relatório de tempo de inicialização
+
 import dash
 from dash import dcc, html, Input, Output, State, ALL, clientside_callback, ctx, callback, no_update
-import plotly.express as px
 import pandas as pd
 import numpy as np
 import dash_bootstrap_components as dbc
 import urllib.parse
+import io
 import math
 import os
+import sys
+import tempfile
+import threading
+import functools
+import importlib.util
+import json
+import re
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 import plotly.graph_objects as go
 import flask  # Para obter o IP do usuário
-import requests  # Para geolocalização
 from dotenv import load_dotenv  # <-- ADICIONE ESTA LINHA
 load_dotenv()                   # <-- ADICIONE ESTA LINHA
+# plotly.express, requests (geolocalização) e psycopg2 (banco de dados) são importados
+# dentro das funções que os usam, para não pesar na inicialização dos workers.
 
 # --- MÓDULOS DE AUTENTICAÇÃO E BANCO DE DADOS ---
-import psycopg2 # pyright: ignore[reportMissingModuleSource]
-import psycopg2.extras # pyright: ignore[reportMissingModuleSource]
 from werkzeug.security import generate_password_hash, check_password_hash
 
+# --- RELATÓRIO DE TEMPO DE INICIALIZAÇÃO ---
+TEMPOS_STARTUP = {}
+_ultima_marca_startup = _INICIO_STARTUP
+
+def registrar_tempo_startup(etapa):
+    """Registra quanto tempo a etapa de inicialização `etapa` levou desde a marca anterior."""
+    global _ultima_marca_startup
+    agora = time.perf_counter()
+    TEMPOS_STARTUP[etapa] = agora - _ultima_marca_startup
+    _ultima_marca_startup = agora
+
+def imprimir_relatorio_startup():
+    total = sum(TEMPOS_STARTUP.values())
+    etapas = ", ".join(f"{etapa} {segundos:.2f}s" for etapa, segundos in TEMPOS_STARTUP.items())
+    print(f"Inicialização concluída em {total:.2f}s ({etapas}).")
+
+registrar_tempo_startup('imports')
+
 # ==============================================================================
 # CONFIGURAÇÕES DE AUTENTICAÇÃO
 # ==============================================================================
@@ -31,71 +60,185 @@ ADMIN_USERS = ['tgr', 'lfdl']
 NORMAL_USERS = ['hmc', 'hes', 'jbg', 'anln', 'tcj', 'cmf', 'mss']
 ALL_PREDEFINED_USERS = ADMIN_USERS + NORMAL_USERS
 
+# ==============================================================================
+# INSTRUMENTAÇÃO (LATÊNCIA, PAYLOAD, LINHAS PROCESSADAS E MEMÓRIA)
+# ==============================================================================
+# Métricas em memória, por processo, expostas em formato Prometheus na rota /metrics.
+# Com vários workers do gunicorn cada processo responde pelas próprias séries (label "pid").
+# SEA_DASH_LIMITE_LENTO_MS > 0 registra no log os callbacks acima do limite, com os filtros usados.
+# A rota exige usuário logado ou, para o Prometheus, o token de SEA_DASH_METRICS_TOKEN (Bearer).
+LIMITE_CALLBACK_LENTO_MS = float(os.environ.get('SEA_DASH_LIMITE_LENTO_MS', 0))
+METRICS_TOKEN = os.environ.get('SEA_DASH_METRICS_TOKEN')
+
+class Histograma:
+    """Histograma cumulativo no formato de exposição do Prometheus, separado por labels."""
+    def __init__(self, nome, descricao, buckets):
+        self.nome = nome
+        self.descricao = descricao
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, **labels):
+        chave = tuple(sorted(labels.items()))
+        with self._lock:
+            contagens, soma, total = self._series.get(chave, ([0] * len(self.buckets), 0.0, 0))
+            contagens = [c + 1 if valor <= limite else c for c, limite in zip(contagens, self.buckets)]
+            self._series[chave] = (contagens, soma + valor, total + 1)
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.descricao}', f'# TYPE {self.nome} histogram']
+        with self._lock:
+            series = sorted(self._series.items())
+        for chave, (contagens, soma, total) in series:
+            labels = ','.join([f'{k}="{formatar_label(v)}"' for k, v in chave] + [f'pid="{os.getpid()}"'])
+            for limite, contagem in zip(self.buckets, contagens):
+                linhas.append(f'{self.nome}_bucket{{{labels},le="{limite:g}"}} {contagem}')
+            linhas.append(f'{self.nome}_bucket{{{labels},le="+Inf"}} {total}')
+            linhas.append(f'{self.nome}_sum{{{labels}}} {soma}')
+            linhas.append(f'{self.nome}_count{{{labels}}} {total}')
+        return linhas
+
+def formatar_label(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+HIST_CALLBACK_DURACAO = Histograma('sea_dash_callback_duracao_segundos', 'Tempo de cálculo dos callbacks do Dash.',
+                                   (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+HIST_CALLBACK_PAYLOAD = Histograma('sea_dash_callback_payload_bytes', 'Tamanho da resposta do callback, antes da compressão.',
+                                   (1e3, 1e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7))
+HIST_CALLBACK_LINHAS = Histograma('sea_dash_callback_linhas_processadas', 'Linhas de dados processadas pelo callback.',
+                                  (1e2, 1e3, 1e4, 1e5, 1e6, 1e7))
+HIST_DB_DURACAO = Histograma('sea_dash_db_duracao_segundos', 'Duração das funções de acesso ao banco de dados.',
+                             (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+
+def memoria_processo():
+    """RSS atual do processo em bytes (None se não for possível medir)."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError):
+            return None
+
+def instrumentar_db(func):
+    """Decorator que mede a duração de uma função de banco de dados."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        inicio = time.perf_counter()
+        status = 'erro'
+        try:
+            resultado = func(*args, **kwargs)
+            status = 'ok'
+            return resultado
+        finally:
+            HIST_DB_DURACAO.observar(time.perf_counter() - inicio, funcao=func.__name__, status=status)
+    return wrapper
+
+def registrar_linhas_processadas(quantidade):
+    """Acumula, na requisição atual, quantas linhas de dados o callback processou."""
+    if flask.has_request_context():
+        flask.g.linhas_processadas = flask.g.get('linhas_processadas', 0) + int(quantidade)
+
+
 # ==============================================================================
 # FUNÇÕES DO BANCO DE DADOS (VERSÃO POSTGRESQL)
 # ==============================================================================
-def get_db_connection():
-    """Cria e retorna uma conexão com o banco de dados PostgreSQL."""
+# Cada worker do gunicorn (threads, ver gunicorn.conf.py) mantém um pool de conexões que as
+# requisições pegam e devolvem, em vez de abrir e fechar uma conexão por chamada. O pool é criado
+# na primeira consulta de cada processo; conexões abertas antes do fork são fechadas por
+# `fechar_conexoes`. SEA_DASH_DB_POOL_MAX deve ser ao menos o número de threads por worker.
+DB_POOL_MIN = int(os.environ.get('SEA_DASH_DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.environ.get('SEA_DASH_DB_POOL_MAX', 10))
+_pool_db = None
+_lock_pool_db = threading.Lock()
+
+def obter_pool_db():
+    """Pool de conexões PostgreSQL do processo, criado na primeira chamada."""
+    global _pool_db
     if not DATABASE_URL:
         raise ValueError("A variável de ambiente DATABASE_URL não foi configurada.")
-    conn = psycopg2.connect(DATABASE_URL)
-    return conn
+    with _lock_pool_db:
+        if _pool_db is None:
+            from psycopg2.pool import ThreadedConnectionPool # pyright: ignore[reportMissingModuleSource]
+            _pool_db = ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, DATABASE_URL)
+        return _pool_db
+
+def fechar_pool_db():
+    global _pool_db
+    with _lock_pool_db:
+        if _pool_db is not None:
+            _pool_db.closeall()
+            _pool_db = None
+
+@contextmanager
+def conexao_db():
+    """Empresta uma conexão do pool; transações não confirmadas são desfeitas na devolução."""
+    pool = obter_pool_db()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        # Conexão caída (servidor reiniciado, rede) é descartada em vez de voltar ao pool
+        pool.putconn(conn, close=bool(conn.closed))
 
+@instrumentar_db
 def initialize_database():
     """Cria as tabelas se não existirem no PostgreSQL."""
     print("Verificando e inicializando banco de dados PostgreSQL...")
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id SERIAL PRIMARY KEY,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT,
-            role TEXT NOT NULL
-        )
-    ''')
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS access_logs (
-            id SERIAL PRIMARY KEY,
-            timestamp TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
-            username TEXT NOT NULL,
-            ip_address TEXT,
-            location TEXT
-        )
-    ''')
-    # Insere usuários se eles ainda não existirem, usando a sintaxe do PostgreSQL
-    for user in ADMIN_USERS + NORMAL_USERS:
-        role = 'admin' if user in ADMIN_USERS else 'user'
-        cur.execute("INSERT INTO users (username, role) VALUES (%s, %s) ON CONFLICT (username) DO NOTHING", (user, role))
-
-    conn.commit()
-    cur.close()
-    conn.close()
+    with conexao_db() as conn, conn.cursor() as cur:
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id SERIAL PRIMARY KEY,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT,
+                role TEXT NOT NULL
+            )
+        ''')
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS access_logs (
+                id SERIAL PRIMARY KEY,
+                timestamp TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+                username TEXT NOT NULL,
+                ip_address TEXT,
+                location TEXT
+            )
+        ''')
+        # Insere usuários se eles ainda não existirem, usando a sintaxe do PostgreSQL (um único INSERT)
+        import psycopg2.extras # pyright: ignore[reportMissingModuleSource]
+        usuarios = [(user, 'admin' if user in ADMIN_USERS else 'user') for user in ADMIN_USERS + NORMAL_USERS]
+        psycopg2.extras.execute_values(cur, "INSERT INTO users (username, role) VALUES %s ON CONFLICT (username) DO NOTHING", usuarios)
+        conn.commit()
     print("Banco de dados PostgreSQL inicializado/verificado com sucesso.")
 
+# `python app.py init-db` só cria o esquema: sai aqui, antes de carregar dados e montar o app
+if __name__ == '__main__' and sys.argv[1:] == ['init-db']:
+    initialize_database()
+    sys.exit(0)
+
+@instrumentar_db
 def get_user(username):
     """Busca um usuário no banco de dados PostgreSQL."""
-    conn = get_db_connection()
+    import psycopg2.extras # pyright: ignore[reportMissingModuleSource]
     # Usar DictCursor para retornar resultados como dicionários (ex: user['password_hash'])
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute('SELECT * FROM users WHERE username = %s', (username,))
-    user = cur.fetchone()
-    cur.close()
-    conn.close()
-    return user
+    with conexao_db() as conn, conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+        cur.execute('SELECT * FROM users WHERE username = %s', (username,))
+        return cur.fetchone()
 
+@instrumentar_db
 def update_user_password(username, password):
     """Atualiza a senha de um usuário no PostgreSQL."""
     password_hash = generate_password_hash(password)
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('UPDATE users SET password_hash = %s WHERE username = %s', (password_hash, username))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with conexao_db() as conn, conn.cursor() as cur:
+        cur.execute('UPDATE users SET password_hash = %s WHERE username = %s', (password_hash, username))
+        conn.commit()
 
+@instrumentar_db
 def log_access(username):
     """Registra um evento de login no PostgreSQL."""
+    import requests  # Para geolocalização
     try:
         ip_address = flask.request.headers.get('X-Forwarded-For', flask.request.remote_addr)
         response = requests.get(f'http://ip-api.com/json/{ip_address}?fields=city,regionName,country', timeout=2)
@@ -111,17 +254,14 @@ def log_access(username):
         ip_address = "localhost"
         location = "Local"
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('INSERT INTO access_logs (username, ip_address, location) VALUES (%s, %s, %s)',
-                 (username, ip_address, location))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with conexao_db() as conn, conn.cursor() as cur:
+        cur.execute('INSERT INTO access_logs (username, ip_address, location) VALUES (%s, %s, %s)',
+                     (username, ip_address, location))
+        conn.commit()
 
+@instrumentar_db
 def get_all_logs():
     """Busca todos os registros de logs de acesso do PostgreSQL."""
-    conn = get_db_connection()
     query = """
     SELECT
         timestamp AS "HORA DO ACESSO",
@@ -131,17 +271,73 @@ def get_all_logs():
     FROM access_logs
     ORDER BY timestamp DESC
     """
-    df_logs = pd.read_sql_query(query, conn)
-    conn.close()
-    return df_logs
+    with conexao_db() as conn:
+        return pd.read_sql_query(query, conn)
 
 # ==============================================================================
 # 2. FUNÇÃO PARA GERAR O DATAFRAME COMPARATIVO (SEU CÓDIGO ORIGINAL)
 # ==============================================================================
-def gerar_df_comparativo_robusto(df_base):
+# Preços e variação ficam numéricos no comparativo (para ordenar e exportar como números);
+# o texto "R$ 1.234,56" / "12.34%" é aplicado só na exibição, por estes formatadores.
+def formatar_moeda(valor):
+    return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+def formatar_percentual(valor):
+    return f"{valor:.2%}"
+
+FORMATOS_COMPARATIVO = {'PREÇO ANTERIOR': formatar_moeda, 'PREÇO ATUAL': formatar_moeda, 'VARIAÇÃO %': formatar_percentual}
+
+# --- PARES DE PLANOS DO COMPARATIVO ---
+# Por padrão cada localidade compara o plano mais recente com o anterior; na página (e na API) o
+# plano atual pode ser qualquer plano e a referência um plano qualquer, o anterior ao atual ou a
+# linha de base: a média dos menores preços nos PLANOS_LINHA_DE_BASE planos anteriores ao atual.
+PLANO_MAIS_RECENTE = 'recente'
+REFERENCIA_ANTERIOR = 'anterior'
+REFERENCIA_MEDIA = 'media'
+PLANOS_LINHA_DE_BASE = int(os.environ.get('SEA_DASH_PLANOS_LINHA_DE_BASE', 5))
+# Só o par padrão fica no snapshot enquanto ele vive; dos demais pares (20-150 ms cada) ficam os
+# SEA_DASH_VISOES_COMPARATIVO usados mais recentemente, com as opções e ordens calculadas sobre eles
+VISOES_COMPARATIVO_EM_CACHE = max(1, int(os.environ.get('SEA_DASH_VISOES_COMPARATIVO', 8)))
+PADRAO_VISAO_COMPARATIVO = re.compile(r'comparativo:[^:]+:[^:]+')
+
+def pares_de_planos(planos_por_localidade, plano_atual=PLANO_MAIS_RECENTE, referencia=REFERENCIA_ANTERIOR):
+    """
+    {localidade: (plano atual, [planos de referência])} a partir dos planos de cada localidade em ordem
+    decrescente. Localidades sem o plano atual pedido ou sem referência ficam de fora.
+    """
+    pares = {}
+    for localidade, planos in planos_por_localidade.items():
+        if plano_atual == PLANO_MAIS_RECENTE:
+            posicao = 0
+        elif plano_atual in planos:
+            posicao = planos.index(plano_atual)
+        else:
+            continue
+        if referencia == REFERENCIA_ANTERIOR:
+            planos_referencia = planos[posicao + 1:posicao + 2]
+        elif referencia == REFERENCIA_MEDIA:
+            planos_referencia = planos[posicao + 1:posicao + 1 + PLANOS_LINHA_DE_BASE]
+        else:
+            planos_referencia = [referencia] if referencia in planos and referencia != planos[posicao] else []
+        if planos and planos_referencia:
+            pares[localidade] = (planos[posicao], planos_referencia)
+    return pares
+
+def linha_de_base(df_referencia, chaves, planos):
+    """Média do menor preço de cada chave nos `planos` e a locadora que foi a mais barata mais vezes."""
+    precos = df_referencia.groupby(chaves, observed=True)['MENOR_PRECO'].mean()
+    vitorias = df_referencia.groupby(chaves + ['VENCEDORA'], observed=True).size().rename('VITORIAS').reset_index()
+    vencedoras = (vitorias.sort_values('VITORIAS', ascending=False, kind='stable')
+                  .drop_duplicates(chaves).set_index(chaves)['VENCEDORA'])
+    linha = precos.to_frame().join(vencedoras).reset_index()
+    linha['PLANO'] = f"Média de {len(planos)} planos ({min(planos)} a {max(planos)})"
+    return linha
+
+def gerar_df_comparativo_robusto(df_base, pares=None):
     """
     Compara o carro mais barato por localidade/retirada/categoria entre os dois
-    planos mais recentes de CADA localidade, retornando um DataFrame consolidado.
+    planos mais recentes de CADA localidade (ou os `pares` de `pares_de_planos`),
+    retornando um DataFrame consolidado.
     """
     print("\nIniciando a geração dos dados para a aba 'Comparativo' (versão corrigida)...")
     df = df_base.copy()
@@ -155,33 +351,40 @@ def gerar_df_comparativo_robusto(df_base):
     df = df[~df['categoria'].isin(categorias_invalidas)]
     print(f"Dados limpos. {len(df)} linhas válidas para análise.")
 
+    colunas = GRAO_MENORES_OFERTAS + ['LOCADORA', 'PREÇO']
+    df_ofertas = df[[col.lower() for col in colunas]].set_axis(colunas, axis=1)
+    return comparar_menores_ofertas(agregar_menores_ofertas(df_ofertas), pares)
+
+def comparar_menores_ofertas(ofertas, pares=None):
+    """
+    O comparativo a partir da tabela de menores ofertas (ver GRAO_MENORES_OFERTAS): o mais
+    barato de cada localidade/retirada/duração/categoria no plano atual vs. na referência de
+    `pares` (ver `pares_de_planos`); sem `pares`, os dois planos mais recentes de cada localidade.
+    """
+    ofertas = ofertas.dropna(subset=GRAO_MENORES_OFERTAS)
+    ofertas = ofertas[~ofertas['CATEGORIA'].isin(CATEGORIAS_INVALIDAS)]
+
     # --- 2.2. Encontrar os 2 planos mais recentes para CADA localidade ---
-    planos_por_localidade = df.groupby('localidade')['plano'].unique().apply(lambda x: sorted(x, reverse=True)[:2])
-    planos_validos = planos_por_localidade[planos_por_localidade.apply(len) == 2]
+    if pares is None:
+        planos_por_localidade = ofertas.groupby('LOCALIDADE', observed=True)['PLANO'].unique().apply(lambda x: sorted(x, reverse=True))
+        pares = pares_de_planos(planos_por_localidade)
 
-    if planos_validos.empty:
+    if not pares:
         print("Nenhuma localidade encontrada com pelo menos 2 planos para comparação.")
         return pd.DataFrame()
 
-    # --- 2.3. Processar cada localidade individualmente ---
+    # --- 2.3. Cruzar, em cada localidade, o mais barato do plano atual com o da referência ---
     lista_dfs_comparados = []
+    merge_cols = ['LOCALIDADE', 'RETIRADA', 'DURAÇÃO', 'CATEGORIA']
+    colunas = merge_cols + ['MENOR_PRECO', 'VENCEDORA', 'PLANO']
 
-    for localidade, planos in planos_validos.items():
-        plano_recente = planos[0]
-        plano_anterior = planos[1]
-
-        df_local = df[(df['localidade'] == localidade) & (df['plano'].isin(planos))]
-
-        try:
-            idx_min = df_local.groupby(['plano', 'retirada', 'duração', 'categoria'])['preço'].idxmin()
-            df_mais_baratos = df_local.loc[idx_min]
-        except ValueError:
-            continue
+    for localidade, (plano_atual, planos_referencia) in pares.items():
 
-        df_recente = df_mais_baratos[df_mais_baratos['plano'] == plano_recente]
-        df_anterior = df_mais_baratos[df_mais_baratos['plano'] == plano_anterior]
-
-        merge_cols = ['localidade', 'retirada', 'duração', 'categoria']
+        df_local = ofertas[ofertas['LOCALIDADE'] == localidade]
+        df_recente = df_local.loc[df_local['PLANO'] == plano_atual, colunas]
+        df_anterior = df_local.loc[df_local['PLANO'].isin(planos_referencia), colunas]
+        if len(planos_referencia) > 1:
+            df_anterior = linha_de_base(df_anterior, merge_cols, planos_referencia)[colunas]
 
         df_merged = pd.merge(df_recente, df_anterior, on=merge_cols, suffixes=('_atual', '_anterior'))
 
@@ -196,24 +399,20 @@ def gerar_df_comparativo_robusto(df_base):
     df_final = pd.concat(lista_dfs_comparados, ignore_index=True)
 
     # --- 2.5. Calcular a variação e formatar ---
-    df_final['variacao_preco'] = (df_final['preço_atual'] / df_final['preço_anterior']) - 1
+    df_final['variacao_preco'] = (df_final['MENOR_PRECO_atual'] / df_final['MENOR_PRECO_anterior']) - 1
 
     novos_nomes = {
-        'localidade': 'LOCALIDADE', 'retirada': 'RETIRADA', 'duração': 'DURAÇÃO', 'categoria': 'CATEGORIA',
-        'preço_anterior': 'PREÇO ANTERIOR', 'preço_atual': 'PREÇO ATUAL',
-        'locadora_anterior': 'LOCADORA MAIS BARATA (ANTERIOR)',
-        'locadora_atual': 'LOCADORA MAIS BARATA (ATUAL)',
-        'plano_anterior': 'PLANO ANTERIOR',
-        'plano_atual': 'PLANO ATUAL',
+        'MENOR_PRECO_anterior': 'PREÇO ANTERIOR', 'MENOR_PRECO_atual': 'PREÇO ATUAL',
+        'VENCEDORA_anterior': 'LOCADORA MAIS BARATA (ANTERIOR)',
+        'VENCEDORA_atual': 'LOCADORA MAIS BARATA (ATUAL)',
+        'PLANO_anterior': 'PLANO ANTERIOR',
+        'PLANO_atual': 'PLANO ATUAL',
         'variacao_preco': 'VARIAÇÃO %'
     }
     df_relatorio_final = df_final.rename(columns=novos_nomes)
 
-    # --- 2.6. Formatação final ---
+    # --- 2.6. Formatação final (preços e variação seguem numéricos; ver FORMATOS_COMPARATIVO) ---
     df_relatorio_final['RETIRADA'] = pd.to_datetime(df_relatorio_final['RETIRADA']).dt.strftime('%Y-%m-%d')
-    for col in ['PREÇO ANTERIOR', 'PREÇO ATUAL']:
-        df_relatorio_final[col] = df_relatorio_final[col].apply(lambda x: f"R$ {x:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
-    df_relatorio_final['VARIAÇÃO %'] = df_relatorio_final['VARIAÇÃO %'].apply(lambda x: f"{x:.2%}")
 
     colunas_finais = ['LOCALIDADE', 'RETIRADA', 'DURAÇÃO', 'CATEGORIA', 'PREÇO ANTERIOR', 'PREÇO ATUAL', 'VARIAÇÃO %',
                       'LOCADORA MAIS BARATA (ANTERIOR)', 'LOCADORA MAIS BARATA (ATUAL)', 'PLANO ANTERIOR', 'PLANO ATUAL']
@@ -224,82 +423,1396 @@ def gerar_df_comparativo_robusto(df_base):
     return df_relatorio_final
 
 # ==============================================================================
-# 3. CARREGAMENTO E LIMPEZA DOS DADOS (SEU CÓDIGO ORIGINAL)
+# 3. CARREGAMENTO E LIMPEZA DOS DADOS (SEU CÓDIGO ORIGINAL, AGORA SOB DEMANDA)
 # ==============================================================================
-last_update_string = "N/A"
-df_comparativo = pd.DataFrame()
-plano_recente = "N/A"
-
-try:
-    script_dir = os.path.dirname(__file__)
-    caminho_arquivo = os.path.join(script_dir, 'dados_consolidados.parquet')
-    df_original = pd.read_parquet(caminho_arquivo)
-
-    mod_time_timestamp = os.path.getmtime(caminho_arquivo)
-    mod_time_datetime = datetime.fromtimestamp(mod_time_timestamp)
-    last_update_string = mod_time_datetime.strftime('%d/%m/%Y %H:%M:%S')
-
-    print("Arquivo Parquet carregado com sucesso!")
-    print(f"Total de {len(df_original)} linhas carregadas.")
-    print(f"Última modificação do arquivo: {last_update_string}")
-
-    df_para_comparativo = df_original.copy()
-    df_para_comparativo.columns = [str(col).lower() for col in df_para_comparativo.columns]
-    df_comparativo = gerar_df_comparativo_robusto(df_para_comparativo)
-
-    df = df_original.copy()
+# Os dados derivados não são mais montados na importação do módulo: cada versão do
+# arquivo Parquet vira um snapshot (DadosCarregados) cujos DataFrames são construídos
+# na primeira vez em que alguma página os usa. Com SEA_DASH_PRECARREGAR_DADOS=1 (padrão)
+# tudo é montado já na importação — combinado com `gunicorn --preload`, isso acontece
+# uma única vez no processo mestre e os workers herdam os dados prontos.
+script_dir = os.path.dirname(os.path.abspath(__file__))
+# SEA_DASH_DADOS permite apontar para outro arquivo (ex.: dados sintéticos dos benchmarks)
+caminho_arquivo = os.environ.get('SEA_DASH_DADOS') or os.path.join(script_dir, 'dados_consolidados.parquet')
+# `flask --app app init-db` importa o módulo inteiro, mas só precisa do esquema do banco:
+# nesse caso não há pré-carga de dados nem aquecimento
+SOMENTE_INIT_DB = 'init-db' in sys.argv[1:]
+PRECARREGAR_DADOS = not SOMENTE_INIT_DB and os.environ.get('SEA_DASH_PRECARREGAR_DADOS', '1') == '1'
+# SEA_DASH_AQUECIMENTO: '1' (padrão) monta as visões padrão das páginas na importação, '0' não as
+# guarda, 'segundo_plano' as monta em uma thread (ver "VISÕES PADRÃO E AQUECIMENTO")
+AQUECIMENTO = '0' if SOMENTE_INIT_DB else os.environ.get('SEA_DASH_AQUECIMENTO', '1')
+INTERVALO_VERIFICACAO_ARQUIVO = float(os.environ.get('SEA_DASH_INTERVALO_RECARGA', 5))
+
+# --- DATASET PARTICIONADO E LEITURA COM PUSHDOWN ---
+# `caminho_arquivo` pode ser o parquet único ou um diretório particionado no estilo hive
+# (ex.: LOCALIDADE=GIG10/PLANO=2025.10.16.10-09-03/part-0.parquet). A leitura passa pelo
+# pyarrow.dataset: filtros em PLANO/LOCALIDADE descartam partições inteiras pelo caminho e,
+# dentro de cada arquivo, os row groups cujas estatísticas de min/max não batem.
+# SEA_DASH_DIAS_HISTORICO limita Base/Dashboard/Movimentação aos planos dos últimos N dias
+# (contados a partir do plano mais recente); o comparativo lê só os dois planos de que precisa.
+DIAS_HISTORICO = int(os.environ['SEA_DASH_DIAS_HISTORICO']) if os.environ.get('SEA_DASH_DIAS_HISTORICO') else None
+CATEGORIAS_INVALIDAS = ['-', 'L+']
+
+def abrir_dataset(caminho):
+    import pyarrow.dataset as ds
+    particionamento = ds.HivePartitioning.discover(infer_dictionary=True) if os.path.isdir(caminho) else None
+    return ds.dataset(caminho, format='parquet', partitioning=particionamento)
+
+def coluna_do_dataset(dataset, nome):
+    """Nome real da coluna `nome` no dataset, sem diferenciar maiúsculas (a primeira vence, como na limpeza)."""
+    for campo in dataset.schema.names:
+        if campo.upper() == nome:
+            return campo
+    raise KeyError(f"Coluna '{nome}' não encontrada em '{dataset.files[0] if dataset.files else ''}'.")
+
+def ordem_colunas(dataset):
+    """Nomes das colunas do dataset na ordem original do arquivo."""
+    nomes = dataset.schema.names
+    # Colunas de partição vêm no fim; o metadado do pandas guarda a ordem com que o arquivo foi gravado
+    ordem = [c['name'] for c in (dataset.schema.pandas_metadata or {}).get('columns', []) if c['name'] in nomes]
+    return ordem if len(ordem) == len(nomes) else nomes
+
+def ler_dataset(dataset, filtro=None):
+    """Lê o dataset para pandas aplicando `filtro` (pushdown) e mantendo a ordem original das colunas."""
+    return dataset.to_table(filter=filtro).to_pandas()[ordem_colunas(dataset)]
+
+def catalogo_planos(dataset):
+    """
+    Pares (LOCALIDADE, PLANO) que têm ao menos uma linha válida para o comparativo. Só as
+    colunas do filtro são lidas; com PLANO/LOCALIDADE particionados nem elas saem do disco.
+    """
+    import pyarrow.dataset as ds
+    localidade, plano, categoria, locadora, preco = (
+        coluna_do_dataset(dataset, nome) for nome in ('LOCALIDADE', 'PLANO', 'CATEGORIA', 'LOCADORA', 'PREÇO'))
+    filtro = (ds.field(categoria).is_valid() & ~ds.field(categoria).isin(CATEGORIAS_INVALIDAS)
+              & ds.field(locadora).is_valid() & ds.field(preco).is_valid() & ~ds.field(preco).is_nan())
+    tabela = dataset.to_table(columns=[localidade, plano], filter=filtro).group_by([localidade, plano]).aggregate([])
+    return pd.DataFrame({'LOCALIDADE': tabela.column(localidade).to_pylist(), 'PLANO': tabela.column(plano).to_pylist()})
+
+# --- CONVERSÃO DE DATAS E HORAS ---
+# Formatos explícitos (sem inferência): datas em ISO 8601 e HORA como HH:MM:SS. Cada valor
+# distinto é convertido uma única vez (uma raspagem tem uma DATA/HORA e poucas RETIRADAs) e
+# DATA_HORA = DATA à meia-noite + HORA, em aritmética de datetime/timedelta, sem passar por texto.
+FORMATO_DATA = 'ISO8601'
+FORMATO_HORA = '%H:%M:%S'
+
+def converter_valores_distintos(serie, conversor):
+    """Aplica `conversor` aos valores distintos de `serie` e espalha o resultado (NaT onde for nulo)."""
+    codigos, distintos = pd.factorize(serie)
+    convertidos = conversor(pd.Index(np.asarray(distintos, dtype=object)))
+    return pd.Series(convertidos.take(codigos, allow_fill=True, fill_value=pd.NaT), index=serie.index, name=serie.name)
+
+def converter_data(serie):
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    return converter_valores_distintos(serie, lambda valores: pd.to_datetime(valores, format=FORMATO_DATA, errors='coerce'))
+
+def converter_hora(serie):
+    return converter_valores_distintos(serie, lambda valores: pd.to_datetime(
+        valores.astype(str), format=FORMATO_HORA, errors='coerce') - pd.Timestamp('1900-01-01'))
+
+def limpar_colunas(df, fora_do_formato=None):
+    """
+    Limpeza original da base sobre as colunas presentes em `df`: nomes em maiúsculas (a primeira
+    repetida vence), PREÇO numérico, DATA + HORA -> DATA_HORA e RETIRADA como data. Se
+    `fora_do_formato` for um dict, recebe por coluna a máscara dos valores preenchidos que não
+    puderam ser convertidos (para o relatório de linhas descartadas).
+    """
     df.columns = [str(col).upper() for col in df.columns]
     df = df.loc[:, ~df.columns.duplicated()]
+    fora_do_formato = {} if fora_do_formato is None else fora_do_formato
+
+    def converter(coluna, serie_original, convertida):
+        fora_do_formato[coluna] = fora_do_formato.get(coluna, False) | (serie_original.notna() & convertida.isna()).to_numpy()
+        return convertida
 
-    if not df_comparativo.empty and 'PLANO ATUAL' in df_comparativo.columns:
-        plano_recente_series = df_comparativo['PLANO ATUAL']
-        if not plano_recente_series.empty:
-            plano_recente = str(plano_recente_series.iloc[0])
-            print(f"Plano mais recente detectado: {plano_recente}")
-
-except FileNotFoundError:
-    print(f"ERRO: O arquivo '{caminho_arquivo}' não foi encontrado.")
-    df = pd.DataFrame()
-    last_update_string = "Arquivo não encontrado"
-except Exception as e:
-    print(f"Ocorreu um erro inesperado ao ler o arquivo Parquet: {e}")
-    df = pd.DataFrame()
-    last_update_string = "Erro ao carregar dados"
-
-# --- Tratamento e Limpeza dos Dados ---
-if not df.empty:
     if 'PREÇO' in df.columns and pd.api.types.is_object_dtype(df['PREÇO']):
-        df['PREÇO'] = pd.to_numeric(df['PREÇO'], errors='coerce')
+        df['PREÇO'] = converter('PREÇO', df['PREÇO'], pd.to_numeric(df['PREÇO'], errors='coerce'))
 
-    df.rename(columns={'DATA': 'DATA_HORA'}, inplace=True)
-    df['DATA_HORA'] = pd.to_datetime(df['DATA_HORA'], errors='coerce')
-    if 'HORA' in df.columns:
-        df['DATA_HORA'] = pd.to_datetime(df['DATA_HORA'].dt.date.astype(str) + ' ' + df['HORA'].astype(str), errors='coerce')
+    if 'DATA' in df.columns:
+        df.rename(columns={'DATA': 'DATA_HORA'}, inplace=True)
+        df['DATA_HORA'] = converter('DATA_HORA', df['DATA_HORA'], converter_data(df['DATA_HORA']))
+        if 'HORA' in df.columns:
+            # Em microssegundos, como o TIMESTAMP do DuckDB (e o texto "...T10:09:03.000000" dos gráficos)
+            df['DATA_HORA'] = (df['DATA_HORA'].dt.normalize()
+                               + converter('DATA_HORA', df['HORA'], converter_hora(df['HORA']))).astype('datetime64[us]')
 
     if 'RETIRADA' in df.columns:
-        df['RETIRADA'] = pd.to_datetime(df['RETIRADA'], errors='coerce')
-
-    df.dropna(subset=['PREÇO', 'DATA_HORA', 'RETIRADA', 'LOCALIDADE', 'LOCADORA', 'CATEGORIA'], inplace=True)
-
-    df_calculos = df.copy()
-    df_calculos['RETIRADA'] = df_calculos['RETIRADA'].dt.date
-
-    df_tabela = df.copy()
-    df_tabela.rename(columns={'DATA_HORA': 'DATA'}, inplace=True)
+        df['RETIRADA'] = converter('RETIRADA', df['RETIRADA'], converter_data(df['RETIRADA']))
+    return df
+
+# --- COLUNAS SOB DEMANDA E PROJEÇÕES POR PÁGINA ---
+# A base limpa não é lida inteira: cada coluna sai do parquet (só ela) na primeira vez em que
+# alguma página a usa e fica no snapshot. As colunas do dropna da limpeza são lidas juntas, uma
+# única vez, e definem as linhas válidas (o índice comum a todas as outras colunas).
+# Cada página declara em COLUNAS_POR_PAGINA as colunas de que precisa; a Base (tabela, filtros
+# de cabeçalho e exportação) usa todas.
+COLUNAS_OBRIGATORIAS = ['PREÇO', 'DATA_HORA', 'RETIRADA', 'LOCALIDADE', 'LOCADORA', 'CATEGORIA']
+COLUNAS_EXEMPLO = ['LOCALIDADE', 'RETIRADA', 'CRIAÇÃO', 'DURAÇÃO', 'MODELO', 'PREÇO', 'LOCADORA', 'PLANO', 'HORA', 'OTA', 'CAMBIO', 'CATEGORIA', 'DATA_HORA']
+COLUNAS_POR_PAGINA = {
+    'dashboard': ['LOCALIDADE', 'LOCADORA', 'CATEGORIA', 'PREÇO', 'DATA_HORA'],
+    'posicionamento': ['RETIRADA', 'LOCALIDADE', 'CATEGORIA', 'LOCADORA', 'PREÇO'],
+    'movimentacao': ['DATA_HORA', 'RETIRADA', 'LOCALIDADE', 'LOCADORA', 'CATEGORIA', 'DURAÇÃO', 'PREÇO'],
+}
+
+def imprimir_descartes(df, fora_do_formato):
+    """Linhas que a limpeza descarta, por motivo: a primeira coluna obrigatória vazia ou fora do formato."""
+    restantes = np.ones(len(df), dtype=bool)
+    motivos = {}
+    for coluna in COLUNAS_OBRIGATORIAS:
+        nulas = df[coluna].isna().to_numpy() & restantes
+        invalidas = nulas & fora_do_formato.get(coluna, False)
+        motivos[f'{coluna} fora do formato'] = int(invalidas.sum())
+        motivos[f'{coluna} ausente'] = int((nulas & ~invalidas).sum())
+        restantes &= ~nulas
+    descartes = {motivo: total for motivo, total in motivos.items() if total}
+    if descartes:
+        print("Linhas descartadas por motivo: " + "; ".join(f"{motivo}: {total}" for motivo, total in descartes.items()) + ".")
+    return descartes
+
+COLUNAS_FACETAS_MOVIMENTACAO = ['LOCALIDADE', 'LOCADORA', 'CATEGORIA', 'DURAÇÃO']
+
+def coluna_vazia(nome):
+    return pd.Series([], dtype='datetime64[ns]' if nome in ('RETIRADA', 'DATA_HORA') else object, name=nome)
+
+_AUSENTE = object()  # derivado ainda não construído (None é um valor válido)
+
+class DadosCarregados:
+    """
+    Snapshot imutável de uma versão do arquivo de dados. Cada derivado é construído
+    uma única vez (protegido por lock) e o tempo de cada etapa fica em `tempos`; `linhas`,
+    `descartes`, `acertos` e `faltas` alimentam a página de saúde dos dados (admin).
+    """
+    def __init__(self, caminho, versao):
+        self.caminho = caminho
+        self.versao = versao
+        self.tempos = {}
+        self.linhas = {}
+        self.descartes = {}
+        # Acessos aos derivados por família ('coluna', 'padrao', ...), contados sob `_lock`
+        self.acertos = Counter()
+        self.faltas = Counter()
+        self.sem_dados = False
+        self._cache = {}
+        self._visoes_comparativo = OrderedDict()  # pares não padrão em cache, do menos ao mais recente
+        self.reiniciar_locks()
+        if versao is None:
+            self.last_update_string = "Arquivo não encontrado"
+        else:
+            self.last_update_string = datetime.fromtimestamp(versao).strftime('%d/%m/%Y %H:%M:%S')
+
+    def reiniciar_locks(self):
+        """
+        `_lock` protege só os dicionários (trechos curtos, nunca durante uma construção); cada derivado
+        é construído sob o próprio lock, então uma construção lenta não bloqueia os demais derivados.
+        Também chamado no processo filho de um fork (ver `_reiniciar_locks_apos_fork`).
+        """
+        self._lock = threading.RLock()
+        self._locks_derivados = {}
+
+    def descartar(self, nome):
+        """Remove o derivado `nome`, que será construído de novo no próximo uso."""
+        with self._lock:
+            self._cache.pop(nome, None)
+
+    def derivado(self, nome, construtor):
+        """Calcula `construtor()` uma única vez por snapshot e guarda o resultado sob `nome`."""
+        familia = nome.split(':', 1)[0]
+        # Uma única leitura do dicionário: o derivado pode ser descartado entre um teste e a leitura
+        valor = self._cache.get(nome, _AUSENTE)
+        if valor is _AUSENTE:
+            with self._lock:
+                lock_derivado = self._locks_derivados.setdefault(nome, threading.RLock())
+            with lock_derivado:
+                valor = self._cache.get(nome, _AUSENTE)
+                if valor is _AUSENTE:
+                    inicio = time.perf_counter()
+                    valor = construtor()
+                    with self._lock:
+                        self._cache[nome] = valor
+                        self.tempos[nome] = time.perf_counter() - inicio
+                        self.faltas[familia] += 1
+                    return valor
+        with self._lock:
+            self.acertos[familia] += 1
+        return valor
+
+    def acessos(self):
+        """Cópias de (acertos, faltas) por família, para ler sem concorrer com os incrementos."""
+        with self._lock:
+            return Counter(self.acertos), Counter(self.faltas)
+
+    def pronto(self, nome):
+        """O derivado `nome` se já foi construído, ou None; não constrói nem conta acesso (página de saúde)."""
+        return self._cache.get(nome)
+
+    def memoria(self):
+        """{derivado: (linhas, colunas, bytes)} dos DataFrames/Series do snapshot (`memory_usage(deep=True)`)."""
+        with self._lock:
+            itens = list(self._cache.items())
+        memoria = {}
+        for nome, valor in itens:
+            if isinstance(valor, pd.DataFrame):
+                memoria[nome] = (len(valor), len(valor.columns), int(valor.memory_usage(deep=True).sum()))
+            elif isinstance(valor, pd.Series):
+                memoria[nome] = (len(valor), 1, int(valor.memory_usage(deep=True)))
+        return memoria
+
+    @property
+    def df_comparativo(self):
+        return self.derivado('df_comparativo', self._gerar_comparativo)
+
+    def comparativo(self, visao='comparativo'):
+        """
+        DataFrame da visão de comparativo `visao` (ver `visao_comparativo`). O par padrão é gerado uma
+        vez por snapshot; os demais ficam só entre os VISOES_COMPARATIVO_EM_CACHE usados mais recentemente.
+        """
+        if visao == 'comparativo':
+            return self.df_comparativo
+        self._usar_visao_comparativo(visao)
+        _, plano_atual, referencia = visao.split(':', 2)
+        return self.derivado(visao, lambda: self._gerar_comparativo(plano_atual, referencia))
+
+    def _usar_visao_comparativo(self, visao):
+        """Marca `visao` como a mais recente e descarta os derivados das visões que saíram do LRU."""
+        with self._lock:
+            self._visoes_comparativo[visao] = None
+            self._visoes_comparativo.move_to_end(visao)
+            if len(self._visoes_comparativo) <= VISOES_COMPARATIVO_EM_CACHE:
+                return
+            while len(self._visoes_comparativo) > VISOES_COMPARATIVO_EM_CACHE:
+                self._visoes_comparativo.popitem(last=False)
+            # Varre todas as chaves ('comparativo:...', 'opcoes_comparativo:...', 'ordem_comparativo:...'),
+            # inclusive as que uma requisição em andamento recriou depois de uma remoção anterior
+            for nome in list(self._cache):
+                encontrada = PADRAO_VISAO_COMPARATIVO.search(nome)
+                if encontrada and encontrada.group(0) not in self._visoes_comparativo:
+                    del self._cache[nome]
+                    self.tempos.pop(nome, None)
+                    self._locks_derivados.pop(nome, None)
+
+    def visao_comparativo(self, plano_atual=None, referencia=None):
+        """
+        Nome da visão que compara `plano_atual` (ou o mais recente de cada localidade) com `referencia`
+        (um plano, REFERENCIA_ANTERIOR ou REFERENCIA_MEDIA); 'comparativo' é o par padrão.
+        Levanta ValueError para planos que não existem nos dados e para dois planos que não são
+        da mesma localidade (cada plano pertence a uma única localidade).
+        """
+        plano_atual = plano_atual or PLANO_MAIS_RECENTE
+        referencia = referencia or REFERENCIA_ANTERIOR
+        catalogo = self.catalogo_planos
+        planos = set(catalogo['PLANO'])
+        if plano_atual not in planos | {PLANO_MAIS_RECENTE} or referencia not in planos | {REFERENCIA_ANTERIOR, REFERENCIA_MEDIA}:
+            raise ValueError(f"Plano desconhecido: {plano_atual} / {referencia}")
+        if plano_atual in planos and referencia in planos:
+            localidades = dict(zip(catalogo['PLANO'], catalogo['LOCALIDADE']))
+            if plano_atual == referencia:
+                raise ValueError(f"O plano de referência é o próprio plano atual ({plano_atual}).")
+            if localidades[plano_atual] != localidades[referencia]:
+                raise ValueError(f"Os planos {plano_atual} ({localidades[plano_atual]}) e {referencia} "
+                                 f"({localidades[referencia]}) são de localidades diferentes.")
+        if (plano_atual, referencia) == (PLANO_MAIS_RECENTE, REFERENCIA_ANTERIOR):
+            return 'comparativo'
+        return f"comparativo:{plano_atual}:{referencia}"
+
+    @property
+    def linhas_validas(self):
+        """Colunas obrigatórias já limpas, só nas linhas que sobrevivem à limpeza."""
+        return self.derivado('linhas_validas', self._carregar_linhas_validas)
+
+    @property
+    def colunas_base(self):
+        """Colunas da base limpa, na ordem do arquivo (em maiúsculas, com DATA_HORA no lugar de DATA)."""
+        return self.derivado('colunas_base', self._listar_colunas_base)
+
+    def coluna(self, nome):
+        """Coluna `nome` da base limpa, lida do arquivo na primeira vez em que é pedida."""
+        if nome in COLUNAS_OBRIGATORIAS:
+            return self.linhas_validas[nome]
+        return self.derivado(f'coluna:{nome}', lambda: self._carregar_coluna(nome))
+
+    def base(self, colunas=None):
+        """Base limpa só com `colunas` (todas, se None), montada sem cópia a partir das colunas já carregadas."""
+        colunas = self.colunas_base if colunas is None else [c for c in colunas if c in self.colunas_base]
+        return pd.DataFrame({c: self.coluna(c) for c in colunas}, index=self.linhas_validas.index, copy=False)
+
+    @property
+    def df(self):
+        return self.base()
+
+    @property
+    def plano_recente(self):
+        return self.derivado('plano_recente', self._detectar_plano_recente)
+
+    @property
+    def dataset(self):
+        return self.derivado('dataset', lambda: abrir_dataset(self.caminho))
+
+    @property
+    def catalogo_planos(self):
+        return self.derivado('catalogo_planos', lambda: catalogo_planos(self.dataset))
+
+    @property
+    def consultas(self):
+        return self.derivado('consultas', lambda: criar_consultas(self))
+
+    def precarregar(self):
+        """Constrói todos os derivados de uma vez (modo de pré-carga)."""
+        for nome in ('df_comparativo', 'plano_recente', 'consultas'):
+            getattr(self, nome)
+        if BACKEND_CONSULTAS == 'pandas':
+            # Com o DuckDB a base não é carregada no processo; no pandas todas as colunas já ficam prontas
+            for coluna in self.colunas_base:
+                self.coluna(coluna)
+            self.consultas.indice_movimentacao()
+            self.consultas.mudancas_de_preco()
+        return self
+
+    def corte_historico(self, catalogo=None):
+        """Menor PLANO dentro da janela SEA_DASH_DIAS_HISTORICO (segundo `catalogo`, por padrão o do snapshot), ou None para todo o histórico."""
+        if DIAS_HISTORICO is None:
+            return None
+        catalogo = self.catalogo_planos if catalogo is None else catalogo
+        if catalogo.empty:
+            return None
+        # PLANO segue 'AAAA.MM.DD.HH-MM-SS', então a ordem de texto é a ordem cronológica
+        plano_mais_recente = datetime.strptime(str(catalogo['PLANO'].max())[:10], '%Y.%m.%d')
+        return (plano_mais_recente - pd.Timedelta(days=DIAS_HISTORICO)).strftime('%Y.%m.%d')
+
+    def filtro_historico(self):
+        """Filtro pyarrow de PLANO para a janela de histórico, ou None."""
+        corte = self.corte_historico()
+        if corte is None:
+            return None
+        import pyarrow.dataset as ds
+        return ds.field(coluna_do_dataset(self.dataset, 'PLANO')) >= corte
+
+    def planos_por_localidade(self):
+        """{localidade: [planos em ordem decrescente]} segundo o catálogo de planos."""
+        catalogo = self.catalogo_planos.sort_values(['LOCALIDADE', 'PLANO'], ascending=[True, False])
+        return {localidade: list(planos) for localidade, planos in catalogo.groupby('LOCALIDADE', sort=False)['PLANO']}
+
+    def _ler_colunas(self, nomes, fora_do_formato=None):
+        """Lê do arquivo só as colunas `nomes` (sem diferenciar maiúsculas) já limpas, em todas as linhas da janela."""
+        existentes = {c.upper() for c in self.dataset.schema.names}
+        colunas = [coluna_do_dataset(self.dataset, nome) for nome in nomes if nome in existentes]
+        return limpar_colunas(self.dataset.to_table(columns=colunas, filter=self.filtro_historico()).to_pandas(), fora_do_formato)
+
+    def _carregar_linhas_validas(self):
+        try:
+            fora_do_formato = {}
+            df = self._ler_colunas(['PREÇO', 'DATA', 'HORA', 'RETIRADA', 'LOCALIDADE', 'LOCADORA', 'CATEGORIA'], fora_do_formato)
+            print("Arquivo Parquet carregado com sucesso!")
+            print(f"Total de {len(df)} linhas carregadas.")
+            self.linhas['carregadas'] = len(df)
+            print(f"Última modificação do arquivo: {self.last_update_string}")
+        except FileNotFoundError:
+            print(f"ERRO: O arquivo '{self.caminho}' não foi encontrado.")
+            self.last_update_string = "Arquivo não encontrado"
+            df = pd.DataFrame()
+        except Exception as e:
+            print(f"Ocorreu um erro inesperado ao ler o arquivo Parquet: {e}")
+            self.last_update_string = "Erro ao carregar dados"
+            df = pd.DataFrame()
+
+        if df.empty:
+            print("Dashboard iniciado com dados de exemplo.")
+            self.sem_dados = True
+            return pd.DataFrame({c: coluna_vazia(c) for c in COLUNAS_OBRIGATORIAS})
+        # O índice guarda a posição de cada linha válida no arquivo, usada para recortar as demais colunas
+        self.descartes = imprimir_descartes(df, fora_do_formato)
+        df.dropna(subset=COLUNAS_OBRIGATORIAS, inplace=True)
+        print(f"Total de {len(df)} linhas após a limpeza.")
+        self.linhas['após a limpeza'] = len(df)
+        return df[COLUNAS_OBRIGATORIAS]
+
+    def _listar_colunas_base(self):
+        if self.linhas_validas.empty and self.sem_dados:
+            return list(COLUNAS_EXEMPLO)
+        colunas = []
+        for nome in ordem_colunas(self.dataset):
+            nome = 'DATA_HORA' if nome.upper() == 'DATA' else nome.upper()
+            if nome not in colunas:
+                colunas.append(nome)
+        return colunas
+
+    def _carregar_coluna(self, nome):
+        linhas_validas = self.linhas_validas
+        if self.sem_dados:
+            return coluna_vazia(nome)
+        serie = self._ler_colunas([nome])[nome]
+        return serie.iloc[linhas_validas.index.to_numpy()]
+
+    def _gerar_comparativo(self, plano_atual=PLANO_MAIS_RECENTE, referencia=REFERENCIA_ANTERIOR):
+        try:
+            pares = pares_de_planos(self.planos_por_localidade(), plano_atual, referencia)
+            planos = sorted({plano for atual, referencias in pares.values() for plano in [atual, *referencias]})
+            if not planos:
+                return pd.DataFrame()
+            corte = self.corte_historico()
+            consultas = self.consultas
+            if set(GRAO_MENORES_OFERTAS) <= set(consultas.colunas('base')) and (corte is None or min(planos) >= corte):
+                # Os planos do comparativo estão na base: ele sai da tabela compartilhada de menores ofertas
+                print(f"\nGerando o comparativo ({plano_atual} vs. {referencia}) a partir da tabela de menores ofertas...")
+                return comparar_menores_ofertas(consultas.menores_ofertas(planos), pares)
+            import pyarrow.dataset as ds
+            coluna_plano = coluna_do_dataset(self.dataset, 'PLANO')
+            df_para_comparativo = ler_dataset(self.dataset, ds.field(coluna_plano).isin(planos))
+            df_para_comparativo.columns = [str(col).lower() for col in df_para_comparativo.columns]
+            return gerar_df_comparativo_robusto(df_para_comparativo, pares)
+        except FileNotFoundError:
+            return pd.DataFrame()
+        except Exception as e:
+            print(f"Ocorreu um erro inesperado ao gerar o comparativo: {e}")
+            return pd.DataFrame()
+
+    def _detectar_plano_recente(self):
+        df_comparativo = self.df_comparativo
+        if not df_comparativo.empty and 'PLANO ATUAL' in df_comparativo.columns:
+            plano_recente_series = df_comparativo['PLANO ATUAL']
+            if not plano_recente_series.empty:
+                plano_recente = str(plano_recente_series.iloc[0])
+                print(f"Plano mais recente detectado: {plano_recente}")
+                return plano_recente
+        return "N/A"
+
+# Na tabela Base, DATA_HORA aparece como DATA e as datas viram texto nestes formatos
+COLUNAS_RENOMEADAS_TABELA = {'DATA_HORA': 'DATA'}
+RENOMEAR_BASE = {exibido: original for original, exibido in COLUNAS_RENOMEADAS_TABELA.items()}
+FORMATOS_DATA_TABELA = {'DATA': '%Y-%m-%d %H:%M:%S', 'RETIRADA': '%Y-%m-%d'}
+# Formato exibido por coluna em cada visão: texto do strftime (datas) ou função (valores numéricos)
+FORMATOS_EXIBICAO = {'base': FORMATOS_DATA_TABELA, 'comparativo': FORMATOS_COMPARATIVO}
+
+def formatar_tabela(df_tabela, formatos=FORMATOS_DATA_TABELA):
+    """Converte, no próprio DataFrame, as datas e os valores com formatador para o texto exibido na tabela."""
     for col in df_tabela.columns:
-        if pd.api.types.is_datetime64_any_dtype(df_tabela[col]):
-            if col == 'DATA':
-                df_tabela[col] = df_tabela[col].dt.strftime('%Y-%m-%d %H:%M:%S')
+        formato = formatos.get(col)
+        if callable(formato):
+            df_tabela[col] = df_tabela[col].map(formato)
+        elif pd.api.types.is_datetime64_any_dtype(df_tabela[col]):
+            df_tabela[col] = df_tabela[col].dt.strftime(formato or '%Y-%m-%d')
+    return df_tabela
+
+def mascara_coluna(serie, valores, formato_data=None):
+    """
+    Equivale a `serie.astype(str).isin(valores)` (a semântica dos filtros de cabeçalho),
+    mas sem converter a coluna inteira em texto: categóricas comparam só as categorias,
+    numéricas e datas convertem os valores selecionados para o tipo da coluna. Com um
+    formatador (função) em `formato_data`, compara o texto formatado de cada valor distinto.
+    """
+    valores = [str(v) for v in valores]
+    if callable(formato_data):
+        distintos = serie.dropna().unique()
+        return serie.isin([v for v in distintos if formato_data(v) in valores]).to_numpy()
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        categorias_ok = np.append(serie.cat.categories.astype(str).isin(valores), 'nan' in valores)
+        return categorias_ok[serie.cat.codes.to_numpy()]  # código -1 (NaN) cai na última posição
+    if pd.api.types.is_datetime64_any_dtype(serie) and formato_data:
+        alvos = pd.to_datetime(pd.Series(valores), format=formato_data, errors='coerce').dropna()
+        return serie.isin(alvos).to_numpy()
+    if pd.api.types.is_integer_dtype(serie) or pd.api.types.is_float_dtype(serie):
+        alvos = pd.to_numeric(pd.Series(valores), errors='coerce').dropna().to_numpy().astype(serie.dtype)
+        mascara = np.isin(serie.to_numpy(), alvos)
+        if 'nan' in valores:
+            mascara |= serie.isna().to_numpy()
+        return mascara
+    return serie.astype(str).isin(valores).to_numpy()
+
+def mascara_filtros(df_base, filtros_ativos, formatos_data=None, renomear=None):
+    """
+    Máscara booleana das linhas de `df_base` que passam por todos os filtros de cabeçalho.
+    `renomear` mapeia o nome exibido da coluna para o nome em `df_base` (ex.: DATA -> DATA_HORA)
+    e `formatos_data` o formato de texto com que as datas (ou, via formatador, os valores numéricos)
+    aparecem nas opções do filtro.
+    """
+    formatos_data = formatos_data or {}
+    renomear = renomear or {}
+    mascara = np.ones(len(df_base), dtype=bool)
+    for nome_da_coluna, valores in filtros_ativos.items():
+        coluna = renomear.get(nome_da_coluna, nome_da_coluna)
+        if coluna in df_base.columns:
+            mascara &= mascara_coluna(df_base[coluna], valores, formatos_data.get(nome_da_coluna))
+    return mascara
+
+def versao_arquivo(caminho):
+    """
+    Versão dos dados (mtime), ou None se o caminho não existir. Para um diretório particionado
+    vale o mtime mais recente entre todos os arquivos e subdiretórios (partições novas ou removidas
+    alteram o mtime do diretório pai). Arquivos e diretórios ocultos ('.trava' e os temporários da
+    ingestão) não são dados, como na leitura do pyarrow, e ficam de fora.
+    """
+    try:
+        versao = os.path.getmtime(caminho)
+    except OSError:
+        return None
+    if os.path.isdir(caminho):
+        for raiz, diretorios, arquivos in os.walk(caminho):
+            diretorios[:] = [nome for nome in diretorios if not nome.startswith('.')]
+            for nome in diretorios + [nome for nome in arquivos if not nome.startswith('.')]:
+                try:
+                    versao = max(versao, os.path.getmtime(os.path.join(raiz, nome)))
+                except OSError:
+                    pass  # removido durante a varredura; a próxima verificação pega a mudança
+    return versao
+
+_dados_atuais = None
+_ultima_verificacao_arquivo = 0.0
+_lock_dados = threading.Lock()
+
+def obter_dados():
+    """
+    Retorna o snapshot de dados atual. A cada SEA_DASH_INTERVALO_RECARGA segundos verifica
+    o mtime do arquivo e, se ele mudou, troca o snapshot (recarga a quente).
+    """
+    global _dados_atuais, _ultima_verificacao_arquivo
+    dados = _dados_atuais
+    if dados is not None and time.monotonic() - _ultima_verificacao_arquivo < INTERVALO_VERIFICACAO_ARQUIVO:
+        return dados
+    with _lock_dados:
+        versao = versao_arquivo(caminho_arquivo)
+        if _dados_atuais is None or _dados_atuais.versao != versao:
+            recarga = _dados_atuais is not None
+            if recarga:
+                print(f"Nova versão do arquivo de dados detectada ({caminho_arquivo}).")
+            _dados_atuais = DadosCarregados(caminho_arquivo, versao)
+            if recarga and AQUECIMENTO != '0':
+                # Em uma thread: a requisição que detectou a troca não espera o aquecimento
+                iniciar_aquecimento(_dados_atuais, em_segundo_plano=True)
+        _ultima_verificacao_arquivo = time.monotonic()
+        return _dados_atuais
+
+# --- CAMADA DE CONSULTAS (PANDAS OU DUCKDB) ---
+# Os callbacks não filtram nem agrupam DataFrames diretamente: pedem à camada de consultas
+# do snapshot (`dados.consultas`) as opções dos filtros, contagens, páginas e agregados.
+# A implementação padrão trabalha sobre os DataFrames em memória; com SEA_DASH_BACKEND=duckdb
+# as mesmas consultas rodam em SQL direto sobre o parquet (ou o diretório particionado), usando
+# todos os núcleos e podendo extrapolar a memória, sem carregar a base no processo.
+# Os filtros usam sempre os nomes e o texto exibidos na tabela (ex.: DATA 'AAAA-MM-DD HH:MM:SS').
+BACKEND_CONSULTAS = os.environ.get('SEA_DASH_BACKEND', 'pandas').lower()
+if BACKEND_CONSULTAS == 'duckdb' and importlib.util.find_spec('duckdb') is None:
+    print("AVISO: 'duckdb' não está instalado; usando o backend pandas.")
+    BACKEND_CONSULTAS = 'pandas'
+
+def valores_texto(serie, formato_data=None):
+    """Valores distintos e não nulos de `serie`, como texto e ordenados (as opções de um filtro)."""
+    if callable(formato_data):
+        # Valores formatados seguem a ordem numérica, não a do texto
+        return list(dict.fromkeys(formato_data(v) for v in np.sort(serie.dropna().unique())))
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        codigos = np.unique(serie.cat.codes.to_numpy())
+        valores = serie.cat.categories[codigos[codigos >= 0]].astype(str)
+    elif pd.api.types.is_datetime64_any_dtype(serie):
+        valores = pd.DatetimeIndex(serie.dropna().unique()).strftime(formato_data or '%Y-%m-%d')
+    else:
+        valores = serie.dropna().astype(str).unique()
+    return sorted(set(valores))
+
+def blocos_filtrados(df_base, mascara, linhas_por_bloco):
+    """Gera as linhas selecionadas por `mascara` em blocos de até `linhas_por_bloco` linhas."""
+    indices = np.flatnonzero(mascara)
+    if len(indices) == 0:
+        yield df_base.iloc[:0]
+        return
+    for inicio in range(0, len(indices), linhas_por_bloco):
+        yield df_base.iloc[indices[inicio:inicio + linhas_por_bloco]]
+
+# --- TABELA COMPARTILHADA DE MENORES OFERTAS ---
+# A "oferta mais barata" por chave é calculada uma única vez por snapshot no grão mais fino
+# (GRAO_MENORES_OFERTAS) e cada página apenas consolida essa tabela nas suas chaves: as matrizes
+# de posicionamento (RETIRADA x LOCALIDADE, CATEGORIA x RETIRADA) e o comparativo entre planos.
+# A consolidação é exata porque o menor preço de um grupo é o menor entre os menores dos subgrupos;
+# empates são desfeitos pela POSICAO da linha vencedora no arquivo, como o idxmin sobre as linhas.
+GRAO_MENORES_OFERTAS = ['PLANO', 'LOCALIDADE', 'RETIRADA', 'DURAÇÃO', 'CATEGORIA']
+
+def agregar_menores_precos(dff, chaves, dropna=True):
+    """
+    Por grupo de `chaves`: locadora com o menor preço (a primeira linha, em caso de empate),
+    menor preço, menor preço da Foco e menor preço acima do mínimo (o "segundo colocado"),
+    além da posição (rótulo) da linha vencedora e do número de linhas do grupo.
+    """
+    grupos = dff.groupby(chaves, observed=True, dropna=dropna)
+    idx_min = grupos['PREÇO'].idxmin()
+    agregado = pd.DataFrame({'VENCEDORA': dff.loc[idx_min.to_numpy(), 'LOCADORA'].astype(object).to_numpy()}, index=idx_min.index)
+    agregado['MENOR_PRECO'] = grupos['PREÇO'].min()
+    agregado['MENOR_PRECO_FOCO'] = dff[dff['LOCADORA'] == 'Foco'].groupby(chaves, observed=True, dropna=dropna)['PREÇO'].min()
+    acima_do_minimo = dff['PREÇO'] > grupos['PREÇO'].transform('min')
+    agregado['SEGUNDO_MENOR_PRECO'] = dff[acima_do_minimo].groupby(chaves, observed=True, dropna=dropna)['PREÇO'].min()
+    agregado['POSICAO'] = idx_min.to_numpy()
+    agregado['LINHAS'] = grupos.size()
+    return agregado
+
+def agregar_menores_ofertas(dff):
+    """Tabela de menores ofertas de `dff` no grão GRAO_MENORES_OFERTAS (chaves como colunas)."""
+    return agregar_menores_precos(dff, GRAO_MENORES_OFERTAS, dropna=False).reset_index()
+
+def consolidar_menores_precos(ofertas, chaves):
+    """
+    O mesmo resultado de `agregar_menores_precos(linhas, chaves)` calculado a partir da tabela de
+    menores ofertas dessas linhas. RETIRADA é agrupada pelo dia (datas no índice, como nas matrizes).
+    """
+    ofertas = ofertas.sort_values(['MENOR_PRECO', 'POSICAO'], kind='stable')
+    if 'RETIRADA' in chaves:
+        ofertas = ofertas.assign(RETIRADA=ofertas['RETIRADA'].dt.normalize())
+    grupos = ofertas.groupby(chaves, observed=True)
+    menor = grupos['MENOR_PRECO'].transform('min')
+    # O segundo colocado do grupo é o menor preço acima do mínimo entre todos os subgrupos
+    segundo = ofertas['MENOR_PRECO'].where(ofertas['MENOR_PRECO'] > menor, ofertas['SEGUNDO_MENOR_PRECO'])
+    agregado = grupos[['VENCEDORA']].first()
+    agregado['MENOR_PRECO'] = grupos['MENOR_PRECO'].min()
+    agregado['MENOR_PRECO_FOCO'] = grupos['MENOR_PRECO_FOCO'].min()
+    agregado['SEGUNDO_MENOR_PRECO'] = segundo.groupby([ofertas[c] for c in chaves], observed=True).min()
+    agregado['POSICAO'] = grupos['POSICAO'].first()
+    agregado['LINHAS'] = grupos['LINHAS'].sum()
+    if 'RETIRADA' in chaves and isinstance(agregado.index, pd.MultiIndex):
+        datas = agregado.index.levels[agregado.index.names.index('RETIRADA')]
+        agregado.index = agregado.index.set_levels(pd.Index(datas.date, name='RETIRADA'), level='RETIRADA')
+    elif 'RETIRADA' in chaves:
+        agregado.index = pd.Index(agregado.index.date, name='RETIRADA')
+    return agregado
+
+def diferenca_foco(agregado):
+    """
+    Matriz 2 a partir do agregado de menores preços: se a Foco é a mais barata, quanto o segundo
+    colocado é mais caro ("Único" se não houver outro preço); senão, quanto o menor preço é mais
+    barato que o da Foco. Sem oferta da Foco, NaN.
+    """
+    menor, foco, segundo = (agregado[c].to_numpy() for c in ('MENOR_PRECO', 'MENOR_PRECO_FOCO', 'SEGUNDO_MENOR_PRECO'))
+    foco_e_menor = foco == menor
+    with np.errstate(divide='ignore', invalid='ignore'):
+        diferenca = pd.Series(np.where(foco_e_menor, segundo / foco - 1, menor / foco - 1), index=agregado.index)
+    unico = foco_e_menor & np.isnan(segundo)
+    if unico.any():
+        diferenca = diferenca.astype(object)
+        diferenca[unico] = 'Único'
+    return diferenca
+
+# --- MUDANÇAS DE PREÇO AO LONGO DO DIA ---
+# Uma série de preço é cada (LOCALIDADE, RETIRADA, DURAÇÃO, CATEGORIA, LOCADORA), com o menor
+# preço da locadora em cada pesquisa (DATA_HORA). Um evento é a diferença para a pesquisa anterior
+# da mesma série no mesmo dia, quando o preço mudou. A tabela de eventos é montada uma vez por
+# snapshot (dezenas de milhares de linhas) e a Movimentação por Horário lista as maiores do dia.
+CHAVES_SERIE_PRECO = ['LOCALIDADE', 'RETIRADA', 'DURAÇÃO', 'CATEGORIA', 'LOCADORA']
+MAIORES_MUDANCAS = int(os.environ.get('SEA_DASH_MAIORES_MUDANCAS', 50))
+
+def detectar_mudancas_de_preco(df):
+    """Eventos de mudança de preço entre pesquisas consecutivas do mesmo dia, em ordem de DATA_HORA."""
+    chaves = [c for c in CHAVES_SERIE_PRECO if c in df.columns]
+    precos = df.groupby(chaves + ['DATA_HORA'], observed=True, dropna=False)['PREÇO'].min().reset_index()
+    precos['DIA'] = precos['DATA_HORA'].dt.normalize()
+    # Ordenado pela série e pelo horário: diff/shift comparam cada pesquisa com a anterior
+    series = precos.groupby(chaves + ['DIA'], observed=True, dropna=False, sort=False)
+    precos['DATA_HORA_ANTERIOR'] = series['DATA_HORA'].shift()
+    precos['PRECO_ANTERIOR'] = series['PREÇO'].shift()
+    precos['VARIACAO'] = precos['PREÇO'] - precos['PRECO_ANTERIOR']
+    precos['VARIACAO_PCT'] = precos['VARIACAO'] / precos['PRECO_ANTERIOR']
+    eventos = precos[precos['VARIACAO'].notna() & (precos['VARIACAO'] != 0)]
+    return eventos.sort_values(['DATA_HORA'] + chaves, kind='stable').reset_index(drop=True)
+
+def ordenar_maiores_mudancas(eventos, limite=MAIORES_MUDANCAS):
+    """As `limite` maiores variações percentuais (em módulo); empates pela ordem dos eventos."""
+    ordem = np.argsort(-eventos['VARIACAO_PCT'].abs().to_numpy(), kind='stable')[:limite]
+    return eventos.iloc[ordem]
+
+# --- BUSCA LIVRE NA BASE (ÍNDICE DE TRIGRAMAS) ---
+# A caixa de busca da Base procura cada palavra digitada, sem diferenciar maiúsculas, dentro de
+# qualquer coluna de texto, e a linha precisa conter todas as palavras. O índice cobre os valores
+# distintos de cada coluna (centenas, mesmo com milhões de linhas) e é refeito a cada snapshot; os
+# valores encontrados viram um filtro comum (IN) sobre as colunas, somado aos filtros de cabeçalho.
+# No dicionário de filtros a busca vai sob FILTRO_BUSCA, e por isso também vale na exportação.
+FILTRO_BUSCA = '_busca'
+
+def trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+class IndiceTrigramas:
+    """Índice trigrama -> valores, sobre os valores distintos das colunas de texto."""
+    def __init__(self, valores_por_coluna):
+        self._entradas = [(coluna, valor, valor.lower()) for coluna, valores in valores_por_coluna.items() for valor in valores]
+        postings = {}
+        for posicao, (_, _, texto) in enumerate(self._entradas):
+            for trigrama in trigramas(texto):
+                postings.setdefault(trigrama, []).append(posicao)
+        self._postings = {trigrama: np.array(posicoes) for trigrama, posicoes in postings.items()}
+
+    def buscar(self, palavra):
+        """{coluna: [valores]} cujo texto contém `palavra`."""
+        palavra = palavra.lower()
+        candidatos = range(len(self._entradas))
+        if len(palavra) >= 3:
+            # Só os valores que têm todos os trigramas da palavra precisam ser conferidos
+            listas = sorted((self._postings.get(t, np.array([], dtype=int)) for t in trigramas(palavra)), key=len)
+            candidatos = listas[0]
+            for lista in listas[1:]:
+                candidatos = np.intersect1d(candidatos, lista, assume_unique=True)
+        encontrados = {}
+        for posicao in candidatos:
+            coluna, valor, texto = self._entradas[posicao]
+            if palavra in texto:
+                encontrados.setdefault(coluna, []).append(valor)
+        return encontrados
+
+class ConsultasPandas:
+    """Consultas sobre os DataFrames em memória do snapshot (backend padrão)."""
+    nome = 'pandas'
+
+    def __init__(self, dados):
+        self.dados = dados
+
+    def _fonte(self, visao, colunas=None):
+        """
+        (DataFrame tipado, nome exibido -> nome no DataFrame, formatos de data) da visão. Na Base,
+        só com as `colunas` exibidas pedidas (todas, se None), para não carregar as demais.
+        """
+        if visao == 'base':
+            projecao = None if colunas is None else [RENOMEAR_BASE.get(c, c) for c in colunas]
+            return self.dados.base(projecao), RENOMEAR_BASE, FORMATOS_DATA_TABELA
+        return self.dados.comparativo(visao), {}, FORMATOS_COMPARATIVO
+
+    def _exibir(self, df, renomear):
+        return df.rename(columns={original: exibido for exibido, original in renomear.items()})
+
+    def colunas(self, visao):
+        if visao == 'base':
+            return [COLUNAS_RENOMEADAS_TABELA.get(c, c) for c in self.dados.colunas_base]
+        return self.dados.comparativo(visao).columns.tolist()
+
+    def vazia(self, visao):
+        return len(self._fonte(visao, [])[0]) == 0
+
+    def mascara(self, visao, filtros):
+        filtros = dict(filtros)
+        busca = filtros.pop(FILTRO_BUSCA, None)
+        df, renomear, formatos = self._fonte(visao, list(filtros))
+        mascara = mascara_filtros(df, filtros, formatos, renomear)
+        if busca and visao == 'base':
+            mascara &= self.mascara_busca(' '.join(busca))
+        return mascara
+
+    def _valores_busca(self):
+        """Valores distintos (texto) de cada coluna de texto da Base, para o índice de busca."""
+        valores = {}
+        for coluna in self.dados.colunas_base:
+            serie = self.dados.coluna(coluna)
+            if isinstance(serie.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(serie):
+                valores[coluna] = valores_texto(serie)
+        return valores
+
+    def indice_busca(self):
+        return self.dados.derivado('indice_busca', lambda: IndiceTrigramas(self._valores_busca()))
+
+    def mascara_busca(self, termo):
+        """Linhas da Base que contêm todas as palavras de `termo` em alguma coluna de texto."""
+        mascara = np.ones(len(self.dados.linhas_validas), dtype=bool)
+        for palavra in termo.split():
+            mascara_palavra = np.zeros(len(mascara), dtype=bool)
+            for coluna, valores in self.indice_busca().buscar(palavra).items():
+                mascara_palavra |= mascara_coluna(self.dados.coluna(coluna), valores)
+            mascara &= mascara_palavra
+        return mascara
+
+    def opcoes_filtros(self, visao, colunas, filtros_ativos):
+        """Opções de cada coluna considerando os filtros ativos das demais colunas."""
+        df, renomear, formatos = self._fonte(visao, list(colunas) + list(filtros_ativos))
+        mascaras = {coluna: self.mascara(visao, {coluna: valores}) for coluna, valores in filtros_ativos.items()}
+        opcoes = {}
+        for coluna in colunas:
+            mascara = np.ones(len(df), dtype=bool)
+            for outra_coluna, mascara_outra in mascaras.items():
+                if outra_coluna != coluna:
+                    mascara &= mascara_outra
+            serie = df[renomear.get(coluna, coluna)]
+            opcoes[coluna] = valores_texto(serie if mascara.all() else serie[mascara], formatos.get(coluna))
+        return opcoes
+
+    def opcoes_todas(self, visao):
+        """Opções de todas as colunas sem filtro nenhum (calculadas uma vez por snapshot)."""
+        return self.dados.derivado(f'opcoes_{visao}', lambda: self.opcoes_filtros(visao, self.colunas(visao), {}))
+
+    def larguras(self, visao):
+        """Maior texto exibido em cada coluna, para dimensionar o cabeçalho."""
+        return {coluna: max((len(v) for v in opcoes), default=0) for coluna, opcoes in self.opcoes_todas(visao).items()}
+
+    def contar(self, visao, filtros):
+        return int(self.mascara(visao, filtros).sum())
+
+    def ordem(self, visao, coluna, crescente=True):
+        """
+        Permutação das linhas da visão ordenadas por `coluna` (estável, vazios no fim), calculada
+        uma vez por snapshot e sentido. Categóricas seguem a ordem do texto das categorias.
+        """
+        def calcular():
+            df, renomear, _ = self._fonte(visao, [coluna])
+            serie = df[renomear.get(coluna, coluna)].reset_index(drop=True)
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                serie = serie.cat.reorder_categories(sorted(serie.cat.categories, key=str))
+            return serie.sort_values(ascending=crescente, kind='stable', na_position='last').index.to_numpy()
+        return self.dados.derivado(f"ordem_{visao}:{coluna}:{'asc' if crescente else 'desc'}", calcular)
+
+    def linhas(self, visao, filtros, ordenacao=None):
+        """Posições das linhas que passam pelos filtros, na ordem pedida em `ordenacao` ({'coluna', 'crescente'})."""
+        mascara = self.mascara(visao, filtros)
+        if not ordenacao or ordenacao.get('coluna') not in self.colunas(visao):
+            return np.flatnonzero(mascara)
+        # A permutação pronta é só recortada pela máscara: nenhuma ordenação a cada página
+        ordem = self.ordem(visao, ordenacao['coluna'], ordenacao.get('crescente', True))
+        return ordem[mascara[ordem]]
+
+    def pagina(self, visao, filtros, inicio, fim, ordenacao=None, formatado=True):
+        """Linhas [inicio, fim) da visão filtrada (e ordenada), no texto exibido (tipadas, com formatado=False)."""
+        df, renomear, formatos = self._fonte(visao)
+        indices = self.linhas(visao, filtros, ordenacao)[inicio:fim]
+        pagina = self._exibir(df.iloc[indices], renomear)
+        return formatar_tabela(pagina, formatos) if formatado else pagina
+
+    def blocos(self, visao, filtros, linhas_por_bloco):
+        """Linhas filtradas (tipadas, com os nomes exibidos) em blocos, para exportação."""
+        df, renomear, _ = self._fonte(visao)
+        for bloco in blocos_filtrados(df, self.mascara(visao, filtros), linhas_por_bloco):
+            yield self._exibir(bloco, renomear)
+
+    def menores_ofertas(self, planos=None):
+        """Tabela de menores ofertas da Base (montada uma vez por snapshot), só dos `planos` informados."""
+        ofertas = self.dados.derivado('menores_ofertas', lambda: agregar_menores_ofertas(
+            self.dados.base(GRAO_MENORES_OFERTAS + ['LOCADORA', 'PREÇO'])))
+        if planos is None:
+            return ofertas
+        # Índice plano -> posições: recortar alguns planos não percorre a tabela inteira
+        posicoes = self.dados.derivado('menores_ofertas_por_plano', lambda: ofertas.groupby('PLANO', observed=True).indices)
+        selecionadas = [posicoes[plano] for plano in planos if plano in posicoes]
+        return ofertas.iloc[np.sort(np.concatenate(selecionadas))] if selecionadas else ofertas.iloc[:0]
+
+    def consolida_menores_ofertas(self, filtros, chaves):
+        """Se o agregado de `chaves` sob `filtros` sai da tabela de menores ofertas (filtros e chaves só do grão)."""
+        grao = set(GRAO_MENORES_OFERTAS)
+        return (grao <= set(self.colunas('base')) and set(chaves) <= grao
+                and all(RENOMEAR_BASE.get(coluna, coluna) in grao for coluna in filtros))
+
+    def menores_precos(self, filtros, chaves):
+        """(linhas filtradas, agregado de `agregar_menores_precos`) das linhas da Base que passam pelos filtros."""
+        if self.consolida_menores_ofertas(filtros, chaves):
+            ofertas = self.menores_ofertas()
+            selecionadas = ofertas[mascara_filtros(ofertas, filtros, FORMATOS_DATA_TABELA)]
+            if selecionadas.empty:
+                return 0, None
+            return int(selecionadas['LINHAS'].sum()), consolidar_menores_precos(selecionadas, chaves)
+        mascara = self.mascara('base', filtros)
+        dff = self.dados.base(COLUNAS_POR_PAGINA['posicionamento'])[mascara]
+        if dff.empty:
+            return 0, None
+        # As matrizes agrupam a RETIRADA pelo dia
+        retirada_dia = self.dados.derivado('retirada_dia', lambda: self.dados.coluna('RETIRADA').dt.date)
+        dff['RETIRADA'] = retirada_dia[mascara]
+        return len(dff), agregar_menores_precos(dff, chaves)
+
+    def resumo_dashboard(self, localidades, locadoras):
+        """KPIs, séries dos gráficos e opções dos dropdowns do Big Picture."""
+        df = self.dados.base(COLUNAS_POR_PAGINA['dashboard'])
+        filtro_localidade = df['LOCALIDADE'].isin(localidades) if localidades else np.ones(len(df), dtype=bool)
+        filtro_locadora = df['LOCADORA'].isin(locadoras) if locadoras else np.ones(len(df), dtype=bool)
+        dff = df[filtro_localidade & filtro_locadora]
+        return {
+            'opcoes_localidade': sorted(df.loc[filtro_locadora, 'LOCALIDADE'].dropna().unique()),
+            'opcoes_locadora': sorted(df.loc[filtro_localidade, 'LOCADORA'].dropna().unique()),
+            'total': len(dff),
+            'preco_medio': dff['PREÇO'].mean(),
+            'num_locadoras': dff['LOCADORA'].nunique(),
+            'preco_por_locadora': dff.groupby('LOCADORA')['PREÇO'].mean().sort_values(ascending=False).reset_index(),
+            'contagem_categoria': dff.groupby('CATEGORIA', observed=True, sort=False).size().reset_index(name='QUANTIDADE'),
+            'preco_por_dia': dff.groupby(dff['DATA_HORA'].dt.date)['PREÇO'].mean().reset_index(),
+        }
+
+    def linhas_movimentacao(self, inicio, fim, inicio_retirada=None, fim_retirada=None):
+        """Linhas pesquisadas em [inicio, fim), opcionalmente só as de retirada em [inicio_retirada, fim_retirada)."""
+        df = self.dados.base(COLUNAS_POR_PAGINA['movimentacao'])
+        if inicio == inicio.normalize() and fim - inicio == pd.Timedelta(days=1):
+            # Um dia inteiro (o caso da página): só a fatia daquele dia é filtrada
+            df = df.iloc[self.indice_movimentacao()['posicoes'].get(inicio, [])]
+            mascara = np.ones(len(df), dtype=bool)
+        else:
+            mascara = (df['DATA_HORA'] >= inicio) & (df['DATA_HORA'] < fim)
+        if inicio_retirada is not None:
+            mascara &= (df['RETIRADA'] >= inicio_retirada) & (df['RETIRADA'] < fim_retirada)
+        return df[mascara]
+
+    # --- ÍNDICE POR DIA DA MOVIMENTAÇÃO POR HORÁRIO ---
+    # Montado uma vez por snapshot: as posições das linhas de cada dia de pesquisa e as opções
+    # dos dropdowns (facetas) de cada (dia de pesquisa, dia de retirada) e de cada dia com
+    # qualquer retirada. Trocar um dropdown filtra só a fatia do dia, e as opções são um lookup.
+    def indice_movimentacao(self):
+        return self.dados.derivado('indice_movimentacao', self._construir_indice_movimentacao)
+
+    def _construir_indice_movimentacao(self):
+        df = self.dados.base(COLUNAS_POR_PAGINA['movimentacao'])
+        chaves = pd.DataFrame({'DIA': df['DATA_HORA'].dt.normalize(), 'RETIRADA_DIA': df['RETIRADA'].dt.normalize()})
+        facetas = {}
+        for coluna in COLUNAS_FACETAS_MOVIMENTACAO:
+            if coluna not in df.columns:
+                continue
+            pares = chaves.assign(VALOR=df[coluna]).dropna(subset=['VALOR']).drop_duplicates()
+            for dia, valores in pares.groupby('DIA')['VALOR']:
+                facetas.setdefault((dia, None), {})[coluna] = sorted(valores.unique())
+            for (dia, retirada), valores in pares.groupby(['DIA', 'RETIRADA_DIA'])['VALOR']:
+                facetas.setdefault((dia, retirada), {})[coluna] = sorted(valores.unique())
+        return {'posicoes': chaves.groupby('DIA').indices, 'facetas': facetas}
+
+    def facetas_movimentacao(self, dia, retirada=None):
+        """Opções de LOCALIDADE/LOCADORA/CATEGORIA/DURAÇÃO das linhas do dia (e da retirada, se dada)."""
+        facetas = self.indice_movimentacao()['facetas'].get((dia, retirada), {})
+        return {coluna: facetas.get(coluna, []) for coluna in COLUNAS_FACETAS_MOVIMENTACAO}
+
+    def mudancas_de_preco(self):
+        """Tabela de eventos de `detectar_mudancas_de_preco` do snapshot (derivado)."""
+        return self.dados.derivado('mudancas_preco', lambda: detectar_mudancas_de_preco(
+            self.dados.base(['DATA_HORA', 'PREÇO'] + CHAVES_SERIE_PRECO)))
+
+    def maiores_mudancas(self, dia, retirada=None, filtros=None, limite=MAIORES_MUDANCAS):
+        """Maiores mudanças de preço do dia (e da retirada, se dada); `filtros` é coluna -> valores aceitos."""
+        eventos = self.mudancas_de_preco()
+        posicoes = self.dados.derivado('mudancas_preco_por_dia', lambda: eventos.groupby('DIA').indices)
+        eventos = eventos.iloc[posicoes.get(dia, [])]
+        if retirada is not None:
+            eventos = eventos[eventos['RETIRADA'].dt.normalize() == retirada]
+        for coluna, valores in (filtros or {}).items():
+            if valores and coluna in eventos.columns:
+                eventos = eventos[eventos[coluna].isin(valores)]
+        return ordenar_maiores_mudancas(eventos, limite)
+
+    def memoria(self):
+        """{componente: bytes} da memória do backend fora dos DataFrames do snapshot (nenhuma no pandas)."""
+        return {}
+
+    def valores_distintos(self, coluna):
+        if coluna not in self.dados.colunas_base:
+            return []
+        return sorted(self.dados.coluna(coluna).dropna().unique())
+
+    def intervalo(self, coluna):
+        """(mínimo, máximo) da coluna de data, ou (None, None) sem dados."""
+        serie = self.dados.coluna(coluna)
+        if serie.empty:
+            return None, None
+        return serie.min(), serie.max()
+
+def identificador_sql(nome):
+    return '"' + nome.replace('"', '""') + '"'
+
+def literal_sql(texto):
+    return "'" + texto.replace("'", "''") + "'"
+
+class ConsultasDuckDB(ConsultasPandas):
+    """
+    As mesmas consultas em SQL (DuckDB) sobre os arquivos parquet. A limpeza de `limpar_colunas`
+    vira a view `base`; o comparativo (pequeno, gerado a partir de dois planos por localidade)
+    continua no pandas e é herdado da implementação padrão.
+    """
+    nome = 'duckdb'
+    # Cada linha da base vista como uma tabela de ofertas (ver _sql_menores_precos) de uma linha só
+    OFERTAS_DA_BASE = ("(SELECT *, \"LOCADORA\" AS VENCEDORA, \"PREÇO\" AS MENOR_PRECO, "
+                       "CASE WHEN \"LOCADORA\" = 'Foco' THEN \"PREÇO\" END AS MENOR_PRECO_FOCO, "
+                       "CAST(NULL AS FLOAT) AS SEGUNDO_MENOR_PRECO, 1 AS LINHAS FROM base)")
+
+    def __init__(self, dados):
+        super().__init__(dados)
+        self._conexoes_herdadas = []
+        self._conectar()
+        self._colunas_exibidas = [COLUNAS_RENOMEADAS_TABELA.get(c, c) for c in self._tipos if not c.startswith('_')]
+
+    def _conectar(self):
+        """Abre a conexão deste processo com a view `base`; as tabelas materializadas são refeitas sob demanda."""
+        import duckdb
+        self._lock_tabelas = threading.Lock()
+        self._tabelas_materializadas = set()
+        configuracao = {}
+        if os.environ.get('SEA_DASH_DUCKDB_MEMORIA'):
+            configuracao['memory_limit'] = os.environ['SEA_DASH_DUCKDB_MEMORIA']
+        self._conexao = duckdb.connect(config=configuracao)
+        self._conexao.execute(f"CREATE VIEW base AS {self._sql_base()}")
+        self._tipos = {nome: tipo for nome, tipo, *_ in self._conexao.execute("DESCRIBE base").fetchall()}
+        self._pid = os.getpid()
+
+    @property
+    def conexao(self):
+        """
+        Conexão do processo atual. Um job em segundo plano (fork do worker) não usa a conexão herdada,
+        cujas threads internas não existem no filho: abre a própria na primeira consulta. A herdada fica
+        referenciada, sem fechar, para que o destrutor não rode no filho.
+        """
+        if self._pid != os.getpid():
+            self._conexoes_herdadas.append(self._conexao)
+            self._conectar()
+        return self._conexao
+
+    def _sql_base(self):
+        caminho = self.dados.caminho
+        if os.path.isdir(caminho):
+            origem = (f"read_parquet({literal_sql(os.path.join(caminho, '**', '*.parquet'))}, hive_partitioning = true, "
+                      f"hive_types_autocast = false, filename = true, file_row_number = true)")
+        else:
+            origem = f"read_parquet({literal_sql(caminho)}, filename = true, file_row_number = true)"
+
+        # O DuckDB renomeia colunas repetidas sem diferenciar maiúsculas (Locadora -> Locadora_1);
+        # os nomes reais e a ordem original vêm do esquema do dataset
+        nomes_duckdb = [linha[0] for linha in self._conexao.execute(f"DESCRIBE SELECT * FROM {origem}").fetchall()
+                        if linha[0] not in ('filename', 'file_row_number')]
+        nomes_reais = self.dados.dataset.schema.names
+        if len(nomes_reais) != len(nomes_duckdb):
+            nomes_reais = nomes_duckdb
+        ordem = [c['name'] for c in (self.dados.dataset.schema.pandas_metadata or {}).get('columns', [])]
+        pares = list(zip(nomes_duckdb, nomes_reais))
+        if set(ordem) >= set(nomes_reais):
+            pares.sort(key=lambda par: ordem.index(par[1]))
+
+        referencias = {}
+        for nome_duckdb, nome_real in pares:
+            referencias.setdefault(nome_real.upper(), identificador_sql(nome_duckdb))
+
+        selecao = []
+        for coluna, referencia in referencias.items():
+            if coluna == 'DATA':
+                if 'HORA' in referencias:
+                    expressao = (f"TRY_CAST(strftime(CAST({referencia} AS DATE), '%Y-%m-%d') || ' ' || "
+                                 f"CAST({referencias['HORA']} AS VARCHAR) AS TIMESTAMP)")
+                else:
+                    expressao = f"TRY_CAST({referencia} AS TIMESTAMP)"
+                coluna = 'DATA_HORA'
+            elif coluna == 'RETIRADA':
+                expressao = f"TRY_CAST({referencia} AS TIMESTAMP)"
+            elif coluna == 'PREÇO':
+                expressao = f"TRY_CAST({referencia} AS FLOAT)"
             else:
-                df_tabela[col] = df_tabela[col].dt.strftime('%Y-%m-%d')
-    print(f"Total de {len(df)} linhas após a limpeza.")
-else:
-    print("Dashboard iniciado com dados de exemplo.")
-    cols = ['LOCALIDADE', 'RETIRADA', 'CRIAÇÃO', 'DURAÇÃO', 'MODELO', 'PREÇO', 'LOCADORA', 'PLANO', 'HORA', 'OTA', 'CAMBIO', 'CATEGORIA', 'DATA_HORA']
-    df = pd.DataFrame(columns=cols).astype({'RETIRADA': 'datetime64[ns]', 'DATA_HORA': 'datetime64[ns]'})
-    df_calculos = df.copy()
-    df_tabela = df.copy()
-    df_tabela.rename(columns={'DATA_HORA': 'DATA'}, inplace=True)
+                expressao = referencia
+            selecao.append(f"{expressao} AS {identificador_sql(coluna)}")
+        selecao += ["filename AS _arquivo", "file_row_number AS _linha"]
+
+        obrigatorias = [c for c in ('PREÇO', 'DATA_HORA', 'RETIRADA', 'LOCALIDADE', 'LOCADORA', 'CATEGORIA')
+                        if c in referencias or (c == 'DATA_HORA' and 'DATA' in referencias)]
+        condicoes = [f"{identificador_sql(c)} IS NOT NULL" for c in obrigatorias]
+        if 'PREÇO' in referencias:
+            condicoes.append('NOT isnan("PREÇO")')
+        corte = self.dados.corte_historico()
+        if corte is not None:
+            condicoes.append(f'"PLANO" >= {literal_sql(corte)}')
+        return f"SELECT * FROM (SELECT {', '.join(selecao)} FROM {origem}) WHERE {' AND '.join(condicoes) or 'TRUE'}"
+
+    def _consultar(self, sql, parametros=()):
+        # Um cursor por consulta: conexões filhas do DuckDB podem ser usadas em paralelo pelas threads
+        return self.conexao.cursor().execute(sql, list(parametros))
+
+    def _texto(self, coluna):
+        """Expressão SQL do texto exibido na tabela Base para `coluna` (o mesmo comparado pelos filtros)."""
+        original = RENOMEAR_BASE.get(coluna, coluna)
+        if self._tipos[original].startswith(('TIMESTAMP', 'DATE')):
+            return f"strftime({identificador_sql(original)}, {literal_sql(FORMATOS_DATA_TABELA.get(coluna, '%Y-%m-%d'))})"
+        return f"CAST({identificador_sql(original)} AS VARCHAR)"
+
+    def _valores_busca(self):
+        valores = {}
+        for coluna, tipo in self._tipos.items():
+            if tipo == 'VARCHAR' and not coluna.startswith('_'):
+                linhas = self._consultar(f"SELECT DISTINCT {identificador_sql(coluna)} FROM base WHERE {identificador_sql(coluna)} IS NOT NULL").fetchall()
+                valores[coluna] = sorted(valor for (valor,) in linhas)
+        return valores
+
+    def _condicoes_busca(self, termo):
+        condicoes, parametros = [], []
+        for palavra in termo.split():
+            encontrados = self.indice_busca().buscar(palavra)
+            if not encontrados:
+                condicoes.append('FALSE')
+                continue
+            condicoes.append('(' + ' OR '.join(f"{identificador_sql(coluna)} IN ({', '.join('?' * len(valores))})"
+                                               for coluna, valores in encontrados.items()) + ')')
+            parametros += [valor for valores in encontrados.values() for valor in valores]
+        return condicoes, parametros
+
+    def _condicoes(self, filtros, exceto=None):
+        condicoes, parametros = [], []
+        for coluna, valores in filtros.items():
+            if coluna == FILTRO_BUSCA:
+                if valores and coluna != exceto:
+                    condicoes_busca, parametros_busca = self._condicoes_busca(' '.join(valores))
+                    condicoes += condicoes_busca
+                    parametros += parametros_busca
+                continue
+            if coluna == exceto or RENOMEAR_BASE.get(coluna, coluna) not in self._tipos:
+                continue
+            if not valores:
+                condicoes.append('FALSE')
+                continue
+            condicoes.append(f"COALESCE({self._texto(coluna)}, 'nan') IN ({', '.join('?' * len(valores))})")
+            parametros += [str(v) for v in valores]
+        return condicoes, parametros
+
+    @staticmethod
+    def _where(condicoes):
+        return f" WHERE {' AND '.join(condicoes)}" if condicoes else ''
+
+    def colunas(self, visao):
+        if visao != 'base':
+            return super().colunas(visao)
+        return list(self._colunas_exibidas)
+
+    def vazia(self, visao):
+        if visao != 'base':
+            return super().vazia(visao)
+        return self.dados.derivado('duckdb_vazia', lambda: self._consultar("SELECT 1 FROM base LIMIT 1").fetchone() is None)
+
+    def opcoes_filtros(self, visao, colunas, filtros_ativos):
+        if visao != 'base':
+            return super().opcoes_filtros(visao, colunas, filtros_ativos)
+        opcoes = {}
+        for coluna in colunas:
+            condicoes, parametros = self._condicoes(filtros_ativos, exceto=coluna)
+            texto = self._texto(coluna)
+            linhas = self._consultar(f"SELECT DISTINCT {texto} FROM base{self._where(condicoes + [f'{texto} IS NOT NULL'])}", parametros).fetchall()
+            opcoes[coluna] = sorted(valor for (valor,) in linhas)
+        return opcoes
+
+    def contar(self, visao, filtros):
+        if visao != 'base':
+            return super().contar(visao, filtros)
+        condicoes, parametros = self._condicoes(filtros)
+        return self._consultar(f"SELECT count(*) FROM base{self._where(condicoes)}", parametros).fetchone()[0]
+
+    def pagina(self, visao, filtros, inicio, fim, ordenacao=None, formatado=True):
+        if visao != 'base':
+            return super().pagina(visao, filtros, inicio, fim, ordenacao, formatado)
+        condicoes, parametros = self._condicoes(filtros)
+        selecao = ', '.join(f"{self._texto(c) if formatado and self._tipos[RENOMEAR_BASE.get(c, c)].startswith(('TIMESTAMP', 'DATE')) else identificador_sql(RENOMEAR_BASE.get(c, c))} "
+                            f"AS {identificador_sql(c)}" for c in self._colunas_exibidas)
+        ordem = ''
+        if ordenacao and ordenacao.get('coluna') in self._colunas_exibidas:
+            # Empates e nulos como no backend pandas: ordem estável do arquivo, vazios no fim
+            original = f"base.{identificador_sql(RENOMEAR_BASE.get(ordenacao['coluna'], ordenacao['coluna']))}"
+            ordem = f" ORDER BY {original} {'ASC' if ordenacao.get('crescente', True) else 'DESC'} NULLS LAST, _arquivo, _linha"
+        sql = f"SELECT {selecao} FROM base{self._where(condicoes)}{ordem} LIMIT ? OFFSET ?"
+        return self._consultar(sql, parametros + [fim - inicio, inicio]).fetchdf()
+
+    def blocos(self, visao, filtros, linhas_por_bloco):
+        if visao != 'base':
+            yield from super().blocos(visao, filtros, linhas_por_bloco)
+            return
+        condicoes, parametros = self._condicoes(filtros)
+        selecao = ', '.join(f"{identificador_sql(RENOMEAR_BASE.get(c, c))} AS {identificador_sql(c)}" for c in self._colunas_exibidas)
+        leitor = self._consultar(f"SELECT {selecao} FROM base{self._where(condicoes)}", parametros).fetch_record_batch(linhas_por_bloco)
+        vazio = True
+        for lote in leitor:
+            vazio = False
+            yield lote.to_pandas()
+        if vazio:
+            yield leitor.schema.empty_table().to_pandas()
+
+    def _sql_menores_precos(self, origem, expressoes, where=''):
+        """
+        Agregado de menores preços por `expressoes` ({chave: expressão SQL}) sobre `origem`, uma tabela
+        de ofertas (VENCEDORA, MENOR_PRECO, ...). Uma linha da base é a oferta de uma única linha.
+        """
+        selecao_chaves = ', '.join(f"{expressao} AS {identificador_sql(c)}" for c, expressao in expressoes.items())
+        lista_chaves = ', '.join(identificador_sql(c) for c in expressoes)
+        return f"""
+            WITH filtradas AS (
+                SELECT {selecao_chaves}, VENCEDORA, MENOR_PRECO, MENOR_PRECO_FOCO, SEGUNDO_MENOR_PRECO, LINHAS, _arquivo, _linha
+                FROM {origem}{where}
+            ), ordenadas AS (
+                SELECT *, min(MENOR_PRECO) OVER (PARTITION BY {lista_chaves}) AS menor,
+                       row_number() OVER (PARTITION BY {lista_chaves} ORDER BY MENOR_PRECO, _arquivo, _linha) AS posicao
+                FROM filtradas
+            )
+            SELECT {lista_chaves},
+                   any_value(VENCEDORA) FILTER (WHERE posicao = 1) AS VENCEDORA,
+                   min(MENOR_PRECO) AS MENOR_PRECO,
+                   min(MENOR_PRECO_FOCO) AS MENOR_PRECO_FOCO,
+                   min(CASE WHEN MENOR_PRECO > menor THEN MENOR_PRECO ELSE SEGUNDO_MENOR_PRECO END) AS SEGUNDO_MENOR_PRECO,
+                   any_value(_arquivo) FILTER (WHERE posicao = 1) AS _arquivo,
+                   any_value(_linha) FILTER (WHERE posicao = 1) AS _linha,
+                   CAST(sum(LINHAS) AS BIGINT) AS LINHAS
+            FROM ordenadas GROUP BY {lista_chaves}
+        """
+
+    def _materializar(self, nome, sql):
+        """Cria a tabela `nome` na conexão a partir de `sql` (uma vez por snapshot e processo) e retorna o nome."""
+        conexao = self.conexao
+        with self._lock_tabelas:
+            if nome not in self._tabelas_materializadas:
+                inicio = time.perf_counter()
+                conexao.execute(f"CREATE TABLE {nome} AS {sql}")
+                self.dados.tempos[nome] = time.perf_counter() - inicio
+                self._tabelas_materializadas.add(nome)
+        return nome
+
+    def _tabela_menores_ofertas(self):
+        """Materializa a tabela menores_ofertas na conexão (uma vez) e retorna o nome dela."""
+        expressoes = {c: identificador_sql(c) for c in GRAO_MENORES_OFERTAS}
+        # Ordenada pelo grão: os filtros por PLANO pulam os blocos de outros planos (zonemaps)
+        return self._materializar('menores_ofertas', f"SELECT * FROM ({self._sql_menores_precos(self.OFERTAS_DA_BASE, expressoes)}) "
+                                                     f"ORDER BY {', '.join(expressoes.values())}")
+
+    def menores_ofertas(self, planos=None):
+        tabela = self._tabela_menores_ofertas()
+        condicoes, planos = ([], []) if planos is None else ([f"\"PLANO\" IN ({', '.join('?' * len(planos)) or 'NULL'})"], list(planos))
+        colunas = ', '.join(identificador_sql(c) for c in GRAO_MENORES_OFERTAS)
+        sql = (f"SELECT {colunas}, VENCEDORA, MENOR_PRECO, MENOR_PRECO_FOCO, SEGUNDO_MENOR_PRECO, LINHAS "
+               f"FROM {tabela}{self._where(condicoes)} ORDER BY {colunas}")
+        return self._consultar(sql, planos).fetchdf()
+
+    def menores_precos(self, filtros, chaves):
+        condicoes, parametros = self._condicoes(filtros)
+        # RETIRADA agrupa pelo dia, como no backend pandas
+        expressoes = {c: 'CAST("RETIRADA" AS DATE)' if c == 'RETIRADA' else identificador_sql(c) for c in chaves}
+        if self.consolida_menores_ofertas(filtros, chaves):
+            origem = self._tabela_menores_ofertas()
+        else:
+            origem = self.OFERTAS_DA_BASE
+        lista_chaves = ', '.join(identificador_sql(c) for c in chaves)
+        sql = f"SELECT * EXCLUDE (_arquivo, _linha) FROM ({self._sql_menores_precos(origem, expressoes, self._where(condicoes))}) ORDER BY {lista_chaves}"
+        agregado = self._consultar(sql, parametros).fetchdf()
+        if agregado.empty:
+            return 0, None
+        linhas = int(agregado.pop('LINHAS').sum())
+        return linhas, agregado.set_index(list(chaves))
+
+    def resumo_dashboard(self, localidades, locadoras):
+        def condicao(coluna, valores):
+            return ([f"{identificador_sql(coluna)} IN ({', '.join('?' * len(valores))})"], list(valores)) if valores else ([], [])
+        cond_localidade, param_localidade = condicao('LOCALIDADE', localidades)
+        cond_locadora, param_locadora = condicao('LOCADORA', locadoras)
+        where, parametros = self._where(cond_localidade + cond_locadora), param_localidade + param_locadora
+
+        def distintos(coluna, condicoes, params):
+            linhas = self._consultar(f"SELECT DISTINCT {identificador_sql(coluna)} FROM base{self._where(condicoes)}", params).fetchall()
+            return sorted(valor for (valor,) in linhas)
+
+        total, preco_medio, num_locadoras = self._consultar(
+            f'SELECT count(*), avg("PREÇO"), count(DISTINCT "LOCADORA") FROM base{where}', parametros).fetchone()
+        return {
+            'opcoes_localidade': distintos('LOCALIDADE', cond_locadora, param_locadora),
+            'opcoes_locadora': distintos('LOCADORA', cond_localidade, param_localidade),
+            'total': total,
+            'preco_medio': preco_medio,
+            'num_locadoras': num_locadoras,
+            'preco_por_locadora': self._consultar(
+                f'SELECT "LOCADORA", CAST(avg("PREÇO") AS FLOAT) AS "PREÇO" FROM base{where} GROUP BY 1 ORDER BY 2 DESC', parametros).fetchdf(),
+            # Ordem de primeira aparição, como no groupby(sort=False) do pandas
+            'contagem_categoria': self._consultar(
+                f'SELECT "CATEGORIA", count(*) AS QUANTIDADE FROM base{where} GROUP BY 1 '
+                f'ORDER BY min(struct_pack(a := _arquivo, l := _linha))', parametros).fetchdf(),
+            'preco_por_dia': self._consultar(
+                f'SELECT CAST("DATA_HORA" AS DATE) AS "DATA_HORA", CAST(avg("PREÇO") AS FLOAT) AS "PREÇO" FROM base{where} GROUP BY 1 ORDER BY 1',
+                parametros).fetchdf().assign(DATA_HORA=lambda d: d['DATA_HORA'].dt.date),
+        }
+
+    def linhas_movimentacao(self, inicio, fim, inicio_retirada=None, fim_retirada=None):
+        condicoes, parametros = ['"DATA_HORA" >= ?', '"DATA_HORA" < ?'], [inicio.to_pydatetime(), fim.to_pydatetime()]
+        if inicio_retirada is not None:
+            condicoes += ['"RETIRADA" >= ?', '"RETIRADA" < ?']
+            parametros += [inicio_retirada.to_pydatetime(), fim_retirada.to_pydatetime()]
+        colunas = ', '.join(identificador_sql(c) for c in COLUNAS_POR_PAGINA['movimentacao'] if c in self._tipos)
+        return self._consultar(f"SELECT {colunas} FROM base{self._where(condicoes)}", parametros).fetchdf()
+
+    def facetas_movimentacao(self, dia, retirada=None):
+        facetas = self.dados.derivado('facetas_movimentacao', self._consultar_facetas).get((dia, retirada), {})
+        return {coluna: facetas.get(coluna, []) for coluna in COLUNAS_FACETAS_MOVIMENTACAO}
+
+    def _consultar_facetas(self):
+        """Facetas de todos os (dia, retirada) e de cada dia com qualquer retirada, em uma única varredura."""
+        colunas = [coluna for coluna in COLUNAS_FACETAS_MOVIMENTACAO if coluna in self._tipos]
+        if not colunas or not {'DATA_HORA', 'RETIRADA'} <= set(self._tipos):
+            return {}
+        selecao = ', '.join(f"list(DISTINCT {identificador_sql(c)}) FILTER (WHERE {identificador_sql(c)} IS NOT NULL)" for c in colunas)
+        linhas = self._consultar(
+            f'SELECT CAST("DATA_HORA" AS DATE) AS dia, CAST("RETIRADA" AS DATE) AS retirada, {selecao} FROM base '
+            f'GROUP BY GROUPING SETS ((dia, retirada), (dia))').fetchall()
+        return {(pd.Timestamp(dia), pd.Timestamp(retirada) if retirada is not None else None):
+                {coluna: sorted(valores) for coluna, valores in zip(colunas, listas)}
+                for dia, retirada, *listas in linhas}
+
+    def _tabela_mudancas_de_preco(self):
+        """Materializa a tabela de eventos de `detectar_mudancas_de_preco` (LAG por série e dia)."""
+        chaves = ', '.join(identificador_sql(c) for c in CHAVES_SERIE_PRECO if c in self._tipos)
+        return self._materializar('mudancas_preco', f"""
+            WITH precos AS (
+                SELECT {chaves}, "DATA_HORA", CAST("DATA_HORA" AS DATE) AS DIA, min("PREÇO") AS "PREÇO"
+                FROM base GROUP BY ALL
+            ), series AS (
+                SELECT *, lag("DATA_HORA") OVER serie AS DATA_HORA_ANTERIOR, lag("PREÇO") OVER serie AS PRECO_ANTERIOR
+                FROM precos WINDOW serie AS (PARTITION BY {chaves}, DIA ORDER BY "DATA_HORA")
+            )
+            SELECT *, "PREÇO" - PRECO_ANTERIOR AS VARIACAO, ("PREÇO" - PRECO_ANTERIOR) / PRECO_ANTERIOR AS VARIACAO_PCT
+            FROM series WHERE "PREÇO" <> PRECO_ANTERIOR ORDER BY "DATA_HORA", {chaves}
+        """)
+
+    def mudancas_de_preco(self):
+        return self._consultar(f"SELECT * FROM {self._tabela_mudancas_de_preco()}").fetchdf()
+
+    def maiores_mudancas(self, dia, retirada=None, filtros=None, limite=MAIORES_MUDANCAS):
+        tabela = self._tabela_mudancas_de_preco()
+        condicoes, parametros = ['DIA = CAST(? AS DATE)'], [dia.to_pydatetime()]
+        if retirada is not None:
+            condicoes.append('CAST("RETIRADA" AS DATE) = CAST(? AS DATE)')
+            parametros.append(retirada.to_pydatetime())
+        for coluna, valores in (filtros or {}).items():
+            if valores and coluna in self._tipos:
+                condicoes.append(f"{identificador_sql(coluna)} IN ({', '.join('?' * len(valores))})")
+                parametros += list(valores)
+        chaves = ', '.join(identificador_sql(c) for c in CHAVES_SERIE_PRECO if c in self._tipos)
+        return self._consultar(f"SELECT * FROM {tabela}{self._where(condicoes)} "
+                               f"ORDER BY abs(VARIACAO_PCT) DESC, \"DATA_HORA\", {chaves} LIMIT ?", parametros + [limite]).fetchdf()
+
+    def memoria(self):
+        linhas = self._consultar("SELECT tag, memory_usage_bytes FROM duckdb_memory() WHERE memory_usage_bytes > 0").fetchall()
+        return {f"DuckDB: {tag}": int(total) for tag, total in linhas}
+
+    def valores_distintos(self, coluna):
+        if coluna not in self._tipos:
+            return []
+        linhas = self._consultar(f"SELECT DISTINCT {identificador_sql(coluna)} FROM base WHERE {identificador_sql(coluna)} IS NOT NULL").fetchall()
+        return sorted(valor for (valor,) in linhas)
+
+    def intervalo(self, coluna):
+        minimo, maximo = self._consultar(f"SELECT min({identificador_sql(coluna)}), max({identificador_sql(coluna)}) FROM base").fetchone()
+        return (pd.Timestamp(minimo), pd.Timestamp(maximo)) if minimo is not None else (None, None)
+
+def criar_consultas(dados):
+    """Camada de consultas do snapshot conforme SEA_DASH_BACKEND (cai para o pandas se o DuckDB falhar)."""
+    if BACKEND_CONSULTAS == 'duckdb':
+        try:
+            return ConsultasDuckDB(dados)
+        except Exception as e:
+            print(f"ERRO ao preparar o backend DuckDB ({e}); usando o backend pandas.")
+    return ConsultasPandas(dados)
+
+def fechar_conexoes():
+    """
+    Fecha o pool do PostgreSQL e a conexão DuckDB do snapshot atual. O gunicorn chama esta função
+    no processo mestre antes de cada fork (gunicorn.conf.py): sockets e threads dessas conexões
+    não podem ser herdados pelos workers, que abrem as suas na primeira consulta. Os DataFrames
+    do snapshot pré-carregado continuam compartilhados.
+    """
+    fechar_pool_db()
+    if _dados_atuais is not None and BACKEND_CONSULTAS == 'duckdb':
+        _dados_atuais.descartar('consultas')
+
+# --- FORK DOS JOBS EM SEGUNDO PLANO ---
+# Os jobs dos callbacks em segundo plano (DiskcacheManager) são processos criados por fork a partir
+# de um worker com várias threads, e no filho só a thread que chamou o fork continua. Um lock que
+# outra thread segurava naquele instante (uma construção de derivado, o aquecimento de uma recarga
+# a quente) ficaria preso para sempre no job. O filho recomeça com locks novos; o pool do
+# PostgreSQL é abandonado sem fechar (os sockets são do pai) e o DuckDB reabre sob demanda.
+def _reiniciar_locks_apos_fork():
+    global _lock_dados, _lock_layouts, _lock_pool_db, _pool_db
+    _lock_dados = threading.Lock()
+    _lock_layouts = threading.Lock()
+    _lock_pool_db = threading.Lock()
+    _pool_db = None
+    for histograma in (HIST_CALLBACK_DURACAO, HIST_CALLBACK_PAYLOAD, HIST_CALLBACK_LINHAS, HIST_DB_DURACAO):
+        histograma._lock = threading.Lock()
+    if _dados_atuais is not None:
+        _dados_atuais.reiniciar_locks()
+
+os.register_at_fork(after_in_child=_reiniciar_locks_apos_fork)
+
+if PRECARREGAR_DADOS:
+    obter_dados().precarregar()
+registrar_tempo_startup('dados')
 
 # ==============================================================================
 # 4. INICIALIZAÇÃO E ESTILO DO APP (SEU CÓDIGO ORIGINAL)
@@ -327,8 +1840,207 @@ CUSTOM_CSS = """
 """
 encoded_css = urllib.parse.quote(CUSTOM_CSS)
 css_data_uri = f"data:text/css;charset=utf-8,{encoded_css}"
+
+# --- CALLBACKS EM SEGUNDO PLANO (DISKCACHE) ---
+# As matrizes de posicionamento podem levar dezenas de segundos em filtros amplos.
+# Com um gerenciador de jobs local, esses callbacks rodam em processos separados e
+# o worker do gunicorn fica livre para atender outros usuários enquanto isso.
+# Defina SEA_DASH_BACKGROUND_CALLBACKS=0 para voltar ao modo síncrono.
+background_callback_manager = None
+if os.environ.get('SEA_DASH_BACKGROUND_CALLBACKS', '1') == '1':
+    try:
+        import diskcache
+        cache_dir = os.environ.get('SEA_DASH_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'sea-dash-cache'))
+        background_callback_manager = dash.DiskcacheManager(diskcache.Cache(cache_dir))
+        print(f"Callbacks em segundo plano habilitados (cache em '{cache_dir}').")
+    except ImportError:
+        print("AVISO: 'diskcache' não está instalado; callbacks pesados rodarão de forma síncrona.")
+
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP, css_data_uri], suppress_callback_exceptions=True)
 server = app.server
+registrar_tempo_startup('app_dash')
+
+# --- COMPRESSÃO DAS RESPOSTAS (GZIP/BROTLI) ---
+# As respostas dos callbacks (popovers com listas completas de opções, tabelas das
+# matrizes e figuras do Plotly) e o layout/assets são JSON/texto bem compressíveis.
+# SEA_DASH_COMPRESS=0 desliga; tamanho mínimo e níveis são configuráveis por ambiente.
+if os.environ.get('SEA_DASH_COMPRESS', '1') == '1':
+    try:
+        from flask_compress import Compress
+        server.config.update(
+            COMPRESS_MIMETYPES=['text/html', 'text/css', 'text/javascript', 'application/javascript', 'application/json'],
+            COMPRESS_ALGORITHM=['br', 'gzip'],
+            COMPRESS_MIN_SIZE=int(os.environ.get('SEA_DASH_COMPRESS_MIN_SIZE', 500)),
+            COMPRESS_LEVEL=int(os.environ.get('SEA_DASH_COMPRESS_LEVEL', 6)),
+            COMPRESS_BR_LEVEL=int(os.environ.get('SEA_DASH_COMPRESS_BR_LEVEL', 4)),
+        )
+        Compress(server)
+    except ImportError:
+        print("AVISO: 'flask-compress' não está instalado; respostas serão enviadas sem compressão.")
+
+# --- SESSÃO DO FLASK (AUTENTICAÇÃO DAS PÁGINAS E DAS ROTAS HTTP) ---
+# O login grava usuário e perfil no cookie de sessão assinado do Flask, e é ele que decide o
+# acesso em todo o app: o roteamento das páginas, as páginas de admin e as rotas HTTP
+# (/exportar, /api/dados, /metrics). O 'session-store' do navegador só acompanha a interface.
+# Consumidores automatizados das rotas HTTP usam um dos tokens de SEA_DASH_API_TOKENS
+# (separados por vírgula) no cabeçalho "Authorization: Bearer <token>".
+# Com vários workers sem --preload, defina SECRET_KEY.
+server.secret_key = os.environ.get('SECRET_KEY')
+if not server.secret_key:
+    server.secret_key = os.urandom(32)
+    print("AVISO: SECRET_KEY não definida; usando chave aleatória (sessões não sobrevivem a reinícios).")
+API_TOKENS = {token.strip() for token in os.environ.get('SEA_DASH_API_TOKENS', '').split(',') if token.strip()}
+
+def usuario_logado():
+    """Usuário e perfil da sessão do Flask ({'username', 'role'}), ou None se ninguém fez login."""
+    if not flask.session.get('username'):
+        return None
+    return {'username': flask.session['username'], 'role': flask.session.get('role', 'user')}
+
+def login_obrigatorio(func):
+    """Responde 401 a requisições sem usuário logado na sessão do Flask nem token de API válido."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        autorizacao = flask.request.headers.get('Authorization', '')
+        com_token = autorizacao.startswith('Bearer ') and autorizacao[len('Bearer '):] in API_TOKENS
+        if not com_token and usuario_logado() is None:
+            return flask.Response("Não autorizado\n", status=401, mimetype='text/plain')
+        return func(*args, **kwargs)
+    return wrapper
+
+# --- INSTRUMENTAÇÃO DOS CALLBACKS E ROTA /metrics ---
+_nomes_callbacks = {}
+
+def nome_do_callback(chave_output):
+    """Traduz a chave de saída enviada pelo renderer no nome da função do callback."""
+    if chave_output not in _nomes_callbacks:
+        definicao = app.callback_map.get(chave_output, {})
+        funcao = definicao.get('callback')
+        funcao = getattr(funcao, '__wrapped__', funcao)
+        _nomes_callbacks[chave_output] = getattr(funcao, '__name__', None) or chave_output
+    return _nomes_callbacks[chave_output]
+
+def resumir_estado_callback(corpo):
+    """Resumo compacto dos Inputs/States de um callback (listas longas viram contagens)."""
+    def resumir_valor(valor):
+        if isinstance(valor, list) and len(valor) > 10:
+            return f'<{len(valor)} valores>'
+        return valor
+
+    estado = {}
+    for item in (corpo.get('inputs') or []) + (corpo.get('state') or []):
+        for especificacao in (item if isinstance(item, list) else [item]):
+            id_componente = especificacao.get('id')
+            if isinstance(id_componente, dict):
+                id_componente = id_componente.get('index')
+            if especificacao.get('property') != 'id' and especificacao.get('value') is not None:
+                estado[f"{id_componente}.{especificacao.get('property')}"] = resumir_valor(especificacao.get('value'))
+    return json.dumps(estado, ensure_ascii=False, default=str)[:2000]
+
+# Callbacks síncronos são medidos pela requisição, que é o próprio cálculo. Nos callbacks em segundo
+# plano as requisições só disparam e consultam o job: o tempo deles é medido dentro do job (ver
+# callback_pesado) e chega ao worker por uma fila no diskcache, lida a cada coleta de /metrics.
+_callbacks_em_segundo_plano = set()
+PREFIXO_FILA_TEMPOS = 'sea-dash-tempos-callback'
+
+def enviar_tempo_em_segundo_plano(nome, duracao, status):
+    """Chamada no processo do job: deixa o tempo de cálculo na fila do diskcache (vale por um dia)."""
+    try:
+        background_callback_manager.handle.push((nome, duracao, status), prefix=PREFIXO_FILA_TEMPOS, expire=86400)
+    except Exception as e:
+        print(f"AVISO: tempo do callback '{nome}' não registrado: {e}")
+    if LIMITE_CALLBACK_LENTO_MS and duracao * 1000 >= LIMITE_CALLBACK_LENTO_MS:
+        print(f"[CALLBACK LENTO] {nome} (segundo plano): {duracao * 1000:.0f} ms")
+
+def coletar_tempos_em_segundo_plano():
+    """Passa para HIST_CALLBACK_DURACAO os tempos que os jobs deixaram na fila."""
+    if background_callback_manager is None:
+        return
+    while True:
+        chave, valor = background_callback_manager.handle.pull(prefix=PREFIXO_FILA_TEMPOS)
+        if chave is None:
+            return
+        nome, duracao, status = valor
+        HIST_CALLBACK_DURACAO.observar(duracao, callback=nome, status=status)
+
+@server.before_request
+def iniciar_medicao_callback():
+    if flask.request.path.endswith('/_dash-update-component'):
+        flask.g.inicio_callback = time.perf_counter()
+
+@server.after_request
+def registrar_medicao_callback(response):
+    inicio = flask.g.pop('inicio_callback', None)
+    if inicio is None:
+        return response
+
+    duracao = time.perf_counter() - inicio
+    corpo = flask.request.get_json(silent=True) or {}
+    nome = nome_do_callback(corpo.get('output', ''))
+    payload_bytes = 0 if response.is_streamed else len(response.get_data())
+    linhas = flask.g.pop('linhas_processadas', None)
+
+    em_segundo_plano = nome in _callbacks_em_segundo_plano
+    if not em_segundo_plano:
+        HIST_CALLBACK_DURACAO.observar(duracao, callback=nome, status=response.status_code)
+    HIST_CALLBACK_PAYLOAD.observar(payload_bytes, callback=nome)
+    if linhas is not None:
+        HIST_CALLBACK_LINHAS.observar(linhas, callback=nome)
+
+    if not em_segundo_plano and LIMITE_CALLBACK_LENTO_MS and duracao * 1000 >= LIMITE_CALLBACK_LENTO_MS:
+        rss = memoria_processo()
+        print(f"[CALLBACK LENTO] {nome}: {duracao * 1000:.0f} ms, {payload_bytes} bytes, "
+              f"linhas={linhas if linhas is not None else '-'}, rss={rss / 1024 ** 2 if rss else 0:.0f} MB, "
+              f"filtros={resumir_estado_callback(corpo)}")
+    return response
+
+@server.route('/metrics')
+def metrics():
+    com_token = METRICS_TOKEN and flask.request.headers.get('Authorization') == f'Bearer {METRICS_TOKEN}'
+    if not com_token and usuario_logado() is None:
+        return flask.Response("Não autorizado\n", status=401, mimetype='text/plain')
+
+    coletar_tempos_em_segundo_plano()
+    linhas = []
+    for histograma in (HIST_CALLBACK_DURACAO, HIST_CALLBACK_PAYLOAD, HIST_CALLBACK_LINHAS, HIST_DB_DURACAO):
+        linhas.extend(histograma.exportar())
+    rss = memoria_processo()
+    if rss is not None:
+        linhas += ['# HELP sea_dash_processo_rss_bytes Memória residente (RSS) do processo.',
+                   '# TYPE sea_dash_processo_rss_bytes gauge',
+                   f'sea_dash_processo_rss_bytes{{pid="{os.getpid()}"}} {rss}']
+    return flask.Response('\n'.join(linhas) + '\n', mimetype='text/plain; version=0.0.4')
+
+def callback_pesado(*dependencias, progress=None, cancel=None, running=None):
+    """
+    Registra um callback pesado como background callback quando há gerenciador
+    disponível, ou como callback síncrono comum caso contrário. A função decorada
+    sempre recebe `set_progress` como primeiro argumento (no modo síncrono ele não faz nada).
+    """
+    def decorator(func):
+        if background_callback_manager is not None:
+            @functools.wraps(func)
+            def medido(*args):
+                inicio, status = time.perf_counter(), 500
+                try:
+                    resultado = func(*args)
+                    status = 200
+                    return resultado
+                except dash.exceptions.PreventUpdate:
+                    status = 204
+                    raise
+                finally:
+                    enviar_tempo_em_segundo_plano(func.__name__, time.perf_counter() - inicio, status)
+            _callbacks_em_segundo_plano.add(func.__name__)
+            return app.callback(*dependencias, background=True, manager=background_callback_manager,
+                                progress=progress, cancel=cancel, running=running)(medido)
+
+        def callback_sincrono(*args):
+            return func(lambda *_: None, *args)
+        callback_sincrono.__name__ = func.__name__
+        app.callback(*dependencias)(callback_sincrono)
+        return func
+    return decorator
 
 # ==============================================================================
 # 5. DEFINIÇÃO DOS LAYOUTS E NAVEGAÇÃO
@@ -403,6 +2115,22 @@ layout_admin_logs = dbc.Container([
     )
 ], fluid=True)
 
+# --- LAYOUT DA SAÚDE DOS DADOS (ADMIN) ---
+layout_admin_dados = dbc.Container([
+    html.H1("Saúde dos Dados", className="text-center text-primary mb-4"),
+    html.P("Versão do arquivo, linhas por etapa da carga, tempos, memória e uso dos caches do snapshot atual "
+           "(medidos no processo que atendeu a requisição)."),
+    dbc.Button("Atualizar", id='btn-atualizar-saude', color="secondary", size="sm"),
+    html.Hr(),
+    dcc.Loading(
+        id="loading-saude",
+        type="circle",
+        children=[
+             html.Div(id='saude-dados-container', style={'overflowX': 'auto'})
+        ]
+    )
+], fluid=True)
+
 # --- SIDEBAR DINÂMICA (NOVA) ---
 def create_sidebar(user_role):
     SIDEBAR_STYLE = { "position": "fixed", "top": 0, "left": 0, "bottom": 0, "width": "18rem", "padding": "2rem 1rem", "background-color": "#2b2b2b", "border-right": "1px solid #444" }
@@ -417,6 +2145,7 @@ def create_sidebar(user_role):
     ]
     if user_role == 'admin':
         nav_links.append(dbc.NavLink("Logs de Acesso", href="/admin-logs", active="exact", className="text-warning font-weight-bold"))
+        nav_links.append(dbc.NavLink("Saúde dos Dados", href="/admin-dados", active="exact", className="text-warning font-weight-bold"))
 
     sidebar = html.Div([
         html.H2("SEA-DASH", className="display-6"), html.Hr(),
@@ -432,7 +2161,7 @@ def create_sidebar(user_role):
             ], size="sm", className="d-flex"),
             dbc.Button("Logout", id="logout-button", color="danger", className="w-100 mt-3"),
             html.Small(
-                f"Última Atualização: {last_update_string}",
+                f"Última Atualização: {obter_dados().last_update_string}",
                 style={'color': '#999', 'fontSize': '0.75rem', 'display': 'block', 'textAlign': 'center', 'marginTop': '10px'}
             )
         ], style={'position': 'absolute', 'bottom': '1rem', 'width': 'calc(100% - 2rem)'})
@@ -440,6 +2169,59 @@ def create_sidebar(user_role):
     return sidebar
 
 
+# --- BARRA DE PROGRESSO E CANCELAMENTO (CALLBACKS EM SEGUNDO PLANO) ---
+def criar_controles_progresso(page_prefix):
+    if background_callback_manager is None:
+        return []
+    return [dbc.Row([
+        dbc.Col(dbc.Progress(id=f'progress-{page_prefix}', value=0, striped=True, animated=True, style={'visibility': 'hidden'}), className="my-auto"),
+        dbc.Col(dbc.Button("Cancelar", id=f'btn-cancelar-{page_prefix}', color="danger", size="sm", disabled=True), width="auto"),
+    ], className="mb-3")]
+
+def argumentos_progresso(page_prefix):
+    return {
+        'progress': [Output(f'progress-{page_prefix}', 'value'), Output(f'progress-{page_prefix}', 'label')],
+        'cancel': [Input(f'btn-cancelar-{page_prefix}', 'n_clicks'), Input('url', 'pathname')],
+        'running': [
+            (Output(f'btn-cancelar-{page_prefix}', 'disabled'), False, True),
+            (Output(f'progress-{page_prefix}', 'style'), {'visibility': 'visible'}, {'visibility': 'hidden'}),
+        ],
+    }
+
+
+# --- EXPORTAÇÃO DA VISÃO FILTRADA ---
+def criar_formulario_exportacao(visao, page_prefix, parametros=()):
+    """
+    Botões de download da visão filtrada. O callback da tabela mantém os filtros ativos (e os
+    `parametros` extras da visão, em <parametro>-exportacao-<página>) nos campos ocultos e o
+    formulário os envia para /exportar/<visao>, que devolve o arquivo em streaming.
+    """
+    return html.Form([
+        dcc.Input(id=f'filtros-exportacao-{page_prefix}', type='hidden', name='filtros', value='{}'),
+        *[dcc.Input(id=f"{parametro.replace('_', '-')}-exportacao-{page_prefix}", type='hidden', name=parametro, value='')
+          for parametro in parametros],
+        dbc.Button("Exportar CSV", type='submit', name='formato', value='csv', color="secondary", className="me-2"),
+        dbc.Button("Exportar Parquet", type='submit', name='formato', value='parquet', color="secondary"),
+    ], action=app.get_relative_path(f'/exportar/{visao}'), method='POST', className="mb-3 ms-2 d-inline-block")
+
+# --- ORDENAÇÃO NO SERVIDOR ---
+# O popover de cada coluna ganha botões de ordenação; a escolha fica em store-ordenacao-<página>
+# ({'coluna': ..., 'crescente': ...}) e o callback da tabela pagina sobre a ordem pedida.
+def criar_botoes_ordenacao(page_prefix, coluna, ordenacao):
+    ativa = ordenacao if ordenacao and ordenacao.get('coluna') == coluna else None
+    return html.Div([
+        dbc.Button("▲ Crescente", id={'type': f'ordenar-{page_prefix}', 'index': coluna, 'sentido': 'asc'}, size="sm",
+                   color="primary" if ativa and ativa.get('crescente') else "secondary", className="me-1"),
+        dbc.Button("▼ Decrescente", id={'type': f'ordenar-{page_prefix}', 'index': coluna, 'sentido': 'desc'}, size="sm",
+                   color="primary" if ativa and not ativa.get('crescente') else "secondary"),
+    ], className="mb-2 d-flex")
+
+def rotulo_coluna_ordenada(coluna, ordenacao):
+    if ordenacao and ordenacao.get('coluna') == coluna:
+        return f"{coluna} {'▲' if ordenacao.get('crescente') else '▼'}"
+    return coluna
+
+
 # --- SEUS LAYOUTS ORIGINAIS (INTACTOS) ---
 def criar_cabecalho_de_filtros(df_para_filtros, page_prefix):
     if df_para_filtros.empty:
@@ -478,15 +2260,19 @@ def criar_cabecalho_de_filtros(df_para_filtros, page_prefix):
 
 layout_visao_geral = dbc.Container([
     dcc.Store(id='store-pagina-atual-geral', data=1),
+    dcc.Store(id='store-ordenacao-geral', data=None),
     html.H1("Base", className="text-center text-primary mb-4"),
     html.P("Clique nos cabeçalhos abaixo para filtrar os dados da tabela."),
     html.Hr(),
+    dbc.Input(id='busca-geral', type='search', debounce=True, className="mb-3",
+              placeholder="Buscar em todas as colunas de texto (ex.: onix gig10)"),
     dbc.Button(
         "Limpar Todos os Filtros",
         id="btn-limpar-filtros-geral",
         color="danger",
         className="mb-3"
     ),
+    criar_formulario_exportacao('base', 'geral'),
     html.Div([
         dcc.Loading(
             id="loading-geral",
@@ -509,60 +2295,94 @@ layout_visao_geral = dbc.Container([
 ], fluid=True)
 
 
-layout_comparativo = dbc.Container([
-    dcc.Store(id='store-pagina-atual-comp', data=1),
-    html.H1("Comparativo de Planos", className="text-center text-primary mb-4"),
-    html.P("Comparação do plano mais recente vs. o plano anterior para cada localidade. Clique nos cabeçalhos para filtrar."),
-    html.Hr(),
-    dbc.Button(
-        "Limpar Todos os Filtros",
-        id="btn-limpar-filtros-comp",
-        color="danger",
-        className="mb-3"
-    ),
-    html.Div([
-        dcc.Loading(
-            id="loading-comp",
-            type="circle",
-            children=[
-                html.Table([
-                    html.Thead(id='tabela-header-comp'),
-                    html.Tbody(id='tabela-body-comp')
-                ], className='custom-table')
-            ]
-        )], id='scrollable-container-comp', style={'overflowX': 'auto', 'width': f'{INVERSE_WIDTH:.2f}%'}),
-    dbc.Row([
-        dbc.Col(dbc.Button("<< Primeira", id="btn-primeira-comp", color="secondary"), width="auto"),
-        dbc.Col(dbc.Button("< Anterior", id="btn-anterior-comp", color="primary"), width="auto"),
-        dbc.Col(html.Div(id='texto-pagina-comp', style={'textAlign': 'center', 'padding': '0.5rem'}), width="auto"),
-        dbc.Col(dbc.Button("Próxima >", id="btn-proxima-comp", color="primary"), width="auto"),
-        dbc.Col(dbc.Button("Última >>", id="btn-ultima-comp", color="secondary"), width="auto"),
-    ], justify="center", align="center", className="mt-4"),
-    html.P("by Tiago Garcéa e Felipe Dias", style={"color": "gray", "font-size": "9pt", "margin-top": "20px"})
-], fluid=True)
-
-layout_dashboard = dbc.Container([
-    html.H1("Big Picture", className="text-center text-primary mb-4"),
-    html.Hr(),
-    dbc.Row([
-        dbc.Col([html.Label("Localidade (Loja):"),
-                 dcc.Dropdown(id='filtro-localidade', options=[{'label': i, 'value': i} for i in sorted(df['LOCALIDADE'].dropna().unique())], multi=True, placeholder="Selecione...")], width=6),
-        dbc.Col([html.Label("Locadora:"),
-                 dcc.Dropdown(id='filtro-locadora', options=[{'label': i, 'value': i} for i in sorted(df['LOCADORA'].dropna().unique())], multi=True, placeholder="Selecione...")], width=6)
-    ], className="mb-4"),
-    dbc.Row([
-        dbc.Col(dbc.Card(dbc.CardBody([html.H4("Preço Médio da Diária"), html.H2(id='kpi-preco-medio')]))),
-        dbc.Col(dbc.Card(dbc.CardBody([html.H4("Total de Pesquisas"), html.H2(id='kpi-total-pesquisas')]))),
-        dbc.Col(dbc.Card(dbc.CardBody([html.H4("Número de Locadoras"), html.H2(id='kpi-num-locadoras')]))),
-    ], className="mb-4 g-3"),
-    dbc.Row([
-        dbc.Col(dcc.Graph(id='grafico-preco-locadora'), width=8),
-        dbc.Col(dcc.Graph(id='grafico-dist-categoria'), width=4)
-    ]),
-    dbc.Row([dbc.Col(dcc.Graph(id='grafico-preco-tempo'), width=12)]),
-    html.Div(id='scrollable-container-dashboard', style={'display': 'none'}), # ID Único
-    html.P("by Tiago Garcéa e Felipe Dias", style={"color": "gray", "font-size": "9pt", "margin-top": "20px"})
-], fluid=True)
+# Layouts que dependem dos dados (opções de dropdown, limites de datas) são funções,
+# montadas a cada navegação a partir do snapshot de dados atual.
+def opcoes_planos_comparativo(planos_por_localidade, plano_atual=PLANO_MAIS_RECENTE):
+    """
+    Opções de plano dos seletores do Comparativo, do mais recente ao mais antigo. Com um `plano_atual`
+    escolhido, só os outros planos da localidade dele (os únicos que podem ser comparados com ele).
+    """
+    if plano_atual != PLANO_MAIS_RECENTE:
+        planos_por_localidade = {localidade: [plano for plano in planos if plano != plano_atual]
+                                 for localidade, planos in planos_por_localidade.items() if plano_atual in planos}
+    return sorted(({'label': f"{plano} ({localidade})", 'value': plano}
+                   for localidade, planos in planos_por_localidade.items() for plano in planos),
+                  key=lambda opcao: opcao['value'], reverse=True)
+
+def opcoes_referencia_comparativo(planos_por_localidade, plano_atual=PLANO_MAIS_RECENTE):
+    return ([{'label': 'Plano anterior', 'value': REFERENCIA_ANTERIOR},
+             {'label': f'Média dos {PLANOS_LINHA_DE_BASE} planos anteriores', 'value': REFERENCIA_MEDIA}]
+            + opcoes_planos_comparativo(planos_por_localidade, plano_atual))
+
+def criar_layout_comparativo():
+    planos_por_localidade = obter_dados().planos_por_localidade()
+    return dbc.Container([
+        dcc.Store(id='store-pagina-atual-comp', data=1),
+        dcc.Store(id='store-ordenacao-comp', data=None),
+        html.H1("Comparativo de Planos", className="text-center text-primary mb-4"),
+        html.P("Comparação entre dois planos de cada localidade (por padrão, o mais recente vs. o anterior). Clique nos cabeçalhos para filtrar."),
+        dbc.Row([
+            dbc.Col([html.Label("Plano atual:"),
+                     dcc.Dropdown(id='seletor-plano-atual-comp', clearable=False, value=PLANO_MAIS_RECENTE,
+                                  options=[{'label': 'Mais recente de cada localidade', 'value': PLANO_MAIS_RECENTE}]
+                                          + opcoes_planos_comparativo(planos_por_localidade))], width=4),
+            dbc.Col([html.Label("Comparar com:"),
+                     dcc.Dropdown(id='seletor-referencia-comp', clearable=False, value=REFERENCIA_ANTERIOR,
+                                  options=opcoes_referencia_comparativo(planos_por_localidade))], width=4),
+        ], className="mb-3"),
+        html.Hr(),
+        dbc.Button(
+            "Limpar Todos os Filtros",
+            id="btn-limpar-filtros-comp",
+            color="danger",
+            className="mb-3"
+        ),
+        criar_formulario_exportacao('comparativo', 'comp', ['plano_atual', 'referencia']),
+        html.Div([
+            dcc.Loading(
+                id="loading-comp",
+                type="circle",
+                children=[
+                    html.Table([
+                        html.Thead(id='tabela-header-comp'),
+                        html.Tbody(id='tabela-body-comp')
+                    ], className='custom-table')
+                ]
+            )], id='scrollable-container-comp', style={'overflowX': 'auto', 'width': f'{INVERSE_WIDTH:.2f}%'}),
+        dbc.Row([
+            dbc.Col(dbc.Button("<< Primeira", id="btn-primeira-comp", color="secondary"), width="auto"),
+            dbc.Col(dbc.Button("< Anterior", id="btn-anterior-comp", color="primary"), width="auto"),
+            dbc.Col(html.Div(id='texto-pagina-comp', style={'textAlign': 'center', 'padding': '0.5rem'}), width="auto"),
+            dbc.Col(dbc.Button("Próxima >", id="btn-proxima-comp", color="primary"), width="auto"),
+            dbc.Col(dbc.Button("Última >>", id="btn-ultima-comp", color="secondary"), width="auto"),
+        ], justify="center", align="center", className="mt-4"),
+        html.P("by Tiago Garcéa e Felipe Dias", style={"color": "gray", "font-size": "9pt", "margin-top": "20px"})
+    ], fluid=True)
+
+def criar_layout_dashboard():
+    consultas = obter_dados().consultas
+    return dbc.Container([
+        html.H1("Big Picture", className="text-center text-primary mb-4"),
+        html.Hr(),
+        dbc.Row([
+            dbc.Col([html.Label("Localidade (Loja):"),
+                     dcc.Dropdown(id='filtro-localidade', options=[{'label': i, 'value': i} for i in consultas.valores_distintos('LOCALIDADE')], multi=True, placeholder="Selecione...")], width=6),
+            dbc.Col([html.Label("Locadora:"),
+                     dcc.Dropdown(id='filtro-locadora', options=[{'label': i, 'value': i} for i in consultas.valores_distintos('LOCADORA')], multi=True, placeholder="Selecione...")], width=6)
+        ], className="mb-4"),
+        dbc.Row([
+            dbc.Col(dbc.Card(dbc.CardBody([html.H4("Preço Médio da Diária"), html.H2(id='kpi-preco-medio')]))),
+            dbc.Col(dbc.Card(dbc.CardBody([html.H4("Total de Pesquisas"), html.H2(id='kpi-total-pesquisas')]))),
+            dbc.Col(dbc.Card(dbc.CardBody([html.H4("Número de Locadoras"), html.H2(id='kpi-num-locadoras')]))),
+        ], className="mb-4 g-3"),
+        dbc.Row([
+            dbc.Col(dcc.Graph(id='grafico-preco-locadora'), width=8),
+            dbc.Col(dcc.Graph(id='grafico-dist-categoria'), width=4)
+        ]),
+        dbc.Row([dbc.Col(dcc.Graph(id='grafico-preco-tempo'), width=12)]),
+        html.Div(id='scrollable-container-dashboard', style={'display': 'none'}), # ID Único
+        html.P("by Tiago Garcéa e Felipe Dias", style={"color": "gray", "font-size": "9pt", "margin-top": "20px"})
+    ], fluid=True)
 
 layout_posicionamento = dbc.Container([
     html.H1("Posicionamento por Loja", className="text-center text-primary mb-4"),
@@ -573,6 +2393,7 @@ layout_posicionamento = dbc.Container([
             html.Thead(id='tabela-header-pos-loja'),
         ], className='custom-table', style={'marginBottom': '20px'})
     ]),
+    *criar_controles_progresso('pos-loja'),
     dbc.Row([
         dbc.Col([
             html.H4("Matriz 1: Locadora com Menor Preço", className="text-center mb-3"),
@@ -599,6 +2420,7 @@ layout_posicionamento_categoria = dbc.Container([
             html.Thead(id='tabela-header-pos-cat'),
         ], className='custom-table', style={'marginBottom': '20px'})
     ]),
+    *criar_controles_progresso('pos-cat'),
     dbc.Row([
         dbc.Col([
             html.H4("Matriz 1: Locadora com Menor Preço", className="text-center mb-3"),
@@ -616,87 +2438,108 @@ layout_posicionamento_categoria = dbc.Container([
     html.P("by Tiago Garcéa e Felipe Dias", style={"color": "gray", "font-size": "9pt", "margin-top": "20px"})
 ], fluid=True)
 
-layout_movimentacao_horario = dbc.Container([
-    html.H1("Movimentação por Horário", className="text-center text-primary mb-4"),
-    html.P("Selecione uma data para analisar a flutuação dos preços das locadoras ao longo daquele dia."),
-    html.Hr(),
-    dbc.Row([
-        dbc.Col([
-            html.Label("Data da Pesquisa:"),
-            dcc.DatePickerSingle(
-                id='filtro-data-horario',
-                min_date_allowed=df['DATA_HORA'].min().date() if not df.empty else None,
-                max_date_allowed=df['DATA_HORA'].max().date() if not df.empty else None,
-                initial_visible_month=df['DATA_HORA'].max().date() if not df.empty else None,
-                date=df['DATA_HORA'].max().date() if not df.empty else None,
-                display_format='DD/MM/YYYY',
-                className="w-100"
-            )
-        ], width=12, lg=6, className="mb-3"),
-        dbc.Col([
-            html.Label("Data de Retirada:"),
-            dcc.DatePickerSingle(
-                id='filtro-retirada-horario',
-                min_date_allowed=df['RETIRADA'].min().date() if not df.empty else None,
-                max_date_allowed=df['RETIRADA'].max().date() if not df.empty else None,
-                initial_visible_month=df['RETIRADA'].max().date() if not df.empty else None,
-                date=None,
-                display_format='DD/MM/YYYY',
-                placeholder="Selecione a Retirada...",
-                className="w-100"
-            )
-        ], width=12, lg=6, className="mb-3"),
-    ]),
-    dbc.Row([
-        dbc.Col([
-            html.Label("Localidade (Loja):"),
-            dcc.Dropdown(
-                id='filtro-localidade-horario',
-                options=[{'label': i, 'value': i} for i in sorted(df['LOCALIDADE'].dropna().unique())],
-                multi=True,
-                placeholder="Todas as localidades"
-            )
-        ], width=12, lg=3, className="mb-3"),
-        dbc.Col([
-            html.Label("Locadora:"),
-            dcc.Dropdown(
-                id='filtro-locadora-horario',
-                options=[{'label': i, 'value': i} for i in sorted(df['LOCADORA'].dropna().unique())],
-                multi=True,
-                placeholder="Todas as locadoras"
-            )
-        ], width=12, lg=3, className="mb-3"),
-        dbc.Col([
-            html.Label("LOR:"),
-            dcc.Dropdown(
-                id='filtro-lor-horario',
-                options=[{'label': i, 'value': i} for i in sorted(df['DURAÇÃO'].dropna().unique())] if 'DURAÇÃO' in df.columns else [],
-                multi=True,
-                placeholder="Todas os LORs"
-            )
-        ], width=12, lg=3, className="mb-3"),
-        dbc.Col([
-            html.Label("Categoria:"),
-            dcc.Dropdown(
-                id='filtro-categoria-horario',
-                options=[{'label': i, 'value': i} for i in sorted(df['CATEGORIA'].dropna().unique())],
-                multi=True,
-                placeholder="Todas as categorias"
-            )
-        ], width=12, lg=3, className="mb-3"),
-    ], className="mb-4"),
-    dbc.Row([
-        dbc.Col(dcc.Graph(id='grafico-movimentacao-horario'), width=12)
-    ]),
-    html.Div(id='scrollable-container-mov-horario', style={'display': 'none'}), # ID Único
-    html.P("by Tiago Garcéa e Felipe ", style={"color": "gray", "font-size": "9pt", "margin-top": "20px"})
-], fluid=True)
+def criar_layout_movimentacao_horario():
+    consultas = obter_dados().consultas
+    primeira_pesquisa, ultima_pesquisa = consultas.intervalo('DATA_HORA')
+    primeira_retirada, ultima_retirada = consultas.intervalo('RETIRADA')
+    return dbc.Container([
+        html.H1("Movimentação por Horário", className="text-center text-primary mb-4"),
+        html.P("Selecione uma data para analisar a flutuação dos preços das locadoras ao longo daquele dia."),
+        html.Hr(),
+        dbc.Row([
+            dbc.Col([
+                html.Label("Data da Pesquisa:"),
+                dcc.DatePickerSingle(
+                    id='filtro-data-horario',
+                    min_date_allowed=primeira_pesquisa.date() if primeira_pesquisa is not None else None,
+                    max_date_allowed=ultima_pesquisa.date() if ultima_pesquisa is not None else None,
+                    initial_visible_month=ultima_pesquisa.date() if ultima_pesquisa is not None else None,
+                    date=ultima_pesquisa.date() if ultima_pesquisa is not None else None,
+                    display_format='DD/MM/YYYY',
+                    className="w-100"
+                )
+            ], width=12, lg=6, className="mb-3"),
+            dbc.Col([
+                html.Label("Data de Retirada:"),
+                dcc.DatePickerSingle(
+                    id='filtro-retirada-horario',
+                    min_date_allowed=primeira_retirada.date() if primeira_retirada is not None else None,
+                    max_date_allowed=ultima_retirada.date() if ultima_retirada is not None else None,
+                    initial_visible_month=ultima_retirada.date() if ultima_retirada is not None else None,
+                    date=None,
+                    display_format='DD/MM/YYYY',
+                    placeholder="Selecione a Retirada...",
+                    className="w-100"
+                )
+            ], width=12, lg=6, className="mb-3"),
+        ]),
+        dbc.Row([
+            dbc.Col([
+                html.Label("Localidade (Loja):"),
+                dcc.Dropdown(
+                    id='filtro-localidade-horario',
+                    options=[{'label': i, 'value': i} for i in consultas.valores_distintos('LOCALIDADE')],
+                    multi=True,
+                    placeholder="Todas as localidades"
+                )
+            ], width=12, lg=3, className="mb-3"),
+            dbc.Col([
+                html.Label("Locadora:"),
+                dcc.Dropdown(
+                    id='filtro-locadora-horario',
+                    options=[{'label': i, 'value': i} for i in consultas.valores_distintos('LOCADORA')],
+                    multi=True,
+                    placeholder="Todas as locadoras"
+                )
+            ], width=12, lg=3, className="mb-3"),
+            dbc.Col([
+                html.Label("LOR:"),
+                dcc.Dropdown(
+                    id='filtro-lor-horario',
+                    options=[{'label': i, 'value': i} for i in consultas.valores_distintos('DURAÇÃO')],
+                    multi=True,
+                    placeholder="Todas os LORs"
+                )
+            ], width=12, lg=3, className="mb-3"),
+            dbc.Col([
+                html.Label("Categoria:"),
+                dcc.Dropdown(
+                    id='filtro-categoria-horario',
+                    options=[{'label': i, 'value': i} for i in consultas.valores_distintos('CATEGORIA')],
+                    multi=True,
+                    placeholder="Todas as categorias"
+                )
+            ], width=12, lg=3, className="mb-3"),
+        ], className="mb-4"),
+        dbc.Row([
+            dbc.Col(dcc.Graph(id='grafico-movimentacao-horario'), width=12)
+        ]),
+        html.H4("Maiores Mudanças de Preço do Dia", className="text-primary mt-4"),
+        html.P("Variações entre pesquisas consecutivas do mesmo dia, por localidade, retirada, LOR, categoria e locadora "
+               "(menor preço da locadora em cada pesquisa), das maiores para as menores.", className="text-muted"),
+        dcc.Loading(html.Div(id='tabela-mudancas-horario')),
+        html.Div(id='scrollable-container-mov-horario', style={'display': 'none'}), # ID Único
+        html.P("by Tiago Garcéa e Felipe ", style={"color": "gray", "font-size": "9pt", "margin-top": "20px"})
+    ], fluid=True)
+
+registrar_tempo_startup('layouts')
 
 # ==============================================================================
 # INICIALIZAÇÃO DO BANCO DE DADOS EXTERNO
 # ==============================================================================
-if DATABASE_URL:
+# O esquema não é mais verificado na importação (cada worker/processo que sobe pagava a ida ao
+# banco). No Docker o gunicorn o verifica uma vez no processo mestre (`when_ready` em
+# gunicorn.conf.py) e `python app.py` o verifica antes de subir o servidor; em outros deploys
+# rode `flask --app app init-db` (ou `python app.py init-db`) uma vez antes de iniciar o app.
+# SEA_DASH_INIT_DB_NA_IMPORTACAO=1 volta ao comportamento antigo.
+@server.cli.command('init-db')
+def init_db_command():
+    """Cria as tabelas e os usuários predefinidos no PostgreSQL."""
+    initialize_database()
+
+if DATABASE_URL and not SOMENTE_INIT_DB and os.environ.get('SEA_DASH_INIT_DB_NA_IMPORTACAO', '0') == '1':
     initialize_database()
+registrar_tempo_startup('banco_de_dados')
 
 # --- LAYOUT PRINCIPAL DO APP (MODIFICADO) ---
 app.layout = html.Div([
@@ -710,42 +2553,132 @@ app.layout = html.Div([
 # 6. CALLBACKS
 # ==============================================================================
 
+# --- CACHE DOS LAYOUTS POR PERFIL, PÁGINA E VERSÃO DOS DADOS ---
+# Sidebar + página de cada (perfil, caminho, versão dos dados) são montadas e convertidas para
+# a árvore de dicts que o Dash envia ao navegador uma única vez; as navegações seguintes devolvem
+# essa árvore pronta. Quando o arquivo de dados muda, o cache é descartado e os layouts seguintes
+# (opções dos dropdowns, datas e "Última Atualização") saem do snapshot novo.
+PAGINAS = {
+    '/': lambda: layout_visao_geral,
+    '/comparativo': criar_layout_comparativo,
+    '/dashboard': criar_layout_dashboard,
+    '/posicionamento': lambda: layout_posicionamento,
+    '/posicionamento-categoria': lambda: layout_posicionamento_categoria,
+    '/movimentacao-horario': criar_layout_movimentacao_horario,
+    '/admin-logs': lambda: layout_admin_logs,
+    '/admin-dados': lambda: layout_admin_dados,
+}
+PAGINAS_ADMIN = {'/admin-logs', '/admin-dados'}
+_layouts_serializados = {}
+ACESSOS_LAYOUTS = {'acertos': 0, 'faltas': 0}
+_versao_layouts = None
+_lock_layouts = threading.Lock()
+
+def serializar_layout(componente):
+    """Árvore de componentes -> dicts e listas simples (o mesmo JSON que o Dash enviaria)."""
+    if hasattr(componente, 'to_plotly_json'):
+        componente = componente.to_plotly_json()
+    if isinstance(componente, dict):
+        return {chave: serializar_layout(valor) for chave, valor in componente.items()}
+    if isinstance(componente, (list, tuple)):
+        return [serializar_layout(item) for item in componente]
+    return componente
+
+def layout_da_pagina(user_role, pathname):
+    global _versao_layouts
+    # Caminho desconhecido (ou página de admin sem ser admin) cai na Base, como antes
+    if pathname not in PAGINAS or (pathname in PAGINAS_ADMIN and user_role != 'admin'):
+        pathname = '/'
+    dados = obter_dados()
+    chave = (user_role, pathname)
+    with _lock_layouts:
+        if _versao_layouts != dados.versao:
+            _layouts_serializados.clear()
+            _versao_layouts = dados.versao
+        layout = _layouts_serializados.get(chave)
+        ACESSOS_LAYOUTS['acertos' if layout is not None else 'faltas'] += 1
+    if layout is None:
+        CONTENT_STYLE = { "marginLeft": "18rem", "padding": "2rem 1rem", "transform": f"scale({INITIAL_SCALE})", "transformOrigin": "top left" }
+        layout = serializar_layout(html.Div([
+            create_sidebar(user_role),
+            html.Div(PAGINAS[pathname](), id="page-content", style=CONTENT_STYLE)
+        ]))
+        with _lock_layouts:
+            if _versao_layouts == dados.versao:
+                _layouts_serializados[chave] = layout
+    return layout
+
+# --- VISÕES PADRÃO E AQUECIMENTO ---
+# A primeira carga de cada página, sem filtros (Base e Comparativo na página 1, Posicionamento
+# com PLANO == plano_recente, Big Picture completo, Movimentação do último dia pesquisado), é a
+# mesma para todos os usuários enquanto o snapshot não muda. Nesse caso o retorno do callback é
+# o derivado 'padrao:<visão>' do snapshot, já serializado (ver VISOES_PADRAO). O aquecimento monta
+# essas respostas e os layouts das páginas logo após a carga e após cada recarga a quente, e o
+# primeiro acesso custa o mesmo que os seguintes. Com o gunicorn (preload) o aquecimento roda no
+# mestre, antes do fork, e os workers e os jobs de callbacks em segundo plano herdam tudo pronto.
+_thread_aquecimento = None
+
+def resposta_padrao(dados, nome):
+    """Retorno do callback na visão padrão `nome`, montado uma vez por snapshot (SEA_DASH_AQUECIMENTO != '0')."""
+    if AQUECIMENTO == '0':
+        return VISOES_PADRAO[nome](dados)
+    return dados.derivado(f'padrao:{nome}', lambda: serializar_layout(VISOES_PADRAO[nome](dados)))
+
+def dia_padrao_movimentacao(dados):
+    """Data ('AAAA-MM-DD') com que a Movimentação por Horário abre: o último dia pesquisado."""
+    def construir():
+        _, ultima_pesquisa = dados.consultas.intervalo('DATA_HORA')
+        return ultima_pesquisa.date().isoformat() if ultima_pesquisa is not None else None
+    return dados.derivado('dia_padrao_movimentacao', construir)
+
+def aquecer(dados):
+    """Monta as visões padrão e os layouts de todas as páginas do snapshot `dados`."""
+    inicio = time.perf_counter()
+    if PRECARREGAR_DADOS:
+        dados.precarregar()
+    for nome in VISOES_PADRAO:
+        try:
+            resposta_padrao(dados, nome)
+        except Exception as e:
+            print(f"AVISO: falha ao aquecer a visão padrão '{nome}': {e}")
+    for perfil in ('user', 'admin'):
+        for caminho in PAGINAS:
+            layout_da_pagina(perfil, caminho)
+    dados.tempos['aquecimento'] = time.perf_counter() - inicio
+    print(f"Aquecimento concluído em {dados.tempos['aquecimento']:.2f}s ({len(VISOES_PADRAO)} visões padrão).")
+
+def iniciar_aquecimento(dados, em_segundo_plano=False):
+    global _thread_aquecimento
+    if not em_segundo_plano:
+        aquecer(dados)
+        return
+    _thread_aquecimento = threading.Thread(target=aquecer, args=(dados,), name='sea-dash-aquecimento', daemon=True)
+    _thread_aquecimento.start()
+
+def aguardar_aquecimento():
+    """
+    Espera o aquecimento em segundo plano terminar. O gunicorn chama esta função antes de cada
+    fork, para que os workers herdem as visões padrão prontas (os locks são refeitos no filho de
+    qualquer fork, ver `_reiniciar_locks_apos_fork`).
+    """
+    if _thread_aquecimento is not None:
+        _thread_aquecimento.join()
+
 # --- CALLBACK PRINCIPAL DE ROTEAMENTO E EXIBIÇÃO (NOVO) ---
 @app.callback(
     Output('page-container', 'children'),
-    Input('url', 'pathname'),
-    State('session-store', 'data')
+    Input('url', 'pathname')
 )
-def main_router_and_display(pathname, session_data):
+def main_router_and_display(pathname):
     # Se não estiver logado, redireciona para a tela de login, a menos que já esteja nela ou na de registro
-    if not session_data or 'username' not in session_data:
+    usuario = usuario_logado()
+    if usuario is None:
         if pathname == '/register':
             return register_layout
         return login_layout
 
-    # Se estiver logado, monta o layout do dashboard
-    user_role = session_data.get('role', 'user')
-    CONTENT_STYLE = { "marginLeft": "18rem", "padding": "2rem 1rem", "transform": f"scale({INITIAL_SCALE})", "transformOrigin": "top left" }
-
-    # Determina qual página de conteúdo mostrar
-    page_content = layout_visao_geral
-    if pathname == '/comparativo':
-        page_content = layout_comparativo
-    elif pathname == '/dashboard':
-        page_content = layout_dashboard
-    elif pathname == '/posicionamento':
-        page_content = layout_posicionamento
-    elif pathname == '/posicionamento-categoria':
-        page_content = layout_posicionamento_categoria
-    elif pathname == '/movimentacao-horario':
-        page_content = layout_movimentacao_horario
-    elif pathname == '/admin-logs' and user_role == 'admin':
-        page_content = layout_admin_logs
-
-    return html.Div([
-        create_sidebar(user_role),
-        html.Div(page_content, id="page-content", style=CONTENT_STYLE)
-    ])
+    # Se estiver logado, devolve o layout (sidebar do perfil + página) do cache
+    return layout_da_pagina(usuario['role'], pathname)
 
 
 # --- NOVOS CALLBACKS DE AUTENTICAÇÃO ---
@@ -770,6 +2703,7 @@ def handle_login(n_clicks, username, password):
     if user['password_hash'] and check_password_hash(user['password_hash'], password):
         log_access(username)
         session_data = {'username': user['username'], 'role': user['role']}
+        flask.session.update(session_data)
         return '/', session_data, None
     elif not user['password_hash']:
          return no_update, no_update, dbc.Alert(html.Div(["Parece ser seu primeiro acesso. ", dcc.Link("Clique aqui para cadastrar sua senha.", href="/register")]), color="info")
@@ -784,6 +2718,7 @@ def handle_login(n_clicks, username, password):
 )
 def handle_logout(n_clicks):
     if n_clicks:
+        flask.session.clear()
         return '/login', True
     return no_update, no_update
 
@@ -827,11 +2762,11 @@ def handle_register(n_clicks, username, pw1, pw2):
 
 @app.callback(
     Output('log-table-container', 'children'),
-    Input('url', 'pathname'),
-    State('session-store', 'data')
+    Input('url', 'pathname')
 )
-def load_log_table(pathname, session_data):
-    if pathname == '/admin-logs' and session_data and session_data.get('role') == 'admin':
+def load_log_table(pathname):
+    usuario = usuario_logado()
+    if pathname == '/admin-logs' and usuario and usuario['role'] == 'admin':
         df_logs = get_all_logs()
         if df_logs.empty:
             return dbc.Alert("Nenhum registro de acesso encontrado.", color="info")
@@ -840,6 +2775,83 @@ def load_log_table(pathname, session_data):
         return dbc.Table.from_dataframe(df_logs, striped=True, bordered=True, hover=True, dark=True, responsive=True)
     return no_update
 
+# --- SAÚDE DOS DADOS (ADMIN) ---
+def formatar_inteiro(valor):
+    return f"{valor:,}".replace(",", ".")
+
+def tabela_saude(titulo, linhas, colunas):
+    tabela = pd.DataFrame(linhas, columns=colunas)
+    return html.Div([
+        html.H4(titulo, className="text-primary mt-4"),
+        dbc.Table.from_dataframe(tabela, striped=True, bordered=True, hover=True, color='dark', responsive=True, size='sm'),
+    ])
+
+def relatorio_saude_dados(dados):
+    """
+    Seções da página de saúde dos dados para o snapshot `dados`. Só lê o que já foi construído
+    (`pronto`): a página não dispara cargas nem conta como acesso nos caches que ela mesma reporta.
+    """
+    consultas = dados.pronto('consultas')
+    catalogo = dados.pronto('catalogo_planos')
+    df_comparativo = dados.pronto('df_comparativo')
+    rss = memoria_processo()
+    corte = dados.corte_historico(catalogo) if catalogo is not None else None
+    if DIAS_HISTORICO is None:
+        janela = "Todo o histórico"
+    else:
+        janela = f"{DIAS_HISTORICO} dias" + (f" (planos desde {corte})" if corte else "")
+    snapshot = [
+        ('Arquivo', dados.caminho),
+        ('Versão (mtime)', dados.versao if dados.versao is not None else '-'),
+        ('Última modificação', dados.last_update_string),
+        ('Backend de consultas', BACKEND_CONSULTAS),
+        ('Janela de histórico', janela),
+        ('Processo', f"PID {os.getpid()}, RSS {rss / 1024 ** 2:,.0f} MB" if rss else f"PID {os.getpid()}"),
+    ]
+
+    linhas = [('Carregadas do arquivo', dados.linhas.get('carregadas'))]
+    linhas += [(f'Descartadas: {motivo}', total) for motivo, total in dados.descartes.items()]
+    linhas += [('Após a limpeza', dados.linhas.get('após a limpeza')),
+               ('Comparativo (recente vs. anterior)', len(df_comparativo) if df_comparativo is not None else None)]
+    linhas = [(etapa, formatar_inteiro(total) if total is not None else '-') for etapa, total in linhas]
+
+    tempos = [(f'inicialização: {etapa}', f"{segundos:.3f}") for etapa, segundos in TEMPOS_STARTUP.items()]
+    tempos += [(nome, f"{segundos:.3f}") for nome, segundos in sorted(dados.tempos.items(), key=lambda item: -item[1])]
+
+    por_derivado, do_backend = dados.memoria(), consultas.memoria() if consultas is not None else {}
+    memoria = [(nome, formatar_inteiro(n_linhas), n_colunas, f"{total / 1024 ** 2:,.1f}")
+               for nome, (n_linhas, n_colunas, total) in sorted(por_derivado.items(), key=lambda item: -item[1][2])]
+    memoria += [(nome, '-', '-', f"{total / 1024 ** 2:,.1f}") for nome, total in do_backend.items()]
+    total_memoria = sum(total for _, _, total in por_derivado.values()) + sum(do_backend.values())
+    memoria.append(('Total', '-', '-', f"{total_memoria / 1024 ** 2:,.1f}"))
+
+    def taxa(acertos, faltas):
+        return f"{acertos / (acertos + faltas):.1%}" if acertos + faltas else '-'
+    acertos, faltas = dados.acessos()
+    caches = [(familia, formatar_inteiro(acertos[familia]), formatar_inteiro(faltas[familia]), taxa(acertos[familia], faltas[familia]))
+              for familia in sorted(set(acertos) | set(faltas))]
+    caches.append(('layouts (todas as versões)', formatar_inteiro(ACESSOS_LAYOUTS['acertos']), formatar_inteiro(ACESSOS_LAYOUTS['faltas']),
+                   taxa(ACESSOS_LAYOUTS['acertos'], ACESSOS_LAYOUTS['faltas'])))
+
+    return [
+        tabela_saude("Snapshot", snapshot, ['ITEM', 'VALOR']),
+        tabela_saude("Linhas por Etapa", linhas, ['ETAPA', 'LINHAS']),
+        tabela_saude("Tempos de Carga", tempos, ['ETAPA', 'SEGUNDOS']),
+        tabela_saude("Memória por DataFrame", memoria, ['DERIVADO', 'LINHAS', 'COLUNAS', 'MB']),
+        tabela_saude("Caches", caches, ['CACHE', 'ACERTOS', 'FALTAS', 'TAXA DE ACERTO']),
+    ]
+
+@app.callback(
+    Output('saude-dados-container', 'children'),
+    Input('url', 'pathname'),
+    Input('btn-atualizar-saude', 'n_clicks')
+)
+def load_saude_dados(pathname, n_clicks):
+    usuario = usuario_logado()
+    if pathname == '/admin-dados' and usuario and usuario['role'] == 'admin':
+        return relatorio_saude_dados(obter_dados())
+    return no_update
+
 # ==============================================================================
 # SEUS CALLBACKS E FUNÇÕES ORIGINAIS (INTACTOS)
 # ==============================================================================
@@ -853,38 +2865,50 @@ def load_log_table(pathname, session_data):
     Output('btn-anterior-geral', 'disabled'),
     Output('btn-proxima-geral', 'disabled'),
     Output('btn-ultima-geral', 'disabled'),
+    Output('filtros-exportacao-geral', 'value'),
     Input({'type': 'options-list-geral', 'index': ALL}, 'value'),
     Input('btn-primeira-geral', 'n_clicks'),
     Input('btn-anterior-geral', 'n_clicks'),
     Input('btn-proxima-geral', 'n_clicks'),
     Input('btn-ultima-geral', 'n_clicks'),
     Input("btn-limpar-filtros-geral", "n_clicks"),
+    Input('store-ordenacao-geral', 'data'),
+    Input('busca-geral', 'value'),
     State('store-pagina-atual-geral', 'data'),
     State({'type': 'options-list-geral', 'index': ALL}, 'id')
 )
 def update_dynamic_table_geral(
-    valores_dos_filtros, n_first, n_prev, n_next, n_last, n_limpar,
+    valores_dos_filtros, n_first, n_prev, n_next, n_last, n_limpar, ordenacao, busca,
     pagina_atual, ids_dos_filtros):
+    dados = obter_dados()
+    if not ctx.triggered_id and not any(valores_dos_filtros) and ordenacao is None and not busca and pagina_atual == 1:
+        return resposta_padrao(dados, 'geral')
+    return montar_tabela_geral(dados, ctx.triggered_id, valores_dos_filtros, ordenacao, busca, pagina_atual, ids_dos_filtros)
 
-    triggered_id = ctx.triggered_id
-    if df_tabela.empty:
-        return html.Tr(html.Th("Nenhum dado carregado")), html.Tr(html.Td("Nenhum dado para exibir.", colSpan=10, style={'textAlign': 'center'})), 1, "Página 1 de 1", True, True, True, True
+def montar_tabela_geral(dados, triggered_id, valores_dos_filtros, ordenacao, busca, pagina_atual, ids_dos_filtros):
+    consultas = dados.consultas
+    if consultas.vazia('base'):
+        return html.Tr(html.Th("Nenhum dado carregado")), html.Tr(html.Td("Nenhum dado para exibir.", colSpan=10, style={'textAlign': 'center'})), 1, "Página 1 de 1", True, True, True, True, '{}'
 
     filtros_ativos = {id_filtro['index']: valores for id_filtro, valores in zip(ids_dos_filtros, valores_dos_filtros) if valores}
 
     if triggered_id == 'btn-limpar-filtros-geral':
         filtros_ativos = {}
 
-    dff = df_tabela.copy()
-    if filtros_ativos:
-        for nome_da_coluna, valores_selecionados in filtros_ativos.items():
-            if nome_da_coluna in dff.columns:
-                opcoes_todas = df_tabela[nome_da_coluna].dropna().astype(str).unique()
-                if len(valores_selecionados) < len(opcoes_todas):
-                    dff = dff[dff[nome_da_coluna].astype(str).isin(valores_selecionados)]
+    colunas = consultas.colunas('base')
+    opcoes_todas = consultas.opcoes_todas('base')
+    # Só restringe as linhas o filtro que não está com todas as opções marcadas
+    filtros_efetivos = {nome_da_coluna: valores_selecionados for nome_da_coluna, valores_selecionados in filtros_ativos.items()
+                         if nome_da_coluna in colunas and len(valores_selecionados) < len(opcoes_todas[nome_da_coluna])}
+    if busca and busca.strip():
+        # A busca livre entra como mais um filtro: restringe contagem, página, opções e exportação
+        filtros_ativos = {**filtros_ativos, FILTRO_BUSCA: [busca.strip()]}
+        filtros_efetivos[FILTRO_BUSCA] = [busca.strip()]
+    opcoes_por_coluna = consultas.opcoes_filtros('base', colunas, filtros_ativos)
+    larguras = consultas.larguras('base')
 
     page_prefix = 'geral'
-    colunas_para_exibir_header = ['#'] + df_tabela.columns.tolist()
+    colunas_para_exibir_header = ['#'] + colunas
     header_rows = []
 
     for coluna in colunas_para_exibir_header:
@@ -892,24 +2916,20 @@ def update_dynamic_table_geral(
             header_rows.append(html.Th("#", style={'width': '50px', 'minWidth': '50px', 'padding': '10px', 'textAlign': 'center'}))
             continue
 
-        df_para_opcoes = df_tabela.copy()
-        for outra_coluna, valores in filtros_ativos.items():
-            if outra_coluna != coluna and outra_coluna in df_para_opcoes.columns:
-                df_para_opcoes = df_para_opcoes[df_para_opcoes[outra_coluna].astype(str).isin(valores)]
-
-        opcoes_unicas = sorted(df_para_opcoes[coluna].dropna().astype(str).unique())
+        opcoes_unicas = opcoes_por_coluna[coluna]
         valores_selecionados_atuais = filtros_ativos.get(coluna, opcoes_unicas)
 
         header_len = len(coluna)
-        max_content_len = df_tabela[coluna].astype(str).str.len().max() if not df_tabela.empty and coluna in df_tabela.columns else 0
-        if pd.isna(max_content_len): max_content_len = 0
+        max_content_len = larguras.get(coluna, 0)
         optimal_len = max(header_len, int(max_content_len))
         width_px = max(120, min(400, optimal_len * 9 + 30))
         width_str = f'{width_px}px'
 
         header_cell = html.Th([
-            dbc.Button(coluna, id={'type': f'filter-btn-{page_prefix}', 'index': coluna}, className="w-100 h-100 text-truncate", style={'borderRadius': 0, 'textAlign': 'left', 'padding': '10px', 'backgroundColor': '#3c3c3c', 'border': 'none', 'fontWeight': 'bold'}),
+            dbc.Button(rotulo_coluna_ordenada(coluna, ordenacao), id={'type': f'filter-btn-{page_prefix}', 'index': coluna}, className="w-100 h-100 text-truncate", style={'borderRadius': 0, 'textAlign': 'left', 'padding': '10px', 'backgroundColor': '#3c3c3c', 'border': 'none', 'fontWeight': 'bold'}),
             dbc.Popover(dbc.PopoverBody([
+                criar_botoes_ordenacao(page_prefix, coluna, ordenacao),
+                html.Hr(className="my-1"),
                 dcc.Checklist(id={'type': f'select-all-{page_prefix}', 'index': coluna}, options=[{'label': 'Selecionar Tudo', 'value': 'all'}], value=['all'] if len(valores_selecionados_atuais) == len(opcoes_unicas) else [], className="mb-2 fw-bold"),
                 html.Hr(className="my-1"),
                 dcc.Checklist(id={'type': f'options-list-{page_prefix}', 'index': coluna}, options=[{'label': i, 'value': i} for i in opcoes_unicas], value=valores_selecionados_atuais, style={'maxHeight': '200px', 'overflowY': 'auto', 'overflowX': 'hidden'}, labelClassName="d-block text-truncate")
@@ -919,11 +2939,12 @@ def update_dynamic_table_geral(
 
     cabecalho_final = html.Tr(header_rows)
 
-    total_linhas = len(dff)
+    total_linhas = consultas.contar('base', filtros_efetivos)
+    registrar_linhas_processadas(total_linhas)
     total_paginas = math.ceil(total_linhas / PAGE_SIZE) if total_linhas > 0 else 1
 
     nova_pagina = pagina_atual
-    if isinstance(triggered_id, dict) or triggered_id == 'btn-limpar-filtros-geral':
+    if isinstance(triggered_id, dict) or triggered_id in ('btn-limpar-filtros-geral', 'store-ordenacao-geral', 'busca-geral'):
         nova_pagina = 1
     elif isinstance(triggered_id, str):
         if 'btn-primeira' in triggered_id: nova_pagina = 1
@@ -933,14 +2954,12 @@ def update_dynamic_table_geral(
 
     nova_pagina = min(nova_pagina, total_paginas) if total_paginas > 0 else 1
 
-    dff = dff.reset_index(drop=True)
-    dff.insert(0, '#', dff.index + 1)
-
     start_index = (nova_pagina - 1) * PAGE_SIZE
     end_index = start_index + PAGE_SIZE
-    dff_paginado = dff.iloc[start_index:end_index]
+    dff_paginado = consultas.pagina('base', filtros_efetivos, start_index, end_index, ordenacao)
+    dff_paginado.insert(0, '#', np.arange(start_index + 1, start_index + len(dff_paginado) + 1))
 
-    colunas_para_exibir_body = ['#'] + df_tabela.columns.tolist()
+    colunas_para_exibir_body = ['#'] + colunas
     table_rows = []
     if not dff_paginado.empty:
         for _, row in dff_paginado.iterrows():
@@ -952,7 +2971,23 @@ def update_dynamic_table_geral(
     disable_first = disable_prev = nova_pagina == 1
     disable_last = disable_next = nova_pagina == total_paginas
 
-    return cabecalho_final, table_rows, nova_pagina, texto_paginacao, disable_first, disable_prev, disable_next, disable_last
+    return cabecalho_final, table_rows, nova_pagina, texto_paginacao, disable_first, disable_prev, disable_next, disable_last, json.dumps(filtros_efetivos)
+
+
+# Cada plano é de uma única localidade: com um plano atual escolhido, a referência só pode ser o
+# anterior, a média ou outro plano da mesma localidade (a tabela espera este callback terminar)
+@app.callback(
+    Output('seletor-referencia-comp', 'options'),
+    Output('seletor-referencia-comp', 'value'),
+    Input('seletor-plano-atual-comp', 'value'),
+    State('seletor-referencia-comp', 'value'),
+    prevent_initial_call=True
+)
+def filtrar_referencias_comparativo(plano_atual, referencia):
+    opcoes = opcoes_referencia_comparativo(obter_dados().planos_por_localidade(), plano_atual)
+    if referencia in {opcao['value'] for opcao in opcoes}:
+        return opcoes, no_update
+    return opcoes, REFERENCIA_ANTERIOR
 
 
 @app.callback(
@@ -964,38 +2999,57 @@ def update_dynamic_table_geral(
     Output('btn-anterior-comp', 'disabled'),
     Output('btn-proxima-comp', 'disabled'),
     Output('btn-ultima-comp', 'disabled'),
+    Output('filtros-exportacao-comp', 'value'),
+    Output('plano-atual-exportacao-comp', 'value'),
+    Output('referencia-exportacao-comp', 'value'),
     Input({'type': 'options-list-comp', 'index': ALL}, 'value'),
     Input('btn-primeira-comp', 'n_clicks'),
     Input('btn-anterior-comp', 'n_clicks'),
     Input('btn-proxima-comp', 'n_clicks'),
     Input('btn-ultima-comp', 'n_clicks'),
     Input("btn-limpar-filtros-comp", "n_clicks"),
+    Input('store-ordenacao-comp', 'data'),
+    Input('seletor-plano-atual-comp', 'value'),
+    Input('seletor-referencia-comp', 'value'),
     State('store-pagina-atual-comp', 'data'),
     State({'type': 'options-list-comp', 'index': ALL}, 'id')
 )
 def update_dynamic_table_comparativo(
-    valores_dos_filtros, n_first, n_prev, n_next, n_last, n_limpar,
+    valores_dos_filtros, n_first, n_prev, n_next, n_last, n_limpar, ordenacao, plano_atual, referencia,
     pagina_atual, ids_dos_filtros):
-
-    triggered_id = ctx.triggered_id
-    if df_comparativo.empty:
-        return html.Tr(html.Th("Nenhum dado para comparar")), html.Tr(html.Td("Nenhum dado para exibir.", colSpan=10, style={'textAlign': 'center'})), 1, "Página 1 de 1", True, True, True, True
+    dados = obter_dados()
+    if (not ctx.triggered_id and not any(valores_dos_filtros) and ordenacao is None and pagina_atual == 1
+            and plano_atual == PLANO_MAIS_RECENTE and referencia == REFERENCIA_ANTERIOR):
+        return resposta_padrao(dados, 'comparativo')
+    return montar_tabela_comparativo(dados, ctx.triggered_id, valores_dos_filtros, ordenacao, plano_atual, referencia,
+                                     pagina_atual, ids_dos_filtros)
+
+def montar_tabela_comparativo(dados, triggered_id, valores_dos_filtros, ordenacao, plano_atual, referencia,
+                              pagina_atual, ids_dos_filtros):
+    consultas = dados.consultas
+    try:
+        visao = dados.visao_comparativo(plano_atual, referencia)
+    except ValueError as erro:
+        return html.Tr(html.Th("Par de planos inválido")), html.Tr(html.Td(str(erro), colSpan=10, style={'textAlign': 'center'})), 1, "Página 1 de 1", True, True, True, True, '{}', None, None
+    if consultas.vazia(visao):
+        return html.Tr(html.Th("Nenhum dado para comparar")), html.Tr(html.Td("Nenhum dado para exibir.", colSpan=10, style={'textAlign': 'center'})), 1, "Página 1 de 1", True, True, True, True, '{}', plano_atual, referencia
 
     filtros_ativos = {id_filtro['index']: valores for id_filtro, valores in zip(ids_dos_filtros, valores_dos_filtros) if valores}
 
-    if triggered_id == 'btn-limpar-filtros-comp':
+    # Outro par de planos tem outras opções em cada coluna: os filtros anteriores não valem mais
+    if triggered_id in ('btn-limpar-filtros-comp', 'seletor-plano-atual-comp', 'seletor-referencia-comp'):
         filtros_ativos = {}
 
-    dff = df_comparativo.copy()
-    if filtros_ativos:
-        for nome_da_coluna, valores_selecionados in filtros_ativos.items():
-            if nome_da_coluna in dff.columns:
-                opcoes_todas = df_comparativo[nome_da_coluna].dropna().astype(str).unique()
-                if len(valores_selecionados) < len(opcoes_todas):
-                    dff = dff[dff[nome_da_coluna].astype(str).isin(valores_selecionados)]
+    colunas = consultas.colunas(visao)
+    opcoes_todas = consultas.opcoes_todas(visao)
+    # Só restringe as linhas o filtro que não está com todas as opções marcadas
+    filtros_efetivos = {nome_da_coluna: valores_selecionados for nome_da_coluna, valores_selecionados in filtros_ativos.items()
+                         if nome_da_coluna in colunas and len(valores_selecionados) < len(opcoes_todas[nome_da_coluna])}
+    opcoes_por_coluna = consultas.opcoes_filtros(visao, colunas, filtros_ativos)
+    larguras = consultas.larguras(visao)
 
     page_prefix = 'comp'
-    colunas_para_exibir_header = ['#'] + df_comparativo.columns.tolist()
+    colunas_para_exibir_header = ['#'] + colunas
     header_rows = []
 
     for coluna in colunas_para_exibir_header:
@@ -1003,24 +3057,20 @@ def update_dynamic_table_comparativo(
             header_rows.append(html.Th("#", style={'width': '50px', 'minWidth': '50px', 'padding': '10px', 'textAlign': 'center'}))
             continue
 
-        df_para_opcoes = df_comparativo.copy()
-        for outra_coluna, valores in filtros_ativos.items():
-            if outra_coluna != coluna and outra_coluna in df_para_opcoes.columns:
-                df_para_opcoes = df_para_opcoes[df_para_opcoes[outra_coluna].astype(str).isin(valores)]
-
-        opcoes_unicas = sorted(df_para_opcoes[coluna].dropna().astype(str).unique())
+        opcoes_unicas = opcoes_por_coluna[coluna]
         valores_selecionados_atuais = filtros_ativos.get(coluna, opcoes_unicas)
 
         header_len = len(coluna)
-        max_content_len = df_comparativo[coluna].astype(str).str.len().max() if not df_comparativo.empty and coluna in df_comparativo.columns else 0
-        if pd.isna(max_content_len): max_content_len = 0
+        max_content_len = larguras.get(coluna, 0)
         optimal_len = max(header_len, int(max_content_len))
         width_px = max(120, min(400, optimal_len * 9 + 30))
         width_str = f'{width_px}px'
 
         header_cell = html.Th([
-            dbc.Button(coluna, id={'type': f'filter-btn-{page_prefix}', 'index': coluna}, className="w-100 h-100 text-truncate", style={'borderRadius': 0, 'textAlign': 'left', 'padding': '10px', 'backgroundColor': '#3c3c3c', 'border': 'none', 'fontWeight': 'bold'}),
+            dbc.Button(rotulo_coluna_ordenada(coluna, ordenacao), id={'type': f'filter-btn-{page_prefix}', 'index': coluna}, className="w-100 h-100 text-truncate", style={'borderRadius': 0, 'textAlign': 'left', 'padding': '10px', 'backgroundColor': '#3c3c3c', 'border': 'none', 'fontWeight': 'bold'}),
             dbc.Popover(dbc.PopoverBody([
+                criar_botoes_ordenacao(page_prefix, coluna, ordenacao),
+                html.Hr(className="my-1"),
                 dcc.Checklist(id={'type': f'select-all-{page_prefix}', 'index': coluna}, options=[{'label': 'Selecionar Tudo', 'value': 'all'}], value=['all'] if len(valores_selecionados_atuais) == len(opcoes_unicas) else [], className="mb-2 fw-bold"),
                 html.Hr(className="my-1"),
                 dcc.Checklist(id={'type': f'options-list-{page_prefix}', 'index': coluna}, options=[{'label': i, 'value': i} for i in opcoes_unicas], value=valores_selecionados_atuais, style={'maxHeight': '200px', 'overflowY': 'auto', 'overflowX': 'hidden'}, labelClassName="d-block text-truncate")
@@ -1030,11 +3080,12 @@ def update_dynamic_table_comparativo(
 
     cabecalho_final = html.Tr(header_rows)
 
-    total_linhas = len(dff)
+    total_linhas = consultas.contar(visao, filtros_efetivos)
+    registrar_linhas_processadas(total_linhas)
     total_paginas = math.ceil(total_linhas / PAGE_SIZE) if total_linhas > 0 else 1
 
     nova_pagina = pagina_atual
-    if isinstance(triggered_id, dict) or triggered_id == 'btn-limpar-filtros-comp':
+    if isinstance(triggered_id, dict) or triggered_id in ('btn-limpar-filtros-comp', 'store-ordenacao-comp', 'seletor-plano-atual-comp', 'seletor-referencia-comp'):
         nova_pagina = 1
     elif isinstance(triggered_id, str):
         if 'btn-primeira' in triggered_id: nova_pagina = 1
@@ -1044,14 +3095,12 @@ def update_dynamic_table_comparativo(
 
     nova_pagina = min(nova_pagina, total_paginas) if total_paginas > 0 else 1
 
-    dff = dff.reset_index(drop=True)
-    dff.insert(0, '#', dff.index + 1)
-
     start_index = (nova_pagina - 1) * PAGE_SIZE
     end_index = start_index + PAGE_SIZE
-    dff_paginado = dff.iloc[start_index:end_index]
+    dff_paginado = consultas.pagina(visao, filtros_efetivos, start_index, end_index, ordenacao)
+    dff_paginado.insert(0, '#', np.arange(start_index + 1, start_index + len(dff_paginado) + 1))
 
-    colunas_para_exibir_body = ['#'] + df_comparativo.columns.tolist()
+    colunas_para_exibir_body = ['#'] + colunas
     table_rows = []
     if not dff_paginado.empty:
         for _, row in dff_paginado.iterrows():
@@ -1063,7 +3112,25 @@ def update_dynamic_table_comparativo(
     disable_first = disable_prev = nova_pagina == 1
     disable_last = disable_next = nova_pagina == total_paginas
 
-    return cabecalho_final, table_rows, nova_pagina, texto_paginacao, disable_first, disable_prev, disable_next, disable_last
+    return cabecalho_final, table_rows, nova_pagina, texto_paginacao, disable_first, disable_prev, disable_next, disable_last, json.dumps(filtros_efetivos), plano_atual, referencia
+
+def criar_callback_ordenacao(page_prefix):
+    @app.callback(
+        Output(f'store-ordenacao-{page_prefix}', 'data'),
+        Input({'type': f'ordenar-{page_prefix}', 'index': ALL, 'sentido': ALL}, 'n_clicks'),
+        State(f'store-ordenacao-{page_prefix}', 'data'),
+        prevent_initial_call=True
+    )
+    def atualizar_ordenacao(cliques, ordenacao_atual):
+        # O cabeçalho é recriado a cada atualização da tabela; botões novos chegam sem cliques
+        if not isinstance(ctx.triggered_id, dict) or not any(cliques):
+            return no_update
+        nova_ordenacao = {'coluna': ctx.triggered_id['index'], 'crescente': ctx.triggered_id['sentido'] == 'asc'}
+        # Clicar de novo no sentido já ativo volta à ordem original
+        return None if nova_ordenacao == ordenacao_atual else nova_ordenacao
+
+criar_callback_ordenacao('geral')
+criar_callback_ordenacao('comp')
 
 # ==============================================================================
 # SEÇÃO DE FUNÇÕES E CALLBACKS DE POSICIONAMENTO (ORIGINAL E CORRIGIDO)
@@ -1162,53 +3229,100 @@ def dataframe_to_html_table_categoria(df, is_percent=False):
         style={'overflowX': 'auto'}
     )
 
-def calculate_foco_diff(group):
-    preco_menor_geral = group['PREÇO'].min()
-    foco_prices = group[group['LOCADORA'] == 'Foco']['PREÇO']
-    if foco_prices.empty:
-        return np.nan
-
-    preco_menor_foco = foco_prices.min()
-
-    if preco_menor_foco == preco_menor_geral:
-        outras_locadoras = group[group['PREÇO'] > preco_menor_geral]
-        if outras_locadoras.empty:
-            return "Único"
-
-        segundo_menor_preco = outras_locadoras['PREÇO'].min()
-        return (segundo_menor_preco / preco_menor_foco) - 1
-    else:
-        return (preco_menor_geral / preco_menor_foco) - 1
-
-
-@app.callback(
+# --- RENDERIZAÇÃO COMPACTA DAS MATRIZES (HEATMAP) ---
+# As tabelas acima criam um html.Td com dict de estilo por célula; com muitas retiradas x
+# localidades (ou categorias) são dezenas de milhares de componentes por resposta. Acima de
+# LIMITE_CELULAS_TABELA células (ou sempre, com SEA_DASH_MATRIZES=heatmap) a matriz vai como um
+# único heatmap do Plotly: o destaque da Foco é um array numérico (enviado em binário) e cada
+# célula leva só o seu texto, com o mesmo verde das tabelas. SEA_DASH_MATRIZES=tabela desliga.
+MODO_MATRIZES = os.environ.get('SEA_DASH_MATRIZES', 'auto').lower()
+LIMITE_CELULAS_TABELA = int(os.environ.get('SEA_DASH_MATRIZ_LIMITE_CELULAS', 1500))
+
+def celulas_matriz(df, is_percent=False):
+    """(textos, destaque da Foco) de cada célula, com as mesmas regras de dataframe_to_html_table."""
+    textos, destaque = [], []
+    for row in df.itertuples(index=False, name=None):
+        textos_linha, destaque_linha = [], []
+        for val in row:
+            if is_percent:
+                numero = isinstance(val, (int, float)) and not pd.isna(val)
+                destaque_linha.append((numero and val >= 0) or val == 'Único')
+                textos_linha.append(f"{val:.1%}" if numero else ("-" if pd.isna(val) else val))
+            else:
+                destaque_linha.append(val == 'Foco')
+                textos_linha.append("-" if pd.isna(val) else str(val))
+        textos.append(textos_linha)
+        destaque.append(destaque_linha)
+    return textos, destaque
+
+def dataframe_to_heatmap(df, rotulos_linhas, is_percent=False):
+    textos, destaque = celulas_matriz(df, is_percent)
+    fig = go.Figure(go.Heatmap(
+        z=np.asarray(destaque, dtype=np.int8).reshape(len(df), len(df.columns)),
+        x=[str(col) for col in df.columns], y=rotulos_linhas, text=textos, texttemplate='%{text}',
+        colorscale=[[0, '#2b2b2b'], [1, '#28a745']], zmin=0, zmax=1, showscale=False, xgap=1, ygap=1,
+        hovertemplate='%{y} | %{x}: %{text}<extra></extra>',
+    ))
+    fig.update_layout(
+        height=120 + 28 * len(df), margin={'l': 10, 'r': 10, 't': 40, 'b': 10},
+        paper_bgcolor="#3c3c3c", plot_bgcolor="#2b2b2b", font_color="#f0f0f0",
+        xaxis={'side': 'top', 'type': 'category'}, yaxis={'autorange': 'reversed', 'type': 'category'},
+    )
+    return dcc.Graph(figure=fig, config={'displayModeBar': False})
+
+def renderizar_matriz(df, rotulos_linhas, tabela_html, is_percent=False):
+    """Tabela HTML (`tabela_html`) para matrizes pequenas; heatmap compacto para as grandes."""
+    if MODO_MATRIZES == 'heatmap' or (MODO_MATRIZES == 'auto' and df.size > LIMITE_CELULAS_TABELA):
+        return dataframe_to_heatmap(df, rotulos_linhas, is_percent)
+    return tabela_html(df, is_percent=is_percent)
+
+def tabela_maiores_mudancas(eventos):
+    """Tabela da Movimentação por Horário com os eventos de `maiores_mudancas`."""
+    if eventos.empty:
+        return html.P("Nenhuma mudança de preço entre as pesquisas do dia para os filtros selecionados.")
+    tabela = pd.DataFrame({
+        'HORÁRIO': eventos['DATA_HORA'].dt.strftime('%H:%M'),
+        'PESQUISA ANTERIOR': eventos['DATA_HORA_ANTERIOR'].dt.strftime('%H:%M'),
+        'LOCALIDADE': eventos['LOCALIDADE'],
+        'RETIRADA': eventos['RETIRADA'].dt.strftime('%d/%m/%Y'),
+        'LOR': eventos['DURAÇÃO'] if 'DURAÇÃO' in eventos.columns else None,
+        'CATEGORIA': eventos['CATEGORIA'],
+        'LOCADORA': eventos['LOCADORA'],
+        'PREÇO ANTERIOR': eventos['PRECO_ANTERIOR'].map(formatar_moeda),
+        'PREÇO ATUAL': eventos['PREÇO'].map(formatar_moeda),
+        'VARIAÇÃO': eventos['VARIACAO'].map(lambda v: ('+' if v > 0 else '-') + formatar_moeda(abs(v))),
+        'VARIAÇÃO %': eventos['VARIACAO_PCT'].map(lambda v: f"{v:+.2%}"),
+    })
+    return dbc.Table.from_dataframe(tabela.astype(object).fillna('-'), striped=True, bordered=True, hover=True, color='dark', responsive=True, size='sm')
+
+@callback_pesado(
     Output('tabela-header-pos-loja', 'children'),
     Output('matriz-menor-preco-container', 'children'),
     Output('matriz-diferenca-foco-container', 'children'),
     Input({'type': 'options-list-pos-loja', 'index': ALL}, 'value'),
-    State({'type': 'options-list-pos-loja', 'index': ALL}, 'id')
+    State({'type': 'options-list-pos-loja', 'index': ALL}, 'id'),
+    **argumentos_progresso('pos-loja')
 )
-def update_dynamic_posicionamento_loja(valores_dos_filtros, ids_dos_filtros):
-    if df_tabela.empty:
-        return html.Tr(html.Th("Nenhum dado carregado")), "", ""
-
+def update_dynamic_posicionamento_loja(set_progress, valores_dos_filtros, ids_dos_filtros):
+    dados = obter_dados()
     filtros_ativos = {id_filtro['index']: valores for id_filtro, valores in zip(ids_dos_filtros, valores_dos_filtros) if valores}
-
-    is_initial_load = not ctx.triggered_id and not filtros_ativos
-    if is_initial_load and plano_recente != "N/A":
-        filtros_ativos = {'PLANO': [plano_recente]}
+    if not ctx.triggered_id and not filtros_ativos:
+        # Carga inicial: a visão padrão (PLANO == plano_recente)
+        return resposta_padrao(dados, 'posicionamento_loja')
+    return montar_posicionamento_loja(dados, filtros_ativos, set_progress)
+
+def montar_posicionamento_loja(dados, filtros_ativos, set_progress):
+    consultas = dados.consultas
+    if consultas.vazia('base'):
+        return html.Tr(html.Th("Nenhum dado carregado")), "", ""
 
     page_prefix = 'pos-loja'
     header_rows = []
-    colunas_de_filtro = df_tabela.columns.tolist()
+    colunas_de_filtro = consultas.colunas('base')
+    opcoes_por_coluna = consultas.opcoes_filtros('base', colunas_de_filtro, filtros_ativos)
 
     for coluna in colunas_de_filtro:
-        df_para_opcoes = df_tabela.copy()
-        for outra_coluna, valores in filtros_ativos.items():
-            if outra_coluna != coluna and outra_coluna in df_para_opcoes.columns:
-                df_para_opcoes = df_para_opcoes[df_para_opcoes[outra_coluna].astype(str).isin(valores)]
-
-        opcoes_unicas = sorted(df_para_opcoes[coluna].dropna().astype(str).unique())
+        opcoes_unicas = opcoes_por_coluna[coluna]
         valores_selecionados_atuais = filtros_ativos.get(coluna, opcoes_unicas)
 
         width_px = max(120, min(400, len(coluna) * 9 + 60))
@@ -1223,64 +3337,63 @@ def update_dynamic_posicionamento_loja(valores_dos_filtros, ids_dos_filtros):
         ], style={'width': width_str, 'maxWidth': width_str, 'minWidth': width_str})
         header_rows.append(header_cell)
     cabecalho_final = html.Tr(header_rows)
+    set_progress((20, "Aplicando filtros..."))
 
-    dff = df_calculos.copy()
-    if filtros_ativos:
-        for nome_da_coluna, valores in filtros_ativos.items():
-            if not valores:
-                msg_vazia = html.P("Nenhum dado para a seleção (um filtro está vazio).")
-                return cabecalho_final, msg_vazia, msg_vazia
-            if nome_da_coluna in dff.columns:
-                dff = dff[dff[nome_da_coluna].astype(str).isin([str(v) for v in valores])]
+    if any(not valores for valores in filtros_ativos.values()):
+        msg_vazia = html.P("Nenhum dado para a seleção (um filtro está vazio).")
+        return cabecalho_final, msg_vazia, msg_vazia
 
-    if dff.empty:
+    linhas_filtradas, menores_precos = consultas.menores_precos(filtros_ativos, ['RETIRADA', 'LOCALIDADE'])
+    registrar_linhas_processadas(linhas_filtradas)
+    if not linhas_filtradas:
         msg_vazia = html.P("Nenhum dado encontrado para os filtros aplicados.")
         return cabecalho_final, msg_vazia, msg_vazia
 
+    set_progress((40, "Calculando Matriz 1..."))
     try:
-        idx_min_preco = dff.loc[dff.groupby(['RETIRADA', 'LOCALIDADE'])['PREÇO'].idxmin()]
-        matriz1_df = idx_min_preco.pivot_table(index='RETIRADA', columns='LOCALIDADE', values='LOCADORA', aggfunc='first').fillna("-")
-        tabela1_html = dataframe_to_html_table(matriz1_df)
+        matriz1_df = menores_precos['VENCEDORA'].unstack(level='LOCALIDADE').fillna("-")
+        tabela1_html = renderizar_matriz(matriz1_df, [index.strftime('%d/%m/%Y') for index in matriz1_df.index], dataframe_to_html_table)
     except Exception as e:
         tabela1_html = dbc.Alert(f"Erro ao gerar Matriz 1: {e}", color="danger")
 
+    set_progress((70, "Calculando Matriz 2..."))
     try:
-        matriz2_series = dff.groupby(['RETIRADA', 'LOCALIDADE']).apply(calculate_foco_diff, include_groups=False)
+        matriz2_series = diferenca_foco(menores_precos)
         matriz2_df = matriz2_series.unstack(level='LOCALIDADE')
-        tabela2_html = dataframe_to_html_table(matriz2_df, is_percent=True)
+        tabela2_html = renderizar_matriz(matriz2_df, [index.strftime('%d/%m/%Y') for index in matriz2_df.index], dataframe_to_html_table, is_percent=True)
     except Exception as e:
         tabela2_html = dbc.Alert(f"Erro ao gerar Matriz 2: {e}", color="danger")
 
     return cabecalho_final, tabela1_html, tabela2_html
 
-@app.callback(
+@callback_pesado(
     Output('tabela-header-pos-cat', 'children'),
     Output('matriz-menor-preco-categoria-container', 'children'),
     Output('matriz-diferenca-foco-categoria-container', 'children'),
     Input({'type': 'options-list-pos-cat', 'index': ALL}, 'value'),
-    State({'type': 'options-list-pos-cat', 'index': ALL}, 'id')
+    State({'type': 'options-list-pos-cat', 'index': ALL}, 'id'),
+    **argumentos_progresso('pos-cat')
 )
-def update_dynamic_posicionamento_categoria(valores_dos_filtros, ids_dos_filtros):
-    if df_tabela.empty:
-        return html.Tr(html.Th("Nenhum dado carregado")), "", ""
-
+def update_dynamic_posicionamento_categoria(set_progress, valores_dos_filtros, ids_dos_filtros):
+    dados = obter_dados()
     filtros_ativos = {id_filtro['index']: valores for id_filtro, valores in zip(ids_dos_filtros, valores_dos_filtros) if valores}
-
-    is_initial_load = not ctx.triggered_id and not filtros_ativos
-    if is_initial_load and plano_recente != "N/A":
-        filtros_ativos = {'PLANO': [plano_recente]}
+    if not ctx.triggered_id and not filtros_ativos:
+        # Carga inicial: a visão padrão (PLANO == plano_recente)
+        return resposta_padrao(dados, 'posicionamento_categoria')
+    return montar_posicionamento_categoria(dados, filtros_ativos, set_progress)
+
+def montar_posicionamento_categoria(dados, filtros_ativos, set_progress):
+    consultas = dados.consultas
+    if consultas.vazia('base'):
+        return html.Tr(html.Th("Nenhum dado carregado")), "", ""
 
     page_prefix = 'pos-cat'
     header_rows = []
-    colunas_de_filtro = df_tabela.columns.tolist()
+    colunas_de_filtro = consultas.colunas('base')
+    opcoes_por_coluna = consultas.opcoes_filtros('base', colunas_de_filtro, filtros_ativos)
 
     for coluna in colunas_de_filtro:
-        df_para_opcoes = df_tabela.copy()
-        for outra_coluna, valores in filtros_ativos.items():
-            if outra_coluna != coluna and outra_coluna in df_para_opcoes.columns:
-                df_para_opcoes = df_para_opcoes[df_para_opcoes[outra_coluna].astype(str).isin(valores)]
-
-        opcoes_unicas = sorted(df_para_opcoes[coluna].dropna().astype(str).unique())
+        opcoes_unicas = opcoes_por_coluna[coluna]
         valores_selecionados_atuais = filtros_ativos.get(coluna, opcoes_unicas)
 
         width_px = max(120, min(400, len(coluna) * 9 + 60))
@@ -1295,36 +3408,33 @@ def update_dynamic_posicionamento_categoria(valores_dos_filtros, ids_dos_filtros
         ], style={'width': width_str, 'maxWidth': width_str, 'minWidth': width_str})
         header_rows.append(header_cell)
     cabecalho_final = html.Tr(header_rows)
+    set_progress((20, "Aplicando filtros..."))
 
-    dff = df_calculos.copy()
-    if filtros_ativos:
-        for nome_da_coluna, valores in filtros_ativos.items():
-            if not valores:
-                msg_vazia = html.P("Nenhum dado para a seleção (um filtro está vazio).")
-                return cabecalho_final, msg_vazia, msg_vazia
-            if nome_da_coluna in dff.columns:
-                dff = dff[dff[nome_da_coluna].astype(str).isin([str(v) for v in valores])]
+    if any(not valores for valores in filtros_ativos.values()):
+        msg_vazia = html.P("Nenhum dado para a seleção (um filtro está vazio).")
+        return cabecalho_final, msg_vazia, msg_vazia
 
-    if dff.empty:
+    linhas_filtradas, menores_precos = consultas.menores_precos(filtros_ativos, ['CATEGORIA', 'RETIRADA'])
+    registrar_linhas_processadas(linhas_filtradas)
+    if not linhas_filtradas:
         msg_vazia = html.P("Nenhum dado encontrado para os filtros aplicados.")
         return cabecalho_final, msg_vazia, msg_vazia
 
+    set_progress((40, "Calculando Matriz 1..."))
     try:
-        idx_min_preco = dff.loc[dff.groupby(['CATEGORIA', 'RETIRADA'])['PREÇO'].idxmin()]
-        matriz1_df = idx_min_preco.pivot_table(
-            index='CATEGORIA', columns='RETIRADA', values='LOCADORA', aggfunc='first'
-        )
+        matriz1_df = menores_precos['VENCEDORA'].unstack(level='RETIRADA')
         matriz1_df.columns = [col.strftime('%d/%m') for col in matriz1_df.columns]
         matriz1_df.fillna("-", inplace=True)
-        tabela1_html = dataframe_to_html_table_categoria(matriz1_df)
+        tabela1_html = renderizar_matriz(matriz1_df, [str(index) for index in matriz1_df.index], dataframe_to_html_table_categoria)
     except Exception as e:
         tabela1_html = dbc.Alert(f"Erro ao gerar Matriz 1: {e}", color="danger")
 
+    set_progress((70, "Calculando Matriz 2..."))
     try:
-        matriz2_series = dff.groupby(['CATEGORIA', 'RETIRADA']).apply(calculate_foco_diff, include_groups=False)
+        matriz2_series = diferenca_foco(menores_precos)
         matriz2_df = matriz2_series.unstack(level='RETIRADA')
         matriz2_df.columns = [col.strftime('%d/%m') for col in matriz2_df.columns]
-        tabela2_html = dataframe_to_html_table_categoria(matriz2_df, is_percent=True)
+        tabela2_html = renderizar_matriz(matriz2_df, [str(index) for index in matriz2_df.index], dataframe_to_html_table_categoria, is_percent=True)
     except Exception as e:
         tabela2_html = dbc.Alert(f"Erro ao gerar Matriz 2: {e}", color="danger")
 
@@ -1337,6 +3447,7 @@ def update_dynamic_posicionamento_categoria(valores_dos_filtros, ids_dos_filtros
     Output('filtro-locadora-horario', 'options'),
     Output('filtro-categoria-horario', 'options'),
     Output('filtro-lor-horario', 'options'),
+    Output('tabela-mudancas-horario', 'children'),
     Input('filtro-data-horario', 'date'),
     Input('filtro-retirada-horario', 'date'),
     Input('filtro-localidade-horario', 'value'),
@@ -1345,35 +3456,46 @@ def update_dynamic_posicionamento_categoria(valores_dos_filtros, ids_dos_filtros
     Input('filtro-lor-horario', 'value'),
 )
 def update_movimentacao_horario(selected_date, selected_retirada_date, localidades, locadoras, categorias, lor):
+    dados = obter_dados()
+    if selected_date == dia_padrao_movimentacao(dados) and not (selected_retirada_date or localidades or locadoras or categorias or lor):
+        return resposta_padrao(dados, 'movimentacao_horario')
+    return montar_movimentacao_horario(dados, selected_date, selected_retirada_date, localidades, locadoras, categorias, lor)
+
+def montar_movimentacao_horario(dados, selected_date, selected_retirada_date, localidades, locadoras, categorias, lor):
+    import plotly.express as px
+    consultas = dados.consultas
     fig_vazia = go.Figure().update_layout(paper_bgcolor="#3c3c3c", plot_bgcolor="#2b2b2b", font_color="#f0f0f0", xaxis={"visible": False}, yaxis={"visible": False})
 
-    if not selected_date or df.empty:
+    if not selected_date or consultas.vazia('base'):
         fig_vazia.update_layout(title_text='Por favor, selecione uma data de pesquisa para começar')
-        return fig_vazia, [], [], [], []
+        return fig_vazia, [], [], [], [], None
 
-    dff = df.copy()
     start_date = pd.to_datetime(selected_date).normalize()
     end_date = start_date + pd.Timedelta(days=1)
-    dff = dff[(dff['DATA_HORA'] >= start_date) & (dff['DATA_HORA'] < end_date)]
-
+    start_retirada = end_retirada = None
     if selected_retirada_date:
         start_retirada = pd.to_datetime(selected_retirada_date).normalize()
         end_retirada = start_retirada + pd.Timedelta(days=1)
-        dff = dff[(dff['RETIRADA'] >= start_retirada) & (dff['RETIRADA'] < end_retirada)]
+    dff = consultas.linhas_movimentacao(start_date, end_date, start_retirada, end_retirada)
 
-    opcoes_localidade_dinamicas = [{'label': i, 'value': i} for i in sorted(dff['LOCALIDADE'].dropna().unique())]
-    opcoes_locadora_dinamicas = [{'label': i, 'value': i} for i in sorted(dff['LOCADORA'].dropna().unique())]
-    opcoes_categoria_dinamicas = [{'label': i, 'value': i} for i in sorted(dff['CATEGORIA'].dropna().unique())]
-    opcoes_lor_dinamicas = [{'label': i, 'value': i} for i in sorted(dff['DURAÇÃO'].dropna().unique())] if 'DURAÇÃO' in dff.columns else []
+    facetas = consultas.facetas_movimentacao(start_date, start_retirada)
+    opcoes_localidade_dinamicas = [{'label': i, 'value': i} for i in facetas['LOCALIDADE']]
+    opcoes_locadora_dinamicas = [{'label': i, 'value': i} for i in facetas['LOCADORA']]
+    opcoes_categoria_dinamicas = [{'label': i, 'value': i} for i in facetas['CATEGORIA']]
+    opcoes_lor_dinamicas = [{'label': i, 'value': i} for i in facetas['DURAÇÃO']]
 
     if localidades: dff = dff[dff['LOCALIDADE'].isin(localidades)]
     if locadoras: dff = dff[dff['LOCADORA'].isin(locadoras)]
     if categorias: dff = dff[dff['CATEGORIA'].isin(categorias)]
     if lor and 'DURAÇÃO' in dff.columns: dff = dff[dff['DURAÇÃO'].isin(lor)]
+    registrar_linhas_processadas(len(dff))
 
     if dff.empty:
         fig_vazia.update_layout(title_text='Nenhum dado encontrado para os filtros selecionados')
-        return fig_vazia, opcoes_localidade_dinamicas, opcoes_locadora_dinamicas, opcoes_categoria_dinamicas, opcoes_lor_dinamicas
+        return fig_vazia, opcoes_localidade_dinamicas, opcoes_locadora_dinamicas, opcoes_categoria_dinamicas, opcoes_lor_dinamicas, None
+
+    filtros_mudancas = {'LOCALIDADE': localidades, 'LOCADORA': locadoras, 'CATEGORIA': categorias, 'DURAÇÃO': lor}
+    tabela_mudancas = tabela_maiores_mudancas(consultas.maiores_mudancas(start_date, start_retirada, filtros_mudancas))
 
     dff = dff.sort_values('DATA_HORA')
     title_date = pd.to_datetime(selected_date).strftime('%d/%m/%Y')
@@ -1382,7 +3504,7 @@ def update_movimentacao_horario(selected_date, selected_retirada_date, localidad
     fig.update_xaxes(tickformat='%H:%M')
     fig.update_layout(paper_bgcolor="#3c3c3c", plot_bgcolor="#2b2b2b", font_color="#f0f0f0", xaxis_gridcolor="#444", yaxis_gridcolor="#444", legend_title_text='Locadora', xaxis_title="Horário da Pesquisa", yaxis_title="Preço (R$)")
 
-    return fig, opcoes_localidade_dinamicas, opcoes_locadora_dinamicas, opcoes_categoria_dinamicas, opcoes_lor_dinamicas
+    return fig, opcoes_localidade_dinamicas, opcoes_locadora_dinamicas, opcoes_categoria_dinamicas, opcoes_lor_dinamicas, tabela_mudancas
 
 
 @app.callback(
@@ -1398,41 +3520,55 @@ def update_movimentacao_horario(selected_date, selected_retirada_date, localidad
     Input('filtro-locadora', 'value')
 )
 def update_dashboard(localidades, locadoras):
+    dados = obter_dados()
+    if not localidades and not locadoras:
+        return resposta_padrao(dados, 'dashboard')
+    return montar_dashboard(dados, localidades, locadoras)
+
+def montar_dashboard(dados, localidades, locadoras):
+    import plotly.express as px
+    consultas = dados.consultas
     fig_vazia = go.Figure().update_layout(title_text='Nenhum dado para os filtros', paper_bgcolor="#3c3c3c", plot_bgcolor="#2b2b2b", font_color="#f0f0f0", xaxis={"visible": False}, yaxis={"visible": False})
 
-    if df.empty:
+    if consultas.vazia('base'):
          return "R$ 0,00", "0", "0", fig_vazia, fig_vazia, fig_vazia, [], []
 
-    df_op_loc = df.copy()
-    if locadoras:
-        df_op_loc = df_op_loc[df_op_loc['LOCADORA'].isin(locadoras)]
-    opcoes_localidade = [{'label': i, 'value': i} for i in sorted(df_op_loc['LOCALIDADE'].dropna().unique())]
-
-    df_op_locadora = df.copy()
-    if localidades:
-        df_op_locadora = df_op_locadora[df_op_locadora['LOCALIDADE'].isin(localidades)]
-    opcoes_locadora = [{'label': i, 'value': i} for i in sorted(df_op_locadora['LOCADORA'].dropna().unique())]
-
-    dff = df.copy()
-    if localidades: dff = dff[dff['LOCALIDADE'].isin(localidades)]
-    if locadoras: dff = dff[dff['LOCADORA'].isin(locadoras)]
+    resumo = consultas.resumo_dashboard(localidades, locadoras)
+    opcoes_localidade = [{'label': i, 'value': i} for i in resumo['opcoes_localidade']]
+    opcoes_locadora = [{'label': i, 'value': i} for i in resumo['opcoes_locadora']]
+    registrar_linhas_processadas(resumo['total'])
 
-    if dff.empty:
+    if not resumo['total']:
         return "R$ 0,00", "0", "0", fig_vazia, fig_vazia, fig_vazia, opcoes_localidade, opcoes_locadora
 
     custom_template = { "layout": { "paper_bgcolor": "#3c3c3c", "plot_bgcolor": "#2b2b2b", "font": {"color": "#f0f0f0"}, "xaxis": {"gridcolor": "#444"}, "yaxis": {"gridcolor": "#444"}, "colorway": px.colors.sequential.Plotly3 } }
-    preco_medio = dff['PREÇO'].mean()
-    fig_preco_loc = px.bar(dff.groupby('LOCADORA')['PREÇO'].mean().sort_values(ascending=False).reset_index(), x='LOCADORA', y='PREÇO', title='Preço Médio por Locadora', text_auto='.2f', template=custom_template).update_traces(marker_color='#42a5f5', textposition='outside')
-    fig_dist_cat = px.pie(dff, names='CATEGORIA', title='Distribuição por Categoria', hole=0.4, template=custom_template).update_traces(textposition='inside', textinfo='percent+label')
-    df_preco_tempo = dff.groupby(dff['DATA_HORA'].dt.date)['PREÇO'].mean().reset_index()
-    fig_preco_tmp = px.line(df_preco_tempo, x='DATA_HORA', y='PREÇO', title='Evolução do Preço Médio', markers=True, template=custom_template)
+    preco_medio = resumo['preco_medio']
+    fig_preco_loc = px.bar(resumo['preco_por_locadora'], x='LOCADORA', y='PREÇO', title='Preço Médio por Locadora', text_auto='.2f', template=custom_template).update_traces(marker_color='#42a5f5', textposition='outside')
+    # A pizza recebe as contagens já agregadas, não uma linha por pesquisa
+    fig_dist_cat = px.pie(resumo['contagem_categoria'], names='CATEGORIA', values='QUANTIDADE', title='Distribuição por Categoria', hole=0.4, template=custom_template).update_traces(textposition='inside', textinfo='percent+label')
+    fig_preco_tmp = px.line(resumo['preco_por_dia'], x='DATA_HORA', y='PREÇO', title='Evolução do Preço Médio', markers=True, template=custom_template)
 
     return (f"R$ {preco_medio:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
-            f"{len(dff):,}".replace(",", "."), f"{dff['LOCADORA'].nunique()}",
+            f"{resumo['total']:,}".replace(",", "."), f"{resumo['num_locadoras']}",
             fig_preco_loc, fig_dist_cat, fig_preco_tmp,
             opcoes_localidade, opcoes_locadora)
 
 
+# Construtores das visões padrão (ver "VISÕES PADRÃO E AQUECIMENTO"): os mesmos argumentos que
+# cada callback recebe na primeira carga da página
+def filtros_posicionamento_padrao(dados):
+    return {'PLANO': [dados.plano_recente]} if dados.plano_recente != "N/A" else {}
+
+VISOES_PADRAO = {
+    'geral': lambda dados: montar_tabela_geral(dados, None, [], None, None, 1, []),
+    'comparativo': lambda dados: montar_tabela_comparativo(dados, None, [], None, PLANO_MAIS_RECENTE, REFERENCIA_ANTERIOR, 1, []),
+    'posicionamento_loja': lambda dados: montar_posicionamento_loja(dados, filtros_posicionamento_padrao(dados), lambda *_: None),
+    'posicionamento_categoria': lambda dados: montar_posicionamento_categoria(dados, filtros_posicionamento_padrao(dados), lambda *_: None),
+    'dashboard': lambda dados: montar_dashboard(dados, None, None),
+    'movimentacao_horario': lambda dados: montar_movimentacao_horario(dados, dia_padrao_movimentacao(dados), None, None, None, None, None),
+}
+
+
 # --- CALLBACKS CLIENTSIDE ---
 def create_clientside_filter_callback(page_prefix):
     clientside_callback(
@@ -1548,8 +3684,212 @@ clientside_callback(
     State('scrollable-container-mov-horario', 'style'),
     prevent_initial_call=True
 )
+# ==============================================================================
+# 7. EXPORTAÇÃO DA VISÃO FILTRADA (CSV / PARQUET / ARROW EM STREAMING)
+# ==============================================================================
+# A exportação percorre as linhas filtradas em blocos (recortes do DataFrame do snapshot ou
+# lotes Arrow do DuckDB): cada bloco é formatado e enviado antes do próximo, de modo que nem a
+# cópia filtrada completa nem o texto formatado de todas as linhas ficam em memória ao mesmo tempo.
+LINHAS_POR_BLOCO_EXPORTACAO = int(os.environ.get('SEA_DASH_LINHAS_POR_BLOCO_EXPORTACAO', 50000))
+
+FORMATOS_EXPORTACAO = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+class BufferStreaming(io.RawIOBase):
+    """Arquivo só de escrita que acumula bytes até serem consumidos pelo gerador da resposta."""
+    def __init__(self):
+        super().__init__()
+        self._partes = []
+        self._posicao = 0
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        dados = bytes(dados)
+        self._partes.append(dados)
+        self._posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        return self._posicao
+
+    def consumir(self):
+        dados = b''.join(self._partes)
+        self._partes = []
+        return dados
+
+def gerar_csv(blocos, formatar):
+    primeiro = True
+    for bloco in blocos:
+        texto = formatar(bloco).to_csv(index=False, header=primeiro)
+        yield (('\ufeff' if primeiro else '') + texto).encode('utf-8')  # BOM para o Excel reconhecer UTF-8
+        primeiro = False
+
+def gerar_parquet(blocos, formatar):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    buffer = BufferStreaming()
+    escritor = None
+    for bloco in blocos:
+        tabela = pa.Table.from_pandas(formatar(bloco), preserve_index=False)
+        if escritor is None:
+            escritor = pq.ParquetWriter(buffer, tabela.schema, compression='zstd')
+        escritor.write_table(tabela)
+        yield buffer.consumir()
+    escritor.close()
+    yield buffer.consumir()
+
+def gerar_arrow(blocos, formatar):
+    import pyarrow as pa
+    buffer = BufferStreaming()
+    escritor = None
+    for bloco in blocos:
+        tabela = pa.Table.from_pandas(formatar(bloco), preserve_index=False)
+        if escritor is None:
+            escritor = pa.ipc.new_stream(buffer, tabela.schema)
+        escritor.write_table(tabela)
+        yield buffer.consumir()
+    escritor.close()
+    yield buffer.consumir()
+
+def ler_filtros_requisicao():
+    """Filtros da requisição (parâmetro 'filtros': JSON nome exibido -> lista de textos, como nas tabelas)."""
+    filtros_ativos = json.loads(flask.request.values.get('filtros') or '{}')
+    if not isinstance(filtros_ativos, dict) or not all(isinstance(v, list) for v in filtros_ativos.values()):
+        raise ValueError("filtros")
+    return filtros_ativos
+
+def visao_da_requisicao(dados, visao):
+    """Visão consultada: no comparativo, a do par de planos dos parâmetros 'plano_atual' e 'referencia'."""
+    if visao != 'comparativo':
+        return visao
+    return dados.visao_comparativo(flask.request.values.get('plano_atual'), flask.request.values.get('referencia'))
+
+@server.route('/exportar/<visao>', methods=['GET', 'POST'])
+@login_obrigatorio
+def exportar_visao(visao):
+    formato = flask.request.values.get('formato', 'csv')
+    dados = obter_dados()  # o snapshot fica fixo durante todo o download, mesmo se o arquivo for recarregado
+    consultas = dados.consultas
+    if visao not in ('base', 'comparativo') or formato not in FORMATOS_EXPORTACAO:
+        return flask.Response("Visão ou formato de exportação inválido\n", status=404, mimetype='text/plain')
+
+    try:
+        filtros_ativos = ler_filtros_requisicao()
+    except ValueError:
+        return flask.Response("Parâmetro 'filtros' inválido\n", status=400, mimetype='text/plain')
+    try:
+        visao_consultada = visao_da_requisicao(dados, visao)
+    except ValueError as erro:
+        return flask.Response(f"Parâmetro 'plano_atual' ou 'referencia' inválido: {erro}\n", status=400, mimetype='text/plain')
+
+    def formatar(bloco):
+        return formatar_tabela(bloco.copy(), FORMATOS_EXIBICAO[visao]) if formato == 'csv' else bloco
+
+    geradores = {'csv': gerar_csv, 'parquet': gerar_parquet, 'arrow': gerar_arrow}
+    mimetype, extensao = FORMATOS_EXPORTACAO[formato]
+    nome_arquivo = f"sea_dash_{visao}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extensao}"
+    usuario = flask.session.get('username') or 'token de API'
+
+    def blocos_contados():
+        # As linhas são contadas enquanto saem, sem uma consulta extra só para o log
+        linhas, completa = 0, False
+        try:
+            for bloco in consultas.blocos(visao_consultada, filtros_ativos, LINHAS_POR_BLOCO_EXPORTACAO):
+                linhas += len(bloco)
+                yield bloco
+            completa = True
+        finally:
+            print(f"Exportação '{visao_consultada}' ({formato}) por {usuario}: {linhas} linhas"
+                  f"{'' if completa else ' (interrompida)'}.")
+
+    return flask.Response(
+        flask.stream_with_context(geradores[formato](blocos_contados(), formatar)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{nome_arquivo}"'},
+    )
+
+# ==============================================================================
+# 8. API DE DADOS (SOMENTE LEITURA)
+# ==============================================================================
+# /api/dados/<visao> (base ou comparativo) devolve a visão filtrada com a mesma semântica das
+# tabelas (parâmetro 'filtros', incluindo a busca livre da Base), a partir do snapshot em memória
+# (ou do DuckDB), sem reler o parquet. No comparativo, 'plano_atual' e 'referencia' escolhem o par
+# de planos como na página (padrão: o mais recente vs. o anterior):
+#   formato=json  (padrão) página tipada: pagina, por_pagina (até API_MAX_POR_PAGINA), ordenar, sentido=asc|desc
+#   formato=arrow todas as linhas filtradas, em streaming IPC (como /exportar)
+# Acesso como em /exportar (`login_obrigatorio`): a sessão do dashboard ou, para consumidores
+# automatizados, um dos tokens de SEA_DASH_API_TOKENS no cabeçalho "Authorization: Bearer <token>".
+API_POR_PAGINA = 1000
+API_MAX_POR_PAGINA = int(os.environ.get('SEA_DASH_API_MAX_POR_PAGINA', 10000))
+
+def erro_api(mensagem, status=400):
+    return flask.jsonify({'erro': mensagem}), status
+
+@server.route('/api/dados/<visao>', methods=['GET', 'POST'])
+@login_obrigatorio
+def api_dados(visao):
+    dados = obter_dados()
+    consultas = dados.consultas
+    formato = flask.request.values.get('formato', 'json')
+    if visao not in ('base', 'comparativo'):
+        return erro_api("Visão inválida (use 'base' ou 'comparativo').", 404)
+    if formato not in ('json', 'arrow'):
+        return erro_api("Formato inválido (use 'json' ou 'arrow').")
+    try:
+        filtros_ativos = ler_filtros_requisicao()
+    except ValueError:
+        return erro_api("Parâmetro 'filtros' inválido: use um JSON {coluna: [valores]}.")
+    try:
+        visao_consultada = visao_da_requisicao(dados, visao)
+    except ValueError as erro:
+        return erro_api(f"Parâmetro 'plano_atual' ou 'referencia' inválido: {erro}")
+
+    if formato == 'arrow':
+        return flask.Response(
+            flask.stream_with_context(gerar_arrow(consultas.blocos(visao_consultada, filtros_ativos, LINHAS_POR_BLOCO_EXPORTACAO), lambda bloco: bloco)),
+            mimetype=FORMATOS_EXPORTACAO['arrow'][0])
+
+    try:
+        pagina = int(flask.request.values.get('pagina', 1))
+        por_pagina = int(flask.request.values.get('por_pagina', API_POR_PAGINA))
+        if pagina < 1 or not 1 <= por_pagina <= API_MAX_POR_PAGINA:
+            raise ValueError
+    except ValueError:
+        return erro_api(f"'pagina' deve ser >= 1 e 'por_pagina' entre 1 e {API_MAX_POR_PAGINA}.")
+    ordenacao = None
+    if flask.request.values.get('ordenar'):
+        if flask.request.values['ordenar'] not in consultas.colunas(visao_consultada):
+            return erro_api(f"Coluna de ordenação desconhecida: {flask.request.values['ordenar']}.")
+        ordenacao = {'coluna': flask.request.values['ordenar'], 'crescente': flask.request.values.get('sentido', 'asc') != 'desc'}
+
+    total = consultas.contar(visao_consultada, filtros_ativos)
+    inicio = (pagina - 1) * por_pagina
+    linhas = consultas.pagina(visao_consultada, filtros_ativos, inicio, inicio + por_pagina, ordenacao, formatado=False)
+    return flask.jsonify({
+        'visao': visao,
+        'pagina': pagina,
+        'por_pagina': por_pagina,
+        'total': total,
+        'paginas': math.ceil(total / por_pagina),
+        'colunas': consultas.colunas(visao_consultada),
+        'linhas': json.loads(linhas.to_json(orient='records', date_format='iso', force_ascii=False)),
+    })
+
+registrar_tempo_startup('callbacks')
+
+if AQUECIMENTO != '0':
+    iniciar_aquecimento(obter_dados(), em_segundo_plano=AQUECIMENTO == 'segundo_plano')
+    registrar_tempo_startup('aquecimento')
+imprimir_relatorio_startup()
 
 
 if __name__ == '__main__':
+    if DATABASE_URL:
+        initialize_database()
     # A porta 7860 é a padrão que o Hugging Face espera.
     app.run_server(debug=False, host='0.0.0.0', port=7860)
@@ -0,0 +1,8 @@
+"""
+Benchmarks do SEA-DASH.
+
+- `gerador`: gera dados sintéticos de raspagem no mesmo formato de `dados_consolidados.parquet`.
+- `harness`: mede carregamento, comparativo e callbacks em vários tamanhos de base.
+
+Uso: python -m benchmarks --linhas 10000 100000 1000000 10000000
+"""
@@ -0,0 +1,295 @@
+"""
+Teste de carga do SEA-DASH: N usuários virtuais simultâneos contra `app.server`.
+
+Cada usuário virtual faz login (callback `handle_login`) e, até o fim da duração, visita
+páginas sorteadas como um analista faria: navegação (roteador), carga inicial da página e
+algumas interações — filtros de cabeçalho, troca de página da Base/Comparativo, filtros do
+Posicionamento, data e localidade da Movimentação —, com um tempo de reflexão entre as
+requisições. Para cada callback são reportadas as latências p50/p95/p99 e a taxa de erro.
+
+O banco de usuários é um SQLite temporário no lugar do PostgreSQL (`--banco sqlite`, padrão):
+as funções de banco do app são trocadas por equivalentes em SQLite neste processo, com os
+usuários virtuais já cadastrados, e o login não faz a geolocalização por IP (chamada externa).
+Com `--banco postgres` o DATABASE_URL do ambiente é usado e todos os usuários virtuais entram
+com `--usuario`/`--senha`.
+
+As requisições passam pelo mesmo caminho do navegador (`/_dash-update-component`, ver
+cliente_dash), em threads de um único processo — o equivalente a um worker `gthread` do
+gunicorn. Os callbacks pesados rodam de forma síncrona (sem o gerenciador em segundo plano).
+
+Uso: python -m benchmarks.carga --usuarios 1 5 20 --duracao 60 [--dados arquivo.parquet] [--json resultados.json]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from contextlib import closing
+
+from benchmarks.cliente_dash import chamar_callback
+
+SENHA_PADRAO = 'carga-sea-dash'
+# Peso de cada página no sorteio das visitas
+PESOS_PAGINAS = {
+    '/': 2,
+    '/comparativo': 1,
+    '/dashboard': 1,
+    '/posicionamento': 2,
+    '/posicionamento-categoria': 2,
+    '/movimentacao-horario': 2,
+}
+
+
+def instalar_banco_sqlite(app_module, caminho, usuarios, senha):
+    """Troca get_user/log_access/get_all_logs do app por versões em SQLite com `usuarios` cadastrados."""
+    from werkzeug.security import generate_password_hash
+
+    with closing(sqlite3.connect(caminho)) as conn, conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, username TEXT UNIQUE NOT NULL, "
+                     "password_hash TEXT, role TEXT NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS access_logs (id INTEGER PRIMARY KEY, timestamp TEXT DEFAULT CURRENT_TIMESTAMP, "
+                     "username TEXT NOT NULL, ip_address TEXT, location TEXT)")
+        hash_senha = generate_password_hash(senha)
+        conn.executemany("INSERT OR REPLACE INTO users (username, password_hash, role) VALUES (?, ?, 'user')",
+                         [(usuario, hash_senha) for usuario in usuarios])
+
+    def conectar():
+        conn = sqlite3.connect(caminho, timeout=30)
+        conn.row_factory = sqlite3.Row  # user['password_hash'], como o DictCursor do psycopg2
+        return conn
+
+    def get_user(username):
+        with closing(conectar()) as conn:
+            return conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+
+    def log_access(username):
+        with closing(conectar()) as conn, conn:
+            conn.execute('INSERT INTO access_logs (username, ip_address, location) VALUES (?, ?, ?)',
+                         (username, 'carga', 'Teste de carga'))
+
+    def get_all_logs():
+        import pandas as pd
+        with closing(conectar()) as conn:
+            return pd.read_sql_query('SELECT timestamp AS "HORA DO ACESSO", username AS "LOGIN", ip_address AS "IP DO COMPUTADOR", '
+                                     'location AS "LOCALIZAÇÃO" FROM access_logs ORDER BY timestamp DESC', conn)
+
+    for funcao in (get_user, log_access, get_all_logs):
+        setattr(app_module, funcao.__name__, app_module.instrumentar_db(funcao))
+
+
+def catalogo(app_module):
+    """Valores usados nos filtros sorteados (localidades, planos recentes, dias pesquisados)."""
+    import pandas as pd
+
+    dados = app_module.obter_dados()
+    consultas = dados.consultas
+    primeira, ultima = consultas.intervalo('DATA_HORA')
+    dias = [dia.date().isoformat() for dia in pd.date_range(primeira.normalize(), ultima.normalize())] if primeira is not None else []
+    return {
+        'localidades': [str(valor) for valor in consultas.valores_distintos('LOCALIDADE')],
+        'planos': sorted(dados.catalogo_planos['PLANO'].astype(str), reverse=True)[:50],
+        'dias': dias,
+        'plano_atual': app_module.PLANO_MAIS_RECENTE,
+        'referencia': app_module.REFERENCIA_ANTERIOR,
+    }
+
+
+def _id_padrao(tipo, indice, propriedade='value'):
+    """Id de um componente com curinga como o renderer o envia em changedPropIds."""
+    return json.dumps({'index': indice, 'type': tipo}, separators=(',', ':')) + f'.{propriedade}'
+
+
+def _botoes(prefixo):
+    return {f'btn-{botao}-{prefixo}.n_clicks': None for botao in ('primeira', 'anterior', 'proxima', 'ultima')}
+
+
+def _algumas(rng, valores):
+    return rng.sample(valores, rng.randint(1, max(1, len(valores) // 2))) if valores else []
+
+
+def visita(pagina, rng, valores, sessao):
+    """Requisições (callback, valores, disparado_por) de uma visita a `pagina`: navegação, carga inicial e interações."""
+    yield 'main_router_and_display', {'url.pathname': pagina, 'session-store.data': sessao}, []
+    interacoes = rng.randint(0, 3)
+
+    if pagina in ('/', '/comparativo'):
+        prefixo, callback = ('geral', 'update_dynamic_table_geral') if pagina == '/' else ('comp', 'update_dynamic_table_comparativo')
+        base = {**_botoes(prefixo), f'store-pagina-atual-{prefixo}.data': 1}
+        if prefixo == 'comp':
+            base.update({'seletor-plano-atual-comp.value': valores['plano_atual'], 'seletor-referencia-comp.value': valores['referencia']})
+        yield callback, base, []
+        pagina_atual, filtros = 1, []
+        for _ in range(interacoes):
+            if rng.random() < 0.5:
+                filtros = [('LOCALIDADE', _algumas(rng, valores['localidades']))]
+                pagina_atual = 1
+                yield callback, {**base, f'options-list-{prefixo}.value': filtros}, [_id_padrao(f'options-list-{prefixo}', 'LOCALIDADE')]
+            else:
+                yield (callback, {**base, f'btn-proxima-{prefixo}.n_clicks': 1, f'store-pagina-atual-{prefixo}.data': pagina_atual,
+                                  f'options-list-{prefixo}.value': filtros}, [f'btn-proxima-{prefixo}.n_clicks'])
+                pagina_atual += 1
+
+    elif pagina in ('/posicionamento', '/posicionamento-categoria'):
+        prefixo, callback = (('pos-loja', 'update_dynamic_posicionamento_loja') if pagina == '/posicionamento'
+                             else ('pos-cat', 'update_dynamic_posicionamento_categoria'))
+        yield callback, {}, []
+        for _ in range(interacoes):
+            filtros = [('PLANO', [rng.choice(valores['planos'])])] if valores['planos'] else []
+            filtros.append(('LOCALIDADE', _algumas(rng, valores['localidades'])))
+            yield callback, {f'options-list-{prefixo}.value': filtros}, [_id_padrao(f'options-list-{prefixo}', 'LOCALIDADE')]
+
+    elif pagina == '/dashboard':
+        yield 'update_dashboard', {}, []
+        for _ in range(interacoes):
+            yield 'update_dashboard', {'filtro-localidade.value': _algumas(rng, valores['localidades'])}, ['filtro-localidade.value']
+
+    elif pagina == '/movimentacao-horario':
+        dia = valores['dias'][-1] if valores['dias'] else None
+        yield 'update_movimentacao_horario', {'filtro-data-horario.date': dia}, []
+        for _ in range(interacoes):
+            if rng.random() < 0.5 and valores['dias']:
+                dia = rng.choice(valores['dias'])
+                yield 'update_movimentacao_horario', {'filtro-data-horario.date': dia}, ['filtro-data-horario.date']
+            else:
+                yield ('update_movimentacao_horario', {'filtro-data-horario.date': dia,
+                                                        'filtro-localidade-horario.value': _algumas(rng, valores['localidades'])},
+                       ['filtro-localidade-horario.value'])
+
+
+def _executar(cliente, app_module, registros, erros, callback, valores, disparado_por):
+    """Executa um callback, registra (callback, latência em ms, ok) e devolve o JSON da resposta (ou None)."""
+    inicio = time.perf_counter()
+    try:
+        resposta = chamar_callback(cliente, app_module.app, callback, valores, disparado_por)
+        ok = resposta.status_code in (200, 204)
+        detalhe = f'HTTP {resposta.status_code}'
+    except Exception as e:
+        resposta, ok, detalhe = None, False, repr(e)
+    registros.append((callback, (time.perf_counter() - inicio) * 1000, ok))
+    if not ok:
+        erros.setdefault(callback, detalhe)
+        return None
+    return resposta.get_json(silent=True) if resposta.status_code == 200 else {}
+
+
+def usuario_virtual(indice, app_module, valores, args, inicio, fim, registros, erros):
+    rng = random.Random(args.seed + indice)
+    cliente = app_module.server.test_client()
+    usuario = args.usuario or f'carga{indice:04d}'
+    # Entradas escalonadas no primeiro segundo, como analistas chegando
+    time.sleep(max(0.0, inicio + rng.random() - time.monotonic()))
+
+    resposta = _executar(cliente, app_module, registros, erros, 'handle_login',
+                         {'login-button.n_clicks': 1, 'login-username.value': usuario, 'login-password.value': args.senha},
+                         ['login-button.n_clicks'])
+    sessao = ((resposta or {}).get('response', {}).get('session-store') or {}).get('data')
+    if not isinstance(sessao, dict):
+        registros[-1] = ('handle_login', registros[-1][1], False)
+        erros.setdefault('handle_login', 'login recusado')
+        return
+
+    paginas, pesos = list(PESOS_PAGINAS), list(PESOS_PAGINAS.values())
+    while time.monotonic() < fim:
+        for callback, valores_callback, disparado_por in visita(rng.choices(paginas, pesos)[0], rng, valores, sessao):
+            if time.monotonic() >= fim:
+                return
+            _executar(cliente, app_module, registros, erros, callback, valores_callback, disparado_por)
+            time.sleep(min(rng.uniform(0, 2 * args.pensar), max(0.0, fim - time.monotonic())))
+
+
+def percentis(latencias):
+    if len(latencias) == 1:
+        return latencias * 3
+    quantis = statistics.quantiles(latencias, n=100, method='inclusive')
+    return quantis[49], quantis[94], quantis[98]
+
+
+def resumir(registros, usuarios, duracao):
+    """Uma linha por callback (e uma de total) com requisições, erros e p50/p95/p99."""
+    por_callback = {}
+    for callback, latencia, ok in registros:
+        por_callback.setdefault(callback, []).append((latencia, ok))
+    linhas = []
+    for callback, medidas in sorted(por_callback.items()) + [('TOTAL', [(latencia, ok) for _, latencia, ok in registros])]:
+        if not medidas:
+            continue
+        p50, p95, p99 = percentis([latencia for latencia, _ in medidas])
+        erros = sum(1 for _, ok in medidas if not ok)
+        linhas.append({'usuarios': usuarios, 'callback': callback, 'requisicoes': len(medidas), 'erros': erros,
+                       'taxa_erro': round(erros / len(medidas), 4), 'p50_ms': round(p50, 1), 'p95_ms': round(p95, 1),
+                       'p99_ms': round(p99, 1), 'vazao_rps': round(len(medidas) / duracao, 2)})
+    return linhas
+
+
+def _imprimir_tabela(resultados):
+    cabecalho = (f"{'usuários':>8}  {'callback':<40}{'req':>7}{'erros %':>9}{'p50 (ms)':>10}"
+                 f"{'p95 (ms)':>10}{'p99 (ms)':>10}{'req/s':>8}")
+    print(cabecalho)
+    print('-' * len(cabecalho))
+    for r in resultados:
+        print(f"{r['usuarios']:>8}  {r['callback']:<40}{r['requisicoes']:>7}{r['taxa_erro'] * 100:>9.1f}"
+              f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['vazao_rps']:>8.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga do SEA-DASH com usuários virtuais simultâneos.")
+    parser.add_argument('--usuarios', type=int, nargs='+', default=[1, 5, 20], help="Níveis de usuários simultâneos")
+    parser.add_argument('--duracao', type=float, default=60, help="Segundos de carga em cada nível")
+    parser.add_argument('--pensar', type=float, default=1.0, help="Tempo médio de reflexão entre requisições (s)")
+    parser.add_argument('--dados', help="Arquivo/diretório de dados (SEA_DASH_DADOS); padrão: o do app")
+    parser.add_argument('--banco', choices=('sqlite', 'postgres'), default='sqlite')
+    parser.add_argument('--usuario', help="Login de todos os usuários virtuais (obrigatório com --banco postgres)")
+    parser.add_argument('--senha', default=SENHA_PADRAO)
+    parser.add_argument('--sem-aquecimento', action='store_true', help="SEA_DASH_AQUECIMENTO=0 (sem visões padrão prontas)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="Grava os resultados brutos neste arquivo")
+    args = parser.parse_args(argv)
+    if args.banco == 'postgres' and not (args.usuario and os.environ.get('DATABASE_URL')):
+        parser.error("--banco postgres requer DATABASE_URL no ambiente e --usuario/--senha de uma conta existente.")
+
+    if args.dados:
+        os.environ['SEA_DASH_DADOS'] = args.dados
+    os.environ['SEA_DASH_BACKGROUND_CALLBACKS'] = '0'
+    if args.sem_aquecimento:
+        os.environ['SEA_DASH_AQUECIMENTO'] = '0'
+    if args.banco == 'sqlite':
+        os.environ.pop('DATABASE_URL', None)
+    import app as app_module
+
+    diretorio = tempfile.mkdtemp(prefix='sea-dash-carga-')
+    if args.banco == 'sqlite':
+        instalar_banco_sqlite(app_module, os.path.join(diretorio, 'usuarios.sqlite'),
+                              [f'carga{indice:04d}' for indice in range(max(args.usuarios))], args.senha)
+    valores = catalogo(app_module)
+
+    todos = []
+    for usuarios in args.usuarios:
+        print(f"Carga com {usuarios} usuário(s) por {args.duracao:.0f}s...", file=sys.stderr)
+        registros, erros = [], {}
+        inicio = time.monotonic()
+        fim = inicio + args.duracao
+        threads = [threading.Thread(target=usuario_virtual, args=(indice, app_module, valores, args, inicio, fim, registros, erros),
+                                    name=f'usuario-virtual-{indice}', daemon=True) for indice in range(usuarios)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for callback, detalhe in erros.items():
+            print(f"  ERRO em {callback}: {detalhe}", file=sys.stderr)
+        todos.extend(resumir(registros, usuarios, time.monotonic() - inicio))
+
+    shutil.rmtree(diretorio, ignore_errors=True)
+    _imprimir_tabela(todos)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(todos, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Cliente mínimo do protocolo `_dash-update-component`.
+
+Monta o corpo da requisição de um callback a partir de `app.callback_map`, de forma que
+os benchmarks (e testes de carga) exercitem o mesmo caminho de uma requisição real do
+navegador: desserialização, callback, serialização JSON e compressão.
+"""
+import json
+
+
+def localizar_callback(dash_app, nome):
+    """Retorna (chave, definição) do callback registrado cuja função se chama `nome`."""
+    for chave, definicao in dash_app.callback_map.items():
+        funcao = definicao.get('callback')
+        original = getattr(funcao, '__wrapped__', funcao)
+        if getattr(funcao, '__name__', None) == nome or getattr(original, '__name__', None) == nome:
+            return chave, definicao
+    raise KeyError(f"Callback '{nome}' não encontrado em app.callback_map.")
+
+
+def _id_curinga(id_componente):
+    try:
+        id_decodificado = json.loads(id_componente)
+    except (TypeError, ValueError):
+        return None
+    return id_decodificado if isinstance(id_decodificado, dict) else None
+
+
+def _especificar(dependencia, valores):
+    """
+    Gera a especificação de um Input/State. `valores` é um dict "id.propriedade" -> valor;
+    para ids com curinga (ALL) a chave é "tipo.propriedade" e o valor uma lista de (index, valor).
+    """
+    propriedade = dependencia['property']
+    curinga = _id_curinga(dependencia['id'])
+    if curinga is not None:
+        chave = f"{curinga['type']}.{propriedade}"
+        if propriedade == 'id' and chave not in valores:
+            # O State com os ids acompanha os componentes informados para qualquer outra propriedade
+            indices = next((
+                [index for index, _ in itens] for nome, itens in valores.items()
+                if nome.startswith(f"{curinga['type']}.")
+            ), [])
+            return [{'id': {'type': curinga['type'], 'index': index}, 'property': 'id',
+                     'value': {'type': curinga['type'], 'index': index}} for index in indices]
+        itens = valores.get(chave, [])
+        return [{'id': {'type': curinga['type'], 'index': index}, 'property': propriedade, 'value': valor}
+                for index, valor in itens]
+    return {'id': dependencia['id'], 'property': propriedade,
+            'value': valores.get(f"{dependencia['id']}.{propriedade}")}
+
+
+def corpo_requisicao(dash_app, nome, valores=None, disparado_por=None):
+    """Monta o JSON enviado pelo renderer do Dash para executar o callback `nome`."""
+    valores = valores or {}
+    chave, definicao = localizar_callback(dash_app, nome)
+    saidas = definicao['output'] if isinstance(definicao['output'], list) else [definicao['output']]
+    especificacao_saidas = [{'id': saida.component_id, 'property': saida.component_property} for saida in saidas]
+    return {
+        'output': chave,
+        'outputs': especificacao_saidas if isinstance(definicao['output'], list) else especificacao_saidas[0],
+        'inputs': [_especificar(dependencia, valores) for dependencia in definicao['inputs']],
+        'state': [_especificar(dependencia, valores) for dependencia in definicao['state']],
+        'changedPropIds': list(disparado_por or []),
+    }
+
+
+def chamar_callback(cliente, dash_app, nome, valores=None, disparado_por=None, headers=None):
+    """Executa o callback via `cliente` (test client do Flask ou sessão compatível) e retorna a resposta."""
+    corpo = corpo_requisicao(dash_app, nome, valores, disparado_por)
+    return cliente.post(f"{dash_app.config.requests_pathname_prefix}_dash-update-component", json=corpo, headers=headers or {})
@@ -0,0 +1,126 @@
+"""
+Gerador de dados sintéticos de raspagem.
+
+Produz um DataFrame com o mesmo esquema de `dados_consolidados.parquet` (colunas
+categóricas, `Plano`/`Data`/`Hora` por raspagem, `Locadora` com o nome longo etc.),
+incluindo as sujeiras que o app precisa limpar (categorias nulas, '-' e 'L+',
+locadoras nulas). Cada plano é uma raspagem de uma única localidade, como no arquivo real.
+
+Uso: python -m benchmarks.gerador --linhas 1000000 --saida /tmp/sinteticos.parquet
+"""
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+CODIGOS_LOCALIDADE = ['GIG', 'POA', 'REC', 'SAO', 'BSB', 'CNF', 'SSA', 'FOR', 'CWB', 'FLN',
+                      'BEL', 'MAO', 'NAT', 'MCZ', 'VIX', 'GYN', 'CGB', 'CGR', 'JPA', 'AJU']
+LOCADORAS = ['Localiza', 'Movida', 'Opaca', 'Unidas', 'Foco', 'Europcar', 'ASA Rent a Car',
+             'Gold', 'Rota do Sol', 'Locasul', 'Sucesso Locadora']
+CATEGORIAS = ['B', 'D', 'D+', 'I+', 'J', 'J+', 'K', 'H']
+MODELOS = ['Fiat Mobi', 'Renault Kwid', 'Hyundai Hb20', 'Chevrolet Onix', 'Volkswagen Polo',
+           'Fiat Argo', 'Chevrolet Spin', 'Fiat Pulse', 'Vw Nivus', 'Jeep Renegade', 'Renault Kardian',
+           'Hyundai Hb20s', 'Vw Virtus', 'Toyota Corolla', 'Jeep Compass', 'Vw Taos']
+CATEGORIAS_INVALIDAS = ['-', 'L+']
+
+
+def _nomes(base, quantidade, prefixo):
+    if quantidade <= len(base):
+        return list(base[:quantidade])
+    return list(base) + [f'{prefixo} {i}' for i in range(len(base) + 1, quantidade + 1)]
+
+
+def _localidades(quantidade):
+    nomes = []
+    for i in range(quantidade):
+        codigo = CODIGOS_LOCALIDADE[i % len(CODIGOS_LOCALIDADE)]
+        nomes.append(f'{codigo}{10 * (i // len(CODIGOS_LOCALIDADE) + 1)}')
+    return nomes
+
+
+def gerar_dados_sinteticos(linhas=100_000, localidades=4, locadoras=11, categorias=8, planos=200,
+                           retiradas=21, duracoes=(2, 6), dias=15, inicio=datetime(2025, 10, 1), seed=0):
+    """Gera `linhas` registros de raspagem distribuídos entre `planos` raspagens."""
+    rng = np.random.default_rng(seed)
+    nomes_localidade = _localidades(localidades)
+    nomes_locadora = _nomes(LOCADORAS, locadoras, 'Locadora')
+    nomes_categoria = _nomes(CATEGORIAS, categorias, 'Categoria')
+    nomes_modelo = _nomes(MODELOS, max(len(MODELOS), 2 * categorias), 'Modelo')
+
+    # --- Planos: uma raspagem por localidade, em horários únicos ao longo de `dias` dias ---
+    segundos = np.sort(rng.choice(dias * 24 * 3600, size=planos, replace=False))
+    momentos = [inicio + timedelta(seconds=int(s)) for s in segundos]
+    plano_nomes = [m.strftime('%Y.%m.%d.%H-%M-%S') for m in momentos]
+    plano_localidade = rng.integers(0, localidades, planos)
+    plano_localidade[:localidades] = np.arange(min(localidades, planos))
+
+    # --- Linhas: agrupadas por plano, como no arquivo consolidado ---
+    plano_idx = np.sort(rng.integers(0, planos, linhas))
+    momento_plano = np.array(momentos, dtype='datetime64[s]')[plano_idx]
+    data = momento_plano.astype('datetime64[D]').astype('datetime64[ns]')
+    retirada_offset = rng.integers(0, retiradas, linhas)
+    retirada = np.datetime64(inicio.date(), 'D').astype('datetime64[ns]') + retirada_offset.astype('timedelta64[D]')
+    duracao = rng.choice(np.asarray(duracoes, dtype=np.int8), linhas)
+
+    categoria_idx = rng.integers(0, categorias, linhas)
+    modelo_idx = (categoria_idx * 2 + rng.integers(0, 2, linhas)) % len(nomes_modelo)
+    pesos = 1.0 / np.arange(1, locadoras + 1)
+    locadora_idx = rng.choice(locadoras, size=linhas, p=pesos / pesos.sum())
+
+    preco_base = np.linspace(120, 900, categorias)[categoria_idx]
+    fator_locadora = np.linspace(0.85, 1.25, locadoras)[rng.permutation(locadoras)][locadora_idx]
+    ruido = rng.lognormal(0.0, 0.15, linhas)
+    preco = (preco_base * fator_locadora * ruido * (1 + 0.02 * retirada_offset)).astype(np.float32)
+
+    # --- Sujeira realista: categorias nulas/inválidas e locadoras nulas ---
+    categoria_codes = categoria_idx.copy()
+    sorteio = rng.random(linhas)
+    categoria_codes[sorteio < 0.02] = categorias          # '-'
+    categoria_codes[(sorteio >= 0.02) & (sorteio < 0.03)] = categorias + 1  # 'L+'
+    categoria_codes[(sorteio >= 0.03) & (sorteio < 0.06)] = -1
+    locadora_codes = locadora_idx.copy()
+    locadora_codes[rng.random(linhas) < 0.005] = -1
+
+    def categorica(codes, nomes):
+        return pd.Categorical.from_codes(codes, categories=nomes)
+
+    horas_unicas, hora_codes = np.unique([m.strftime('%H:%M:%S') for m in momentos], return_inverse=True)
+    df = pd.DataFrame({
+        'LOCALIDADE': categorica(plano_localidade[plano_idx], nomes_localidade),
+        'RETIRADA': retirada,
+        'DURAÇÃO': duracao,
+        'CATEGORIA': categorica(categoria_codes, nomes_categoria + CATEGORIAS_INVALIDAS),
+        'MODELO': categorica(modelo_idx, nomes_modelo),
+        'LOCADORA': categorica(locadora_codes, nomes_locadora),
+        'PREÇO': preco,
+        'CAMBIO': categorica(rng.integers(0, 2, linhas), ['Automático', 'Manual']),
+        'Locadora': categorica(locadora_idx, [f'{n} Rent a Car' if 'Rent a Car' not in n else n for n in nomes_locadora]),
+        'Plano': categorica(plano_idx, plano_nomes),
+        'Data': data,
+        'Hora': categorica(hora_codes[plano_idx], horas_unicas),
+        'OTA': categorica(np.zeros(linhas, dtype=np.int8), ['Rentcars']),
+    })
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera dados sintéticos de raspagem para benchmarks.")
+    parser.add_argument('--linhas', type=int, default=100_000)
+    parser.add_argument('--localidades', type=int, default=4)
+    parser.add_argument('--locadoras', type=int, default=11)
+    parser.add_argument('--categorias', type=int, default=8)
+    parser.add_argument('--planos', type=int, default=200)
+    parser.add_argument('--retiradas', type=int, default=21)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--saida', required=True, help="Caminho do arquivo .parquet de saída")
+    args = parser.parse_args(argv)
+
+    df = gerar_dados_sinteticos(args.linhas, args.localidades, args.locadoras, args.categorias,
+                                args.planos, args.retiradas, seed=args.seed)
+    df.to_parquet(args.saida, index=False)
+    print(f"{len(df)} linhas sintéticas gravadas em '{args.saida}'.")
+
+
+if __name__ == '__main__':
+    main()
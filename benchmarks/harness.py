@@ -0,0 +1,187 @@
+"""
+Harness de benchmarks do SEA-DASH.
+
+Para cada tamanho de base, gera (ou reaproveita) um parquet sintético e executa, em um
+subprocesso isolado, as etapas abaixo, reportando latência, pico de memória e tamanho
+do payload de cada uma:
+
+- leitura do parquet (`pd.read_parquet`);
+- importação de `app.py` apontando `SEA_DASH_DADOS` para o arquivo sintético;
+- `gerar_df_comparativo_robusto`;
+- cada callback pesado, via `/_dash-update-component` (mesmo caminho do navegador).
+
+O pico de memória por etapa vem do tracemalloc (alocações Python/NumPy/pandas; buffers do
+Arrow não entram); para a importação do app é reportado o pico de RSS do processo.
+
+Uso: python -m benchmarks --linhas 10000 100000 1000000 10000000 [--json resultados.json]
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+TAMANHOS_PADRAO = [10_000, 100_000, 1_000_000, 10_000_000]
+LINHAS_POR_PLANO = 640  # média observada em dados_consolidados.parquet
+
+
+def _cenarios(data_pesquisa):
+    """Callbacks medidos e os valores de Input/State enviados (carga inicial de cada página)."""
+    botoes = {f'btn-{b}-{p}.n_clicks': None for b in ('primeira', 'anterior', 'proxima', 'ultima') for p in ('geral', 'comp')}
+    return [
+        ('base', 'update_dynamic_table_geral', {**botoes, 'store-pagina-atual-geral.data': 1}),
+        ('comparativo', 'update_dynamic_table_comparativo', {**botoes, 'store-pagina-atual-comp.data': 1}),
+        ('posicionamento_loja', 'update_dynamic_posicionamento_loja', {}),
+        ('posicionamento_categoria', 'update_dynamic_posicionamento_categoria', {}),
+        ('big_picture', 'update_dashboard', {}),
+        ('movimentacao_horario', 'update_movimentacao_horario', {'filtro-data-horario.date': data_pesquisa}),
+    ]
+
+
+def _pico_rss_mb():
+    # ru_maxrss é em KiB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _medir_etapa(funcao, repeticoes, medir_memoria):
+    latencias = []
+    resultado = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    pico_mb = None
+    if medir_memoria:
+        tracemalloc.start()
+        funcao()
+        pico_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        tracemalloc.stop()
+    return {
+        'latencia_primeira_ms': round(latencias[0], 1),
+        'latencia_mediana_ms': round(statistics.median(latencias), 1),
+        'pico_memoria_mb': round(pico_mb, 1) if pico_mb is not None else None,
+    }, resultado
+
+
+def medir(arquivo, repeticoes=3, medir_memoria=True):
+    """Executa todas as etapas para `arquivo` no processo atual e retorna a lista de medições."""
+    import pandas as pd
+    import pyarrow.parquet as pq
+
+    resultados = []
+    linhas = pq.ParquetFile(arquivo).metadata.num_rows
+
+    metricas, _ = _medir_etapa(lambda: pd.read_parquet(arquivo), 1, medir_memoria)
+    resultados.append({'etapa': 'leitura_parquet', **metricas})
+
+    os.environ['SEA_DASH_DADOS'] = arquivo
+    os.environ['SEA_DASH_BACKGROUND_CALLBACKS'] = '0'
+    # Sem as visões padrão guardadas: cada repetição mede o cálculo do callback, não o cache
+    os.environ['SEA_DASH_AQUECIMENTO'] = '0'
+    os.environ.pop('DATABASE_URL', None)
+    inicio = time.perf_counter()
+    import app as app_module
+    resultados.append({'etapa': 'import_app', 'latencia_primeira_ms': round((time.perf_counter() - inicio) * 1000, 1),
+                       'pico_rss_mb': round(_pico_rss_mb(), 1)})
+
+    def comparativo():
+        df_lower = pd.read_parquet(arquivo)
+        df_lower.columns = [str(col).lower() for col in df_lower.columns]
+        return app_module.gerar_df_comparativo_robusto(df_lower)
+    metricas, df_comp = _medir_etapa(comparativo, repeticoes, medir_memoria)
+    resultados.append({'etapa': 'gerar_df_comparativo_robusto', **metricas, 'linhas_saida': len(df_comp)})
+
+    from benchmarks.cliente_dash import chamar_callback
+    cliente = app_module.server.test_client()
+    data_pesquisa = str(pq.read_table(arquivo, columns=['Data']).column('Data').to_pandas().max().date())
+    for nome_cenario, callback, valores in _cenarios(data_pesquisa):
+        def executar():
+            return chamar_callback(cliente, app_module.app, callback, valores)
+        metricas, resposta = _medir_etapa(executar, repeticoes, medir_memoria)
+        resultados.append({'etapa': f'callback:{nome_cenario}', **metricas,
+                           'status': resposta.status_code, 'payload_bytes': len(resposta.get_data())})
+
+    for resultado in resultados:
+        resultado['linhas'] = linhas
+    return resultados
+
+
+def _arquivo_sintetico(linhas, args):
+    planos = args.planos or max(20, linhas // LINHAS_POR_PLANO)
+    nome = f'sinteticos_{linhas}_{args.localidades}loc_{args.locadoras}lcd_{args.categorias}cat_{planos}pl_{args.retiradas}ret.parquet'
+    caminho = os.path.join(args.diretorio, nome)
+    if not os.path.exists(caminho):
+        from benchmarks.gerador import gerar_dados_sinteticos
+        print(f"Gerando {linhas} linhas sintéticas em '{caminho}'...", file=sys.stderr)
+        df = gerar_dados_sinteticos(linhas, args.localidades, args.locadoras, args.categorias, planos, args.retiradas)
+        df.to_parquet(caminho, index=False)
+    return caminho
+
+
+def _imprimir_tabela(resultados):
+    cabecalho = f"{'linhas':>10}  {'etapa':<38}{'1ª (ms)':>11}{'mediana (ms)':>14}{'pico (MB)':>11}{'payload (KB)':>14}"
+    print(cabecalho)
+    print('-' * len(cabecalho))
+    for r in resultados:
+        pico = r.get('pico_memoria_mb', r.get('pico_rss_mb'))
+        payload = r.get('payload_bytes')
+        print(f"{r['linhas']:>10}  {r['etapa']:<38}{r['latencia_primeira_ms']:>11.1f}"
+              f"{r.get('latencia_mediana_ms', r['latencia_primeira_ms']):>14.1f}"
+              f"{(f'{pico:.1f}' if pico is not None else '-'):>11}"
+              f"{(f'{payload / 1024:.1f}' if payload is not None else '-'):>14}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do SEA-DASH com dados sintéticos.")
+    parser.add_argument('--linhas', type=int, nargs='+', default=TAMANHOS_PADRAO)
+    parser.add_argument('--localidades', type=int, default=4)
+    parser.add_argument('--locadoras', type=int, default=11)
+    parser.add_argument('--categorias', type=int, default=8)
+    parser.add_argument('--planos', type=int, default=None, help="Padrão: ~640 linhas por plano, como na base real")
+    parser.add_argument('--retiradas', type=int, default=21)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--sem-memoria', action='store_true', help="Não mede pico de memória (tracemalloc)")
+    parser.add_argument('--diretorio', default=os.path.join(tempfile.gettempdir(), 'sea-dash-benchmarks'))
+    parser.add_argument('--json', help="Grava os resultados brutos neste arquivo")
+    parser.add_argument('--medir', help=argparse.SUPPRESS)
+    parser.add_argument('--saida-medicao', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.medir:
+        # Modo filho: mede um único arquivo e grava o resultado em JSON
+        resultados = medir(args.medir, args.repeticoes, not args.sem_memoria)
+        with open(args.saida_medicao, 'w') as f:
+            json.dump(resultados, f)
+        return
+
+    os.makedirs(args.diretorio, exist_ok=True)
+    raiz_repositorio = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    todos = []
+    for linhas in args.linhas:
+        arquivo = _arquivo_sintetico(linhas, args)
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as saida:
+            caminho_saida = saida.name
+        comando = [sys.executable, '-m', 'benchmarks.harness', '--medir', arquivo, '--saida-medicao', caminho_saida,
+                   '--repeticoes', str(args.repeticoes)] + (['--sem-memoria'] if args.sem_memoria else [])
+        # Cada tamanho roda em um processo novo para que memória e caches não se misturem
+        processo = subprocess.run(comando, cwd=raiz_repositorio, stdout=subprocess.DEVNULL)
+        if processo.returncode != 0:
+            print(f"ERRO: medição de {linhas} linhas falhou (código {processo.returncode}).", file=sys.stderr)
+            continue
+        with open(caminho_saida) as f:
+            todos.extend(json.load(f))
+        os.remove(caminho_saida)
+
+    _imprimir_tabela(todos)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(todos, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Configuração de produção do gunicorn para o SEA-DASH (carregada pelo CMD do Dockerfile).
+
+- `preload_app`: o app (e o snapshot de dados, com SEA_DASH_PRECARREGAR_DADOS=1) é montado uma
+  única vez no processo mestre; os workers herdam os DataFrames por copy-on-write.
+- Workers `gthread`: cada worker atende várias requisições ao mesmo tempo, então um callback
+  de posicionamento lento não trava os demais usuários. O snapshot de dados é imutável (cada
+  derivado é construído uma vez, sob lock) e o banco de dados usa um pool de conexões por worker.
+- Dimensionamento: um worker por núcleo (o pandas segura o GIL em boa parte do trabalho, então
+  processos é que escalam com a CPU) e SEA_DASH_THREADS threads por worker para as esperas de
+  E/S (banco, leitura do parquet, DuckDB). Memória: cada worker soma as próprias cópias do que
+  for modificado; com pouca RAM reduza SEA_DASH_WORKERS e aumente as threads.
+
+Variáveis de ambiente:
+    SEA_DASH_WORKERS   workers (padrão: núcleos disponíveis, até SEA_DASH_MAX_WORKERS=8)
+    SEA_DASH_THREADS   threads por worker (padrão: 4); SEA_DASH_DB_POOL_MAX deve ser >= este valor
+    SEA_DASH_TIMEOUT   segundos até um worker travado ser reiniciado (padrão: 120)
+    PORT               porta (padrão: 7860, a do Hugging Face)
+"""
+import os
+
+
+def _nucleos():
+    try:
+        return len(os.sched_getaffinity(0))  # respeita o limite de CPUs do contêiner
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '7860')}"
+worker_class = 'gthread'
+workers = int(os.environ.get('SEA_DASH_WORKERS', min(_nucleos(), int(os.environ.get('SEA_DASH_MAX_WORKERS', 8)))))
+threads = int(os.environ.get('SEA_DASH_THREADS', 4))
+preload_app = True
+timeout = int(os.environ.get('SEA_DASH_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    # Verifica o esquema do PostgreSQL uma única vez por deploy, no mestre e antes dos workers
+    # (o app não o faz mais na importação; a conexão usada aqui é fechada em pre_fork)
+    import app
+    if app.DATABASE_URL:
+        app.initialize_database()
+
+
+def pre_fork(server, worker):
+    # O aquecimento em segundo plano termina antes do fork, e conexões abertas no mestre durante a
+    # pré-carga (PostgreSQL, DuckDB) não podem ir para os workers
+    import app
+    app.aguardar_aquecimento()
+    app.fechar_conexoes()
@@ -0,0 +1,271 @@
+"""
+Ingestão de raspagens no repositório parquet do SEA-DASH.
+
+O repositório é um diretório de arquivos parquet com o esquema limpo que o app espera
+(`ESQUEMA`): basta apontar `SEA_DASH_DADOS` para ele. Cada raspagem nova entra como um
+lote (`lote-*.parquet`), de modo que o custo da ingestão é proporcional ao lote e não à base:
+
+- os nomes das colunas são normalizados (maiúsculas, a primeira repetida vence, como no app)
+  e os tipos convertidos para o esquema; colunas obrigatórias ausentes abortam a ingestão;
+- linhas com a mesma CHAVE_DEDUPLICACAO são descartadas: dentro do lote fica a de menor preço,
+  e linhas que já existem no repositório não são regravadas (para a comparação só são lidas
+  as linhas do repositório com as LOCALIDADE e DATA do lote, filtradas por pushdown);
+- de tempos em tempos os arquivos (`compactado-*` e `lote-*`) são reescritos em um único
+  `compactado-*.parquet` ordenado por PLANO e LOCALIDADE, em row groups com estatísticas de
+  min/max, para que o pushdown do app descarte row groups inteiros.
+
+Arquivos temporários e a trava começam com '.', prefixo que o pyarrow e o app ignoram (nem
+contam para a versão dos dados), e só ganham o nome final (os.replace) depois de gravados por
+completo. A compactação não é atômica: entre o novo arquivo entrar e os antigos saírem, um
+leitor vê linhas em dobro (o app recarrega de novo quando os antigos somem). Por isso ela
+refaz a deduplicação pela CHAVE_DEDUPLICACAO, e uma compactação interrompida nessa janela é
+corrigida pela próxima.
+
+Uso:
+    python ingestao.py ingerir dados/ raspagem_2025-10-17.parquet [mais.csv ...] [--compactar-a-partir 20]
+    python ingestao.py compactar dados/ [--linhas-por-grupo 65536]
+"""
+import argparse
+import fcntl
+import glob
+import os
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# --- ESQUEMA LIMPO DO REPOSITÓRIO ---
+# Textos como dicionário (viram categorias no pandas, como no arquivo consolidado) com índices
+# int32 em todos os arquivos, para que lotes e arquivo compactado tenham exatamente o mesmo esquema.
+TEXTO = pa.dictionary(pa.int32(), pa.string())
+ESQUEMA = pa.schema([
+    ('LOCALIDADE', TEXTO),
+    ('RETIRADA', pa.timestamp('ns')),
+    ('DURAÇÃO', pa.int8()),
+    ('CATEGORIA', TEXTO),
+    ('MODELO', TEXTO),
+    ('LOCADORA', TEXTO),
+    ('PREÇO', pa.float32()),
+    ('CAMBIO', TEXTO),
+    ('PLANO', TEXTO),
+    ('DATA', pa.timestamp('ns')),
+    ('HORA', TEXTO),
+    ('OTA', TEXTO),
+])
+CHAVE_DEDUPLICACAO = ['LOCALIDADE', 'RETIRADA', 'DURAÇÃO', 'LOCADORA', 'CATEGORIA', 'MODELO', 'DATA', 'HORA']
+COLUNAS_OBRIGATORIAS = CHAVE_DEDUPLICACAO + ['PREÇO', 'PLANO']
+ORDEM_COMPACTACAO = ['PLANO', 'LOCALIDADE']
+LINHAS_POR_GRUPO = 65_536
+COMPACTAR_A_PARTIR = 20  # lotes pendentes que disparam a compactação automática
+
+PREFIXO_LOTE = 'lote-'
+PREFIXO_COMPACTADO = 'compactado-'
+
+
+class ErroIngestao(Exception):
+    """Lote que não pode ser convertido para o esquema do repositório."""
+
+
+# --- LEITURA E NORMALIZAÇÃO DOS LOTES ---
+def ler_lote(caminho):
+    if caminho.lower().endswith('.csv'):
+        return pd.read_csv(caminho)
+    return pd.read_parquet(caminho)
+
+
+def normalizar_lote(df, origem=''):
+    """Converte um lote de raspagem para o ESQUEMA (mesma normalização de nomes do app)."""
+    df = df.copy()
+    df.columns = [str(col).strip().upper() for col in df.columns]
+    df = df.loc[:, ~df.columns.duplicated()]
+
+    faltando = [col for col in COLUNAS_OBRIGATORIAS if col not in df.columns]
+    if faltando:
+        raise ErroIngestao(f"Lote '{origem}' sem as colunas obrigatórias: {', '.join(faltando)}.")
+    ignoradas = [col for col in df.columns if col not in ESQUEMA.names]
+    if ignoradas:
+        print(f"AVISO: colunas ignoradas em '{origem}': {', '.join(ignoradas)}.")
+
+    colunas = {}
+    for campo in ESQUEMA:
+        if campo.name not in df.columns:
+            colunas[campo.name] = pd.Series(pd.NA, index=df.index, dtype='string')
+        elif pa.types.is_timestamp(campo.type):
+            colunas[campo.name] = pd.to_datetime(df[campo.name], errors='coerce').astype('datetime64[ns]')
+        elif campo.name == 'DURAÇÃO':
+            colunas[campo.name] = pd.to_numeric(df[campo.name], errors='coerce').round().astype('Int8')
+        elif campo.name == 'PREÇO':
+            colunas[campo.name] = pd.to_numeric(df[campo.name], errors='coerce').astype('float32')
+        else:
+            colunas[campo.name] = df[campo.name].astype('string')
+    return pd.DataFrame(colunas)
+
+
+def dicionarios_ordenados(tabela):
+    """
+    Reescreve as colunas de texto com o dicionário em ordem alfabética, como no arquivo consolidado:
+    as categorias do pandas seguem essa ordem, e as matrizes e gráficos do app ordenam por elas.
+    """
+    colunas = []
+    for campo, coluna in zip(tabela.schema, tabela.columns):
+        if pa.types.is_dictionary(campo.type):
+            textos = coluna.cast(pa.string()).combine_chunks()
+            valores = pc.unique(textos).drop_null()
+            valores = valores.take(pc.array_sort_indices(valores))
+            coluna = pa.DictionaryArray.from_arrays(pc.index_in(textos, value_set=valores).cast(pa.int32()), valores)
+        colunas.append(coluna)
+    return pa.Table.from_arrays(colunas, schema=tabela.schema)
+
+
+def para_tabela(df):
+    return dicionarios_ordenados(pa.Table.from_pandas(df, schema=ESQUEMA, preserve_index=False))
+
+
+# --- REPOSITÓRIO ---
+def arquivos(diretorio, prefixo):
+    return sorted(glob.glob(os.path.join(diretorio, f'{prefixo}*.parquet')))
+
+
+def abrir_repositorio(diretorio):
+    caminhos = arquivos(diretorio, PREFIXO_COMPACTADO) + arquivos(diretorio, PREFIXO_LOTE)
+    return ds.dataset(caminhos, schema=ESQUEMA, format='parquet') if caminhos else None
+
+
+def gravar_atomico(tabela, caminho, **opcoes):
+    """Grava em um arquivo oculto e só então renomeia, para que o app nunca leia um parquet pela metade."""
+    temporario = os.path.join(os.path.dirname(caminho), '.' + os.path.basename(caminho) + '.tmp')
+    pq.write_table(tabela, temporario, write_statistics=True, **opcoes)
+    os.replace(temporario, caminho)
+
+
+@contextmanager
+def trava(diretorio):
+    """Uma ingestão/compactação por vez no mesmo repositório."""
+    # Sem truncar: reabrir a trava não pode mudar o mtime, senão toda execução muda a versão dos dados
+    descritor = os.open(os.path.join(diretorio, '.trava'), os.O_CREAT | os.O_RDWR)
+    try:
+        fcntl.flock(descritor, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(descritor, fcntl.LOCK_UN)
+        os.close(descritor)
+
+
+def deduplicar(df, repositorio):
+    """
+    Remove as repetições da CHAVE_DEDUPLICACAO: dentro do lote fica a oferta de menor preço;
+    chaves que já estão no repositório ficam como estão. Só as LOCALIDADE/DATA do lote são lidas.
+    """
+    df = df.sort_values('PREÇO', kind='stable').drop_duplicates(CHAVE_DEDUPLICACAO).sort_index()
+    if repositorio is None or df.empty:
+        return df
+    filtro = (ds.field('LOCALIDADE').isin(df['LOCALIDADE'].dropna().unique().tolist())
+              & ds.field('DATA').isin(pa.array(df['DATA'].dropna().unique(), pa.timestamp('ns'))))
+    existentes = repositorio.to_table(columns=CHAVE_DEDUPLICACAO, filter=filtro).to_pandas()
+    if existentes.empty:
+        return df
+    existentes = existentes.astype({col: 'string' for col in CHAVE_DEDUPLICACAO if col in ESQUEMA.names
+                                    and pa.types.is_dictionary(ESQUEMA.field(col).type)})
+    existentes['DURAÇÃO'] = existentes['DURAÇÃO'].astype('Int8')
+    marcados = df.merge(existentes.drop_duplicates(), on=CHAVE_DEDUPLICACAO, how='left', indicator=True)
+    return df[(marcados['_merge'] == 'left_only').to_numpy()]
+
+
+def ingerir(diretorio, caminhos, compactar_a_partir=COMPACTAR_A_PARTIR):
+    os.makedirs(diretorio, exist_ok=True)
+    with trava(diretorio):
+        for caminho in caminhos:
+            inicio = time.perf_counter()
+            lote = normalizar_lote(ler_lote(caminho), caminho)
+            novos = deduplicar(lote, abrir_repositorio(diretorio))
+            if novos.empty:
+                print(f"'{caminho}': {len(lote)} linhas, nenhuma nova.")
+                continue
+            nome = f"{PREFIXO_LOTE}{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+            gravar_atomico(para_tabela(novos), os.path.join(diretorio, nome))
+            print(f"'{caminho}': {len(lote)} linhas, {len(novos)} novas gravadas em '{nome}' "
+                  f"({time.perf_counter() - inicio:.2f}s).")
+        pendentes = len(arquivos(diretorio, PREFIXO_LOTE))
+        if compactar_a_partir and pendentes >= compactar_a_partir:
+            _compactar(diretorio)
+
+
+# --- COMPACTAÇÃO ---
+def primeiras_ocorrencias(tabela):
+    """
+    Remove as repetições da CHAVE_DEDUPLICACAO mantendo a primeira ocorrência (compactados antes
+    dos lotes, lotes em ordem de chegada): a mesma regra da ingestão, em que o que já está no
+    repositório não é substituído. Só há repetições se uma compactação anterior foi interrompida.
+    """
+    chaves = pa.table({col: tabela.column(col).cast(pa.string()) if pa.types.is_dictionary(ESQUEMA.field(col).type)
+                       else tabela.column(col) for col in CHAVE_DEDUPLICACAO})
+    chaves = chaves.append_column('_linha', pa.array(np.arange(tabela.num_rows, dtype='int64')))
+    primeiras = chaves.group_by(CHAVE_DEDUPLICACAO, use_threads=False).aggregate([('_linha', 'min')]).column('_linha_min')
+    if len(primeiras) == tabela.num_rows:
+        return tabela
+    return tabela.take(np.sort(primeiras.to_numpy()))
+
+
+def _compactar(diretorio, linhas_por_grupo=LINHAS_POR_GRUPO):
+    antigos = arquivos(diretorio, PREFIXO_COMPACTADO) + arquivos(diretorio, PREFIXO_LOTE)
+    if not antigos:
+        print("Repositório vazio; nada a compactar.")
+        return
+    inicio = time.perf_counter()
+    tabela = ds.dataset(antigos, schema=ESQUEMA, format='parquet').to_table()
+    linhas_lidas = tabela.num_rows
+    tabela = primeiras_ocorrencias(tabela)
+    # O sort do pyarrow não ordena dicionários: a ordem vem dos textos (sort estável, mantém a ordem de chegada)
+    chaves = pa.table({col: tabela.column(col).cast(pa.string()) for col in ORDEM_COMPACTACAO})
+    indices = pc.sort_indices(chaves, sort_keys=[(col, 'ascending') for col in ORDEM_COMPACTACAO])
+    tabela = dicionarios_ordenados(tabela.take(indices))
+
+    nome = f"{PREFIXO_COMPACTADO}{time.strftime('%Y%m%d-%H%M%S')}.parquet"
+    gravar_atomico(tabela, os.path.join(diretorio, nome), row_group_size=linhas_por_grupo)
+    for caminho in antigos:
+        if os.path.basename(caminho) != nome:
+            os.remove(caminho)
+    grupos = pq.ParquetFile(os.path.join(diretorio, nome)).metadata.num_row_groups
+    print(f"Compactação concluída: {len(antigos)} arquivos -> '{nome}' ({tabela.num_rows} linhas, "
+          f"{grupos} row groups, {time.perf_counter() - inicio:.2f}s).")
+    if tabela.num_rows < linhas_lidas:
+        print(f"AVISO: {linhas_lidas - tabela.num_rows} linhas repetidas removidas (compactação anterior interrompida?).")
+
+
+def compactar(diretorio, linhas_por_grupo=LINHAS_POR_GRUPO):
+    with trava(diretorio):
+        _compactar(diretorio, linhas_por_grupo)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingestão de raspagens no repositório parquet do SEA-DASH.")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    p_ingerir = comandos.add_parser('ingerir', help="Acrescenta lotes (.parquet ou .csv) ao repositório")
+    p_ingerir.add_argument('diretorio')
+    p_ingerir.add_argument('lotes', nargs='+')
+    p_ingerir.add_argument('--compactar-a-partir', type=int, default=COMPACTAR_A_PARTIR,
+                           help="Compacta quando houver ao menos N lotes pendentes (0 desliga)")
+    p_compactar = comandos.add_parser('compactar', help="Reescreve o repositório em um arquivo ordenado por PLANO/LOCALIDADE")
+    p_compactar.add_argument('diretorio')
+    p_compactar.add_argument('--linhas-por-grupo', type=int, default=LINHAS_POR_GRUPO)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.comando == 'ingerir':
+            ingerir(args.diretorio, args.lotes, args.compactar_a_partir)
+        else:
+            compactar(args.diretorio, args.linhas_por_grupo)
+    except ErroIngestao as erro:
+        print(f"ERRO: {erro}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+"""
+Configuração comum dos testes: o app é importado com o arquivo de dados do repositório, sem
+banco de dados, sem callbacks em segundo plano e sem aquecimento (as variáveis são lidas na
+importação do módulo).
+"""
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+os.environ.pop('DATABASE_URL', None)
+os.environ['SEA_DASH_BACKGROUND_CALLBACKS'] = '0'
+os.environ['SEA_DASH_AQUECIMENTO'] = '0'
+os.environ['SEA_DASH_BACKEND'] = 'pandas'
+os.environ.setdefault('SEA_DASH_PRECARREGAR_DADOS', '0')
@@ -0,0 +1,106 @@
+"""Pares de planos do comparativo e equivalência dos backends pandas e DuckDB no parquet do repositório."""
+import pandas as pd
+import pytest
+
+import app
+
+
+@pytest.fixture(scope='module')
+def dados():
+    return app.obter_dados()
+
+
+# --- PARES DE PLANOS DO COMPARATIVO ---
+PLANOS = {'GIG10': ['g4', 'g3', 'g2', 'g1'], 'POA10': ['p2', 'p1']}
+
+
+def test_par_padrao_e_o_mais_recente_contra_o_anterior():
+    assert app.pares_de_planos(PLANOS) == {'GIG10': ('g4', ['g3']), 'POA10': ('p2', ['p1'])}
+
+
+def test_par_com_plano_atual_so_na_localidade_do_plano():
+    assert app.pares_de_planos(PLANOS, 'g3', app.REFERENCIA_ANTERIOR) == {'GIG10': ('g3', ['g2'])}
+    assert app.pares_de_planos(PLANOS, 'g1', app.REFERENCIA_ANTERIOR) == {}
+
+
+def test_referencia_media_e_plano_de_outra_localidade(monkeypatch):
+    monkeypatch.setattr(app, 'PLANOS_LINHA_DE_BASE', 2)
+    assert app.pares_de_planos(PLANOS, 'g4', app.REFERENCIA_MEDIA) == {'GIG10': ('g4', ['g3', 'g2'])}
+    assert app.pares_de_planos(PLANOS, 'g4', 'p1') == {}
+    assert app.pares_de_planos(PLANOS, 'g4', 'g4') == {}
+
+
+def test_visao_comparativo_valida_os_planos(dados):
+    planos = dados.planos_por_localidade()
+    (_, planos_a), (_, planos_b) = list(planos.items())[:2]
+    assert dados.visao_comparativo() == 'comparativo'
+    assert dados.visao_comparativo(planos_a[0], planos_a[1]) == f'comparativo:{planos_a[0]}:{planos_a[1]}'
+    with pytest.raises(ValueError, match='localidades diferentes'):
+        dados.visao_comparativo(planos_a[0], planos_b[0])
+    with pytest.raises(ValueError, match='próprio plano'):
+        dados.visao_comparativo(planos_a[0], planos_a[0])
+    with pytest.raises(ValueError, match='desconhecido'):
+        dados.visao_comparativo('nao-existe')
+
+
+def test_visao_comparativo_de_um_par_compara_so_a_localidade_do_par(dados):
+    localidade, planos = next(iter(dados.planos_por_localidade().items()))
+    comparativo = dados.comparativo(dados.visao_comparativo(planos[0], planos[1]))
+    assert set(comparativo['LOCALIDADE'].astype(str)) <= {localidade}
+    assert set(comparativo['PLANO ATUAL'].astype(str)) <= {planos[0]}
+    assert set(comparativo['PLANO ANTERIOR'].astype(str)) <= {planos[1]}
+
+
+# --- EQUIVALÊNCIA ENTRE OS BACKENDS ---
+@pytest.fixture(scope='module')
+def backends(dados):
+    pytest.importorskip('duckdb')
+    return app.ConsultasPandas(dados), app.ConsultasDuckDB(dados)
+
+
+def casos_de_filtro(dados):
+    return [
+        ('base', {}),
+        ('base', {'PLANO': [dados.plano_recente]}),
+        ('base', {'CATEGORIA': ['B', 'D'], 'DURAÇÃO': ['2']}),
+        ('base', {app.FILTRO_BUSCA: ['localiza']}),
+        ('comparativo', {}),
+        ('comparativo', {'LOCALIDADE': ['GIG10', 'POA10']}),
+    ]
+
+
+def test_backends_contam_e_paginam_igual(dados, backends):
+    pandas_, duckdb_ = backends
+    for visao, filtros in casos_de_filtro(dados):
+        assert pandas_.contar(visao, filtros) == duckdb_.contar(visao, filtros), (visao, filtros)
+        for ordenacao in (None, {'coluna': pandas_.colunas(visao)[-1], 'crescente': False}):
+            # Mesmo texto exibido; no comparativo o pandas mantém categorias e o DuckDB devolve strings
+            pd.testing.assert_frame_equal(pandas_.pagina(visao, filtros, 20, 70, ordenacao).reset_index(drop=True),
+                                          duckdb_.pagina(visao, filtros, 20, 70, ordenacao).reset_index(drop=True),
+                                          check_dtype=False, check_categorical=False)
+
+
+def test_backends_oferecem_as_mesmas_opcoes_de_filtro(dados, backends):
+    pandas_, duckdb_ = backends
+    for visao, filtros in casos_de_filtro(dados):
+        colunas = pandas_.colunas(visao)
+        assert pandas_.opcoes_filtros(visao, colunas, filtros) == duckdb_.opcoes_filtros(visao, colunas, filtros), (visao, filtros)
+
+
+def test_backends_exportam_as_mesmas_linhas(dados, backends):
+    pandas_, duckdb_ = backends
+    filtros = {'LOCALIDADE': ['GIG10']}
+    linhas_pandas = sum(len(bloco) for bloco in pandas_.blocos('base', filtros, 50_000))
+    linhas_duckdb = sum(len(bloco) for bloco in duckdb_.blocos('base', filtros, 50_000))
+    assert linhas_pandas == linhas_duckdb == pandas_.contar('base', filtros)
+
+
+def test_backends_calculam_os_mesmos_menores_precos(dados, backends):
+    pandas_, duckdb_ = backends
+    colunas = ['VENCEDORA', 'MENOR_PRECO', 'MENOR_PRECO_FOCO', 'SEGUNDO_MENOR_PRECO']
+    for filtros in ({}, {'LOCALIDADE': ['GIG10']}):
+        total_pandas, agregado_pandas = pandas_.menores_precos(filtros, ['CATEGORIA', 'RETIRADA'])
+        total_duckdb, agregado_duckdb = duckdb_.menores_precos(filtros, ['CATEGORIA', 'RETIRADA'])
+        assert total_pandas == total_duckdb
+        pd.testing.assert_frame_equal(agregado_pandas[colunas].reset_index(drop=True),
+                                      agregado_duckdb[colunas].reset_index(drop=True), check_dtype=False)